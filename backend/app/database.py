@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 from dotenv import load_dotenv
+from .services.metrics import record_query
 
 load_dotenv()
 
@@ -19,6 +21,22 @@ if "sqlite" in DATABASE_URL:
 engine = create_engine(
     DATABASE_URL, connect_args=connect_args
 )
+
+# Nombre et durée des requêtes SQL, par requête HTTP (exposés sur /metrics)
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_query(statement, time.perf_counter() - conn.info["query_start"].pop())
+
+@event.listens_for(engine, "handle_error")
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
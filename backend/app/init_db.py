@@ -1,47 +1,79 @@
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from .models import Competency, AssessmentCriterion, ExamBlock
-import json
+from sqlalchemy import func
+from .models import Competency, AssessmentCriterion, ExamBlock, SeedVersion, SyncCounter, Evaluation
+from .services.referentiel_service import APP_DIR, REFERENTIEL_FILES, build_index
+import hashlib
 import os
 
-def load_ref(db: Session, filename: str, block_enum: ExamBlock):
-    json_path = os.path.join(os.path.dirname(__file__), filename)
-    if not os.path.exists(json_path):
-        print(f"File not found: {json_path}")
+def referentiel_checksum() -> str:
+    """Empreinte des fichiers JSON du référentiel"""
+    digest = hashlib.sha256()
+    for filename in REFERENTIEL_FILES.values():
+        with open(os.path.join(APP_DIR, filename), 'rb') as f:
+            digest.update(filename.encode())
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def seed_referentiel(db: Session):
+    """
+    Charge les compétences et critères du référentiel.
+    Ignoré si les fichiers JSON n'ont pas changé depuis le dernier chargement ;
+    sinon, seules les entrées manquantes sont insérées, en une seule transaction.
+    """
+    checksum = referentiel_checksum()
+    seed = db.query(SeedVersion).filter(SeedVersion.name == "referentiel").first()
+    if seed and seed.checksum == checksum:
         return
 
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        
-        for domain in data:
-            for i, skill in enumerate(domain['children']):
-                # Vérifier si existe déjà
-                existing = db.query(Competency).filter(Competency.description == skill['description']).first()
-                if not existing:
-                    try:
-                        comp = Competency(
-                            code=f"{domain['code']}_{i+1}", 
-                            description=skill['description'],
-                            block=block_enum
-                        )
-                        db.add(comp)
-                        db.commit() # Pour avoir l'ID
-                        
-                        # Ajouter les critères
-                        for criteria_desc in skill['criteria']:
-                            crit = AssessmentCriterion(
-                                competency_id=comp.id,
-                                description=criteria_desc
-                            )
-                            db.add(crit)
-                    except Exception as e:
-                        print(f"Error adding competency {skill['description']}: {e}")
-                        db.rollback()
-    
-    db.commit()
+    index = build_index()
+    try:
+        existing = {c.code: c for c in db.query(Competency).all()}
+        existing_by_description = {c.description: c for c in existing.values()}
+
+        new_competencies = []
+        for code, ref in index.competencies.items():
+            if code not in existing and ref["description"] not in existing_by_description:
+                competency = Competency(code=code, description=ref["description"], block=ExamBlock(ref["block"]))
+                new_competencies.append(competency)
+                existing[code] = competency
+        db.add_all(new_competencies)
+        db.flush()  # Attribue les ids des nouvelles compétences
+
+        known_criteria = {(c.competency_id, c.description) for c in db.query(AssessmentCriterion).all()}
+        new_criteria = []
+        for code, ref in index.competencies.items():
+            competency = existing.get(code) or existing_by_description[ref["description"]]
+            for description in ref["criteria"]:
+                if (competency.id, description) not in known_criteria:
+                    new_criteria.append(AssessmentCriterion(competency_id=competency.id, description=description))
+                    known_criteria.add((competency.id, description))
+        db.add_all(new_criteria)
+
+        if seed is None:
+            seed = SeedVersion(name="referentiel")
+            db.add(seed)
+        seed.checksum = checksum
+        db.commit()
+        print(f"✅ Référentiel chargé : {len(new_competencies)} compétences, {len(new_criteria)} critères ajoutés")
+    except IntegrityError:
+        # Un autre worker a fait le chargement en même temps
+        db.rollback()
+
+def seed_sync_counter(db: Session, name: str = "evaluations"):
+    """Crée le compteur de versions de synchro, repris de la plus haute version déjà attribuée"""
+    if db.query(SyncCounter).filter(SyncCounter.name == name).first():
+        return
+    try:
+        db.add(SyncCounter(name=name, value=db.query(func.max(Evaluation.version)).scalar() or 0))
+        db.commit()
+    except IntegrityError:
+        # Un autre worker l'a créé en même temps
+        db.rollback()
 
 def init_db(db: Session):
-    load_ref(db, "referentiel_e6.json", ExamBlock.E6)
-    load_ref(db, "referentiel_e4.json", ExamBlock.E4)
+    seed_referentiel(db)
+    seed_sync_counter(db)
 
     # Création Professeur par défaut
     from .models import User
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, Enum, Date, Float, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, Enum, Date, Float, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -91,6 +91,31 @@ class AssessmentCriterion(Base):
 
     competency = relationship("Competency", back_populates="criteria")
 
+class SeedVersion(Base):
+    """Empreinte des données de référence déjà chargées (ex: référentiel), pour ne pas les recharger à chaque démarrage"""
+    __tablename__ = "seed_versions"
+    name = Column(String, primary_key=True)
+    checksum = Column(String(64))
+    applied_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class SyncCounter(Base):
+    """Compteur de versions de synchro (ex: 'evaluations'), incrémenté atomiquement par chaque synchro qui modifie des données"""
+    __tablename__ = "sync_counters"
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class RefineSession(Base):
+    """Session de retouche d'un document généré (/api/refine/sessions) : document courant et historique du chat"""
+    __tablename__ = "refine_sessions"
+    id = Column(String(36), primary_key=True) # uuid4, seule clé d'accès à la session
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    track = Column(String, default="NDRC")
+    content = Column(Text) # Document après la dernière retouche
+    history = Column(Text, default="[]") # JSON [{role: 'user'|'model', text}]
+    turns = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+
 # === Cœur du Suivi (Le "Fond") ===
 class EvaluationSession(Base):
     """Une session d'examen globale (ex: CCF 2026)"""
@@ -117,25 +142,67 @@ class Evaluation(Base):
     
     global_comment = Column(Text)
     
+    # Synchronisation avec le front (JSON plat {id, studentId, domainId, date, ratings, comment})
+    client_id = Column(String, unique=True, index=True, nullable=True) # Clé d'idempotence (id généré par le front)
+    domain_id = Column(String, nullable=True) # 'E6_DISTRIBUTION', 'E4_NEGOCIER', etc.
+    content_hash = Column(String(64), nullable=True) # Pour ignorer les envois inchangés
+    version = Column(Integer, index=True, nullable=True) # Version de synchro (delta sync)
+    client_type = Column(String(20), nullable=True) # Type envoyé par le front ('continuous', 'final', 'E4', 'E6'), renvoyé tel quel
+    deleted_at = Column(DateTime(timezone=True), nullable=True) # Suppression côté front : la ligne reste pour propager la suppression
+    
     # Relations
     student = relationship("User", foreign_keys=[student_id], back_populates="evaluations_received")
     evaluator = relationship("User", foreign_keys=[evaluator_id], back_populates="evaluations_given")
     scores = relationship("EvaluationScore", back_populates="evaluation")
     attachments = relationship("EvaluationAttachment", back_populates="evaluation")
 
+    # Historique par élève trié par date (vues élève / comparaison)
+    __table_args__ = (
+        Index('ix_evaluations_student_date', 'student_id', 'date'),
+    )
+
 class EvaluationScore(Base):
     """Le score précis pour un critère donné lors d'une évaluation"""
     __tablename__ = "evaluation_scores"
     id = Column(Integer, primary_key=True, index=True)
-    evaluation_id = Column(Integer, ForeignKey("evaluations.id"))
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id"), index=True)
     criterion_id = Column(Integer, ForeignKey("assessment_criteria.id"))
     
     score = Column(Float)
     comment = Column(String, nullable=True)
+    skill_key = Column(String, nullable=True) # Clé de compétence côté front (ex: "101")
+    rating = Column(String(4), nullable=True) # 'TI', 'I', 'S', 'TS'
 
     evaluation = relationship("Evaluation", back_populates="scores")
     criterion = relationship("AssessmentCriterion")
 
+class CompetencyRollup(Base):
+    """
+    Maîtrise pré-calculée par élève x compétence x session (tableaux de bord).
+    Maintenue par analytics_service.refresh_rollups à chaque écriture de scores.
+    """
+    __tablename__ = "competency_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("users.id"))
+    competency_id = Column(Integer, ForeignKey("competencies.id"))
+    session_id = Column(Integer, ForeignKey("evaluation_sessions.id"), nullable=True) # NULL = hors session
+
+    weighted_sum = Column(Float, default=0.0) # Somme des score x poids du critère
+    weight_total = Column(Float, default=0.0)
+    score_count = Column(Integer, default=0)
+    average = Column(Float, nullable=True)
+    level = Column(String(4), nullable=True) # 'TI', 'I', 'S', 'TS'
+    last_evaluated = Column(Date, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    competency = relationship("Competency")
+
+    __table_args__ = (
+        Index('ix_competency_rollups_student_session', 'student_id', 'session_id'),
+        # Une seule ligne par clé, session NULL comprise (NULL != NULL dans un index unique simple)
+        Index('ux_competency_rollups_key', 'student_id', 'competency_id', func.coalesce(session_id, 0), unique=True),
+    )
+
 class EvaluationAttachment(Base):
     """Preuves (documents, vidéos) liées à une évaluation"""
     __tablename__ = "evaluation_attachments"
@@ -148,6 +215,6 @@ class EvaluationAttachment(Base):
     evaluation = relationship("Evaluation", back_populates="attachments")
 
 # Import tracking models (deadlines, submissions)
-from .models_tracking import Deadline, Submission
+from .models_tracking import Deadline, Submission, SubmissionExtract
 # Import class models
 from .models_classes import Class, ClassStudent
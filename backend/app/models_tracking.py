@@ -54,3 +54,21 @@ class Submission(Base):
 
     def __repr__(self):
         return f"<Submission(id={self.id}, student_id={self.student_id}, deadline_id={self.deadline_id}, status='{self.status}')>"
+
+
+class SubmissionExtract(Base):
+    """Texte extrait et aperçu d'un fichier déposé (rempli en arrière-plan)"""
+    __tablename__ = "submission_extracts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_url = Column(String(500), unique=True, index=True, nullable=False)  # Même valeur que Submission.file_url
+    status = Column(String(20), default='pending')  # 'pending', 'done', 'failed', 'unsupported'
+    text = Column(Text)  # Texte brut complet
+    preview = Column(Text)  # Texte de la première page
+    page_count = Column(Integer)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<SubmissionExtract(id={self.id}, file_url='{self.file_url}', status='{self.status}')>"
@@ -7,6 +7,7 @@ from ..models import User
 from ..models_classes import Class, ClassStudent
 from ..schemas_tracking import TeacherCreate, TeacherResponse, ActivateTeacher, DashboardStats
 from ..auth import get_current_user, get_password_hash
+from ..services.knowledge_service import get_knowledge_base
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -159,3 +160,11 @@ def get_global_stats(
         average_grade=float(avg_grade) if avg_grade else None,
         late_submissions=late_submissions
     )
+
+
+@router.post("/knowledge/reindex")
+def reindex_knowledge(admin: User = Depends(require_admin)):
+    """Ré-indexer tout de suite les documents de knowledge/ (admin uniquement)"""
+    knowledge_base = get_knowledge_base()
+    stats = knowledge_base.refresh()
+    return {**stats, "active": knowledge_base.index.generation if knowledge_base.index else None}
@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Literal, Optional
+from datetime import date
+from ..database import get_db
+from ..models import User, ExamBlock, Class
+from ..auth import get_current_user
+from ..services import analytics_service
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+
+def check_student_access(db: Session, current_user: User, student_id: int):
+    """
+    Élèves : uniquement leurs propres statistiques. Professeurs : leurs élèves
+    (analytics_service.accessible_students), 404 pour les autres. Admins : tous.
+    """
+    if current_user.role == "student" and current_user.id == student_id:
+        return
+    require_teacher(current_user)
+    students = analytics_service.accessible_students(db, current_user)
+    if students is not None and students.filter(User.id == student_id).first() is None:
+        raise HTTPException(status_code=404, detail="Élève introuvable")
+
+
+def require_teacher(current_user: User):
+    if current_user.role not in ["teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Accès non autorisé")
+
+
+def scoped_student_ids(db: Session, current_user: User, class_id: Optional[int] = None, class_name: Optional[str] = None):
+    """
+    Sous-requête des élèves visibles par le professeur, restreinte à une classe si demandée
+    (None : admin sans filtre de classe). Classe d'un autre professeur : 404.
+    """
+    require_teacher(current_user)
+    if class_id is not None and current_user.role != "admin":
+        if db.query(Class.id).filter(Class.id == class_id, Class.teacher_id == current_user.id).first() is None:
+            raise HTTPException(status_code=404, detail="Classe introuvable")
+    students = analytics_service.accessible_students(db, current_user)
+    if class_id is None and not class_name:
+        return students
+    members = analytics_service.class_student_ids(db, class_id=class_id, class_name=class_name)
+    if students is None:
+        return members
+    return students.filter(User.id.in_(members))
+
+
+@router.get("/students/{student_id}/progress")
+def student_progress(
+    student_id: int,
+    block: Optional[ExamBlock] = None,
+    period: Literal["day", "week", "month"] = "week",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Courbes de progression par compétence (moyenne par période + moyenne cumulée)"""
+    check_student_access(db, current_user, student_id)
+    return analytics_service.progress_curve(db, student_id, block=block, period=period)
+
+
+@router.get("/competencies")
+def competency_averages(
+    student_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    class_name: Optional[str] = None,
+    block: Optional[ExamBlock] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    session_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Moyennes pondérées par Competency.code, pour un élève, une classe ou tous les élèves"""
+    if student_id is not None:
+        check_student_access(db, current_user, student_id)
+        student_ids = [student_id]
+    else:
+        student_ids = scoped_student_ids(db, current_user, class_id=class_id, class_name=class_name)
+    return analytics_service.competency_averages(
+        db, student_ids=student_ids, block=block, date_from=date_from, date_to=date_to, session_id=session_id
+    )
+
+
+@router.get("/classes/heatmap")
+def class_heatmap(
+    class_id: Optional[int] = None,
+    class_name: Optional[str] = None,
+    block: Optional[ExamBlock] = None,
+    session_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Carte de chaleur élèves x compétences d'une classe"""
+    if class_id is None and not class_name:
+        require_teacher(current_user)
+        raise HTTPException(status_code=400, detail="class_id ou class_name requis")
+    student_ids = scoped_student_ids(db, current_user, class_id=class_id, class_name=class_name)
+    return analytics_service.class_heatmap(db, student_ids, block=block, session_id=session_id)
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User, Evaluation, StudentSubmission, EvaluationScore, EvaluationAttachment
 from app.auth import verify_password, create_access_token
+from app.services import analytics_service
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -145,6 +146,8 @@ def purge_class_students(class_code: str, db: Session = Depends(get_db)):
             db.query(EvaluationAttachment).filter(EvaluationAttachment.evaluation_id.in_(eval_ids)).delete(synchronize_session=False)
             db.query(Evaluation).filter(Evaluation.id.in_(eval_ids)).delete(synchronize_session=False)
 
+        analytics_service.refresh_rollups(db, student_ids)
+
         # 3. Finally delete the Users
         db.query(User).filter(
             User.role == "student", 
@@ -173,6 +176,7 @@ def nuclear_cleanup(db: Session = Depends(get_db)):
         db.query(EvaluationAttachment).filter(EvaluationAttachment.evaluation_id.in_(eval_ids)).delete(synchronize_session=False)
         db.query(Evaluation).filter(Evaluation.id.in_(eval_ids)).delete(synchronize_session=False)
 
+    analytics_service.refresh_rollups(db, student_ids)
     db.query(User).filter(User.role == "student").delete(synchronize_session=False)
     db.commit()
 
@@ -0,0 +1,373 @@
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, or_, and_, update
+from pydantic import BaseModel
+from typing import List, Dict, Literal, Optional, Union
+from datetime import date, datetime, timezone
+from ..database import get_db
+from ..models import (
+    User, Evaluation, EvaluationScore, AssessmentCriterion, Competency,
+    EvaluationType, SituationType, ExamBlock, ClassStudent, SyncCounter
+)
+from ..auth import get_current_user
+from ..init_db import seed_sync_counter
+from .analytics import require_teacher
+from ..services import analytics_service
+from ..services.referentiel_service import competency_code
+import base64
+import hashlib
+import json
+
+router = APIRouter()
+
+# Échelle de notation du front (voir frontend/app/types.ts)
+RATING_SCORES = {"TI": 5.0, "I": 10.0, "S": 15.0, "TS": 20.0}
+
+MAX_SYNC_BATCH = 2000
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+SYNC_COUNTER = "evaluations"
+
+# --- Schemas ---
+
+class EvaluationSyncItem(BaseModel):
+    """Évaluation au format plat du front"""
+    id: Union[int, str]
+    studentId: int
+    date: str
+    ratings: Dict[str, str] = {}
+    comment: Optional[str] = None
+    globalComment: Optional[str] = None
+    type: Optional[str] = None  # 'continuous' (défaut), 'final', 'E4', 'E6'
+    domainId: Optional[str] = None
+
+class EvaluationSyncRequest(BaseModel):
+    evaluations: List[EvaluationSyncItem] = []
+    deleted: List[Union[int, str]] = []  # ids front des évaluations supprimées
+    since_version: Optional[int] = None  # Dernière version connue du client
+
+# --- Mapping front <-> relationnel ---
+
+def parse_date(value: str) -> Optional[date]:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).date()
+    except ValueError:
+        return None
+
+def item_hash(item: EvaluationSyncItem) -> str:
+    payload = json.dumps(item.dict(), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def front_id(evaluation: Evaluation) -> Union[int, str]:
+    if evaluation.client_id and evaluation.client_id.isdigit():
+        return int(evaluation.client_id)
+    return evaluation.client_id or evaluation.id
+
+def to_front(evaluation: Evaluation) -> dict:
+    """Évaluation relationnelle -> JSON plat attendu par le front"""
+    return {
+        "id": front_id(evaluation),
+        "studentId": evaluation.student_id,
+        "domainId": evaluation.domain_id,
+        "date": evaluation.date.isoformat() if evaluation.date else None,
+        "ratings": {s.skill_key: s.rating for s in evaluation.scores if s.skill_key},
+        "comment": evaluation.global_comment,
+        # Type d'origine ; lignes antérieures à client_type : déduit de type
+        "type": evaluation.client_type or ("final" if evaluation.type == EvaluationType.CERTIFICATIVE else "continuous"),
+        "version": evaluation.version,
+    }
+
+def score_detail(score: EvaluationScore) -> dict:
+    criterion = score.criterion
+    return {
+        "skill_key": score.skill_key,
+        "rating": score.rating,
+        "score": score.score,
+        "criterion_id": score.criterion_id,
+        "criterion": criterion.description if criterion else None,
+        "competency": criterion.competency.code if criterion and criterion.competency else None,
+    }
+
+def encode_cursor(evaluation: Evaluation) -> str:
+    raw = f"{evaluation.date.isoformat()}|{evaluation.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw_date, raw_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(raw_date), int(raw_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+def lock_version(db: Session) -> int:
+    """
+    Version courante, compteur verrouillé jusqu'au commit (SELECT ... FOR UPDATE) :
+    les synchros qui écrivent passent une à une, leurs versions sont commitées dans l'ordre.
+    """
+    counter = db.query(SyncCounter).filter(SyncCounter.name == SYNC_COUNTER).with_for_update().first()
+    if counter is None:
+        seed_sync_counter(db, SYNC_COUNTER)
+        counter = db.query(SyncCounter).filter(SyncCounter.name == SYNC_COUNTER).with_for_update().first()
+    return counter.value
+
+def next_version(db: Session) -> int:
+    """Incrément atomique en base (pas de max(version) + 1 : deux synchros obtiendraient la même version)"""
+    return db.execute(
+        update(SyncCounter).where(SyncCounter.name == SYNC_COUNTER)
+        .values(value=SyncCounter.value + 1).returning(SyncCounter.value)
+    ).scalar_one()
+
+def build_scores(item: EvaluationSyncItem, criteria: Dict[str, int]) -> List[EvaluationScore]:
+    scores = []
+    for skill_key, rating in item.ratings.items():
+        code = competency_code(item.domainId, skill_key)
+        scores.append(EvaluationScore(
+            criterion_id=criteria.get(code) if code else None,
+            skill_key=skill_key,
+            rating=rating,
+            score=RATING_SCORES.get(rating)
+        ))
+    return scores
+
+# --- Routes ---
+
+@router.get("/evaluations")
+def get_all_evaluations(
+    response: Response,
+    student_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    class_name: Optional[str] = None,
+    block: Optional[ExamBlock] = None,
+    situation: Optional[SituationType] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    since_version: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Literal["rows", "columnar"] = "rows",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Historique des évaluations, trié par (date, id), avec filtres et pagination par curseur.
+    - format=rows : liste au format du front + détail des scores ; curseur suivant dans X-Next-Cursor
+    - format=columnar : une liste par champ (réponse compacte pour les grandes classes)
+    Scores, critères et compétences sont chargés par selectinload : 4 requêtes quel que soit le volume.
+    """
+    query = db.query(Evaluation).filter(Evaluation.client_id.isnot(None), Evaluation.deleted_at.is_(None))
+    # Un élève ne voit que ses propres évaluations, un professeur celles de ses élèves
+    if current_user.role == "student":
+        student_id = current_user.id
+    else:
+        require_teacher(current_user)
+        students = analytics_service.accessible_students(db, current_user)
+        if students is not None:
+            query = query.filter(Evaluation.student_id.in_(students))
+    if student_id is not None:
+        query = query.filter(Evaluation.student_id == student_id)
+    if class_id is not None:
+        query = query.filter(Evaluation.student_id.in_(
+            db.query(ClassStudent.student_id).filter(ClassStudent.class_id == class_id)
+        ))
+    if class_name:
+        query = query.filter(Evaluation.student_id.in_(
+            db.query(User.id).filter(User.class_name == class_name)
+        ))
+    if block is not None:
+        # Les domaines du front sont préfixés par l'épreuve ('E4_NEGOCIER', 'E6_VD', ...)
+        query = query.filter(Evaluation.domain_id.like(f"{block.value}\\_%", escape="\\"))
+    if situation is not None:
+        query = query.filter(Evaluation.situation == situation)
+    if date_from:
+        query = query.filter(Evaluation.date >= date_from)
+    if date_to:
+        query = query.filter(Evaluation.date <= date_to)
+    if since_version is not None:
+        query = query.filter(Evaluation.version > since_version)
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Evaluation.date > cursor_date,
+            and_(Evaluation.date == cursor_date, Evaluation.id > cursor_id)
+        ))
+
+    evaluations = query.options(
+        selectinload(Evaluation.scores)
+        .selectinload(EvaluationScore.criterion)
+        .selectinload(AssessmentCriterion.competency)
+    ).order_by(Evaluation.date, Evaluation.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(evaluations) > limit:
+        evaluations = evaluations[:limit]
+        next_cursor = encode_cursor(evaluations[-1])
+
+    if format == "columnar":
+        columns = {key: [] for key in ("id", "studentId", "domainId", "date", "type", "comment", "version")}
+        scores = {key: [] for key in ("row", "skill_key", "rating", "score", "competency")}
+        for row, evaluation in enumerate(evaluations):
+            for key, value in to_front(evaluation).items():
+                if key in columns:
+                    columns[key].append(value)
+            for score in evaluation.scores:
+                detail = score_detail(score)
+                scores["row"].append(row)
+                for key in ("skill_key", "rating", "score", "competency"):
+                    scores[key].append(detail[key])
+        return {"count": len(evaluations), "columns": columns, "scores": scores, "next_cursor": next_cursor}
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [
+        {**to_front(evaluation), "scores": [score_detail(score) for score in evaluation.scores]}
+        for evaluation in evaluations
+    ]
+
+@router.post("/sync/evaluations")
+def sync_evaluations(
+    payload: Union[EvaluationSyncRequest, List[EvaluationSyncItem]] = Body(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upsert groupé des évaluations du front (une transaction par synchro).
+    - Idempotent : l'id front sert de clé (Evaluation.client_id), un envoi inchangé est ignoré.
+    - Delta : le client n'envoie que ses modifications et reçoit celles faites
+      ailleurs depuis `since_version`, suppressions comprises ({"id", "deleted": true}).
+    - Réservé aux professeurs/admins, limité aux élèves du professeur.
+    Accepte aussi l'ancien format (liste brute).
+    """
+    require_teacher(current_user)
+    if isinstance(payload, list):
+        payload = EvaluationSyncRequest(evaluations=payload)
+
+    if len(payload.evaluations) > MAX_SYNC_BATCH:
+        raise HTTPException(status_code=413, detail=f"Maximum {MAX_SYNC_BATCH} évaluations par synchro")
+
+    # Dernier envoi gagnant si le même id apparaît plusieurs fois
+    items = {str(item.id): item for item in payload.evaluations}
+    deleted_keys = [str(d) for d in payload.deleted if str(d) not in items]
+
+    student_ids = {item.studentId for item in items.values()}
+    if student_ids:
+        known = {student_id for (student_id,) in db.query(User.id).filter(User.id.in_(student_ids), User.role == "student")}
+        unknown = sorted(student_ids - known)
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Élèves inconnus : {unknown}")
+
+    # Pas de date de repli : une date illisible inventerait un historique
+    dates = {client_id: parse_date(item.date) for client_id, item in items.items()}
+    invalid_dates = sorted(client_id for client_id, value in dates.items() if value is None)
+    if invalid_dates:
+        raise HTTPException(status_code=422, detail=f"Dates invalides pour les évaluations : {invalid_dates}")
+
+    # Verrou pris avant de lire l'existant : deux synchros du même envoi ne créent pas deux fois la ligne
+    current_version = lock_version(db) if items or deleted_keys else db.query(SyncCounter.value).filter(SyncCounter.name == SYNC_COUNTER).scalar() or 0
+
+    existing = {}
+    if items:
+        rows = db.query(Evaluation).filter(Evaluation.client_id.in_(list(items.keys()))).all()
+        existing = {e.client_id: e for e in rows}
+    deleted_rows = []
+    if deleted_keys:
+        deleted_rows = db.query(Evaluation).filter(
+            Evaluation.client_id.in_(deleted_keys), Evaluation.deleted_at.is_(None)
+        ).all()
+
+    # Élèves touchés par l'envoi : ceux des évaluations reçues et ceux des lignes modifiées ou supprimées
+    touched = student_ids | {e.student_id for e in existing.values()} | {e.student_id for e in deleted_rows}
+    touched.discard(None)
+    students = analytics_service.accessible_students(db, current_user)
+    if students is not None and touched:
+        allowed = {student_id for (student_id,) in students.filter(User.id.in_(touched))}
+        if touched - allowed:
+            raise HTTPException(status_code=403, detail="Évaluations d'élèves hors de vos classes")
+
+    pending = []
+    for client_id, item in items.items():
+        content_hash = item_hash(item)
+        evaluation = existing.get(client_id)
+        if evaluation is not None and evaluation.deleted_at is None and evaluation.content_hash == content_hash:
+            continue
+        pending.append((client_id, item, evaluation, content_hash))
+    unchanged = len(items) - len(pending)
+
+    version = next_version(db) if pending or deleted_rows else current_version
+    criteria = analytics_service.criterion_ids_by_code(db) if pending else {}
+    evaluator_id = current_user.id
+
+    created, updated = 0, 0
+    affected_students = set()  # Élèves dont les rollups de compétences sont à recalculer
+    changed_ids = []
+    new_scores = []
+    for client_id, item, evaluation, content_hash in pending:
+        if evaluation is None:
+            evaluation = Evaluation(client_id=client_id, evaluator_id=evaluator_id, situation=SituationType.OTHER)
+            db.add(evaluation)
+            created += 1
+        else:
+            changed_ids.append(evaluation.id)
+            affected_students.add(evaluation.student_id)
+            updated += 1
+        affected_students.add(item.studentId)
+
+        evaluation.student_id = item.studentId
+        evaluation.domain_id = item.domainId
+        evaluation.date = dates[client_id]
+        evaluation.type = EvaluationType.FORMATIVE if item.type in (None, "continuous") else EvaluationType.CERTIFICATIVE
+        evaluation.client_type = item.type
+        evaluation.global_comment = item.comment if item.comment is not None else item.globalComment
+        evaluation.content_hash = content_hash
+        evaluation.deleted_at = None  # Renvoyée après suppression : la ligne revit
+        evaluation.version = version
+        new_scores.append((evaluation, build_scores(item, criteria)))
+
+    # Suppressions : la ligne reste (tombstone versionné) pour que les autres appareils la retirent
+    deleted_at = datetime.now(timezone.utc)
+    for evaluation in deleted_rows:
+        changed_ids.append(evaluation.id)
+        affected_students.add(evaluation.student_id)
+        evaluation.deleted_at = deleted_at
+        evaluation.content_hash = None
+        evaluation.version = version
+
+    # Scores des évaluations modifiées ou supprimées : suppression groupée puis réinsertion
+    if changed_ids:
+        db.query(EvaluationScore).filter(EvaluationScore.evaluation_id.in_(changed_ids)).delete(synchronize_session=False)
+
+    db.flush()  # Attribue les ids des nouvelles évaluations
+    for evaluation, scores in new_scores:
+        for score in scores:
+            score.evaluation_id = evaluation.id
+        db.add_all(scores)
+
+    if affected_students:
+        db.flush()
+        analytics_service.refresh_rollups(db, affected_students)
+    db.commit()
+
+    changes = []
+    if payload.since_version is not None:
+        # Modifications faites ailleurs (autres appareils) depuis la dernière synchro du client
+        query = db.query(Evaluation).options(selectinload(Evaluation.scores)).filter(
+            Evaluation.version > payload.since_version,
+            Evaluation.client_id.isnot(None),
+            ~Evaluation.client_id.in_(list(items.keys()) + deleted_keys)
+        )
+        if students is not None:
+            query = query.filter(Evaluation.student_id.in_(students))
+        changes = [
+            {"id": front_id(e), "deleted": True, "version": e.version} if e.deleted_at else to_front(e)
+            for e in query.all()
+        ]
+
+    return {
+        "status": "synced",
+        "count": len(items),
+        "created": created,
+        "updated": updated,
+        "unchanged": unchanged,
+        "deleted": len(deleted_rows),
+        "version": version,
+        "changes": changes
+    }
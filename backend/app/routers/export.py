@@ -1,40 +1,78 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy.orm import Session, selectinload
+from fastapi.concurrency import run_in_threadpool
 from app.database import get_db
+from app.auth import get_current_user
 from app.models import Evaluation, User
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional
+from urllib.parse import quote
 import io
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from fastapi.responses import StreamingResponse
+import re
+import unicodedata
+from app.services import render_service, export_cache
+from app.services.referentiel_service import get_index
+from app.routers.analytics import check_student_access
 
 router = APIRouter()
 
+# Bump when create_docx / create_pdf change so cached exports are invalidated
+RENDER_VERSION = "3"
+
+def attachment_header(filename: str) -> str:
+    """Content-Disposition for a name typed by users: ASCII fallback plus the UTF-8 name (RFC 6266)"""
+    ascii_name = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode()
+    fallback = re.sub(r'[^A-Za-z0-9._-]+', "_", ascii_name)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
 class ExportRequest(BaseModel):
     student_id: int
     exam_type: str # 'E4' or 'E6'
     evaluations: List[dict] # Simplified for now, passing raw data from frontend
 
+MEDIA_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+
+def bilan_items(evaluations: List[dict]) -> List[dict]:
+    """Front-format evaluations -> render items with skill names resolved from the referentiel"""
+    index = get_index()
+    items = []
+    for item in sorted(evaluations, key=lambda e: str(e.get('date') or '')):
+        domain_id = item.get('domainId')
+        items.append({
+            'date': item.get('date') or 'Date inconnue',
+            'domain': index.domain_label(domain_id) if domain_id else None,
+            'ratings': {index.skill_label(domain_id, key): rating for key, rating in (item.get('ratings') or {}).items()},
+            'comment': item.get('comment') or 'Aucun commentaire.',
+        })
+    return items
+
+def bilan_student_name(db: Session, student_id: int) -> str:
+    student = db.query(User).filter(User.id == student_id).first()
+    return student.name if student else "Etudiant"
+
 # --- DOCX Generation ---
-def create_docx(student_name: str, exam_type: str, data: List[dict]):
+# create_docx / create_pdf run in the render process pool: plain arguments in, bytes out.
+# python-docx and ReportLab are imported there, on first use, to keep app startup fast.
+def create_docx(student_name: str, exam_type: str, data: List[dict]) -> bytes:
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
     document = Document()
     
     # Title
     title = document.add_heading(f'Bilan {exam_type} - {student_name}', 0)
     title.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
-    document.add_paragraph(f'Généré le {data[0].get("date", "Date inconnue")}')
+    document.add_paragraph(f'Généré le {data[0].get("date", "Date inconnue")}' if data else 'Aucune évaluation.')
 
     # Content
     for item in data:
         document.add_heading(f"Évaluation du {item.get('date')}", level=1)
+        if item.get('domain'):
+            document.add_paragraph(item['domain'])
         p = document.add_paragraph()
         p.add_run("Compétences évaluées :").bold = True
         
@@ -47,7 +85,7 @@ def create_docx(student_name: str, exam_type: str, data: List[dict]):
         if 'ratings' in item:
             for skill_id, rating in item['ratings'].items():
                 row_cells = table.add_row().cells
-                row_cells[0].text = skill_id # In real app, map ID to Name
+                row_cells[0].text = skill_id
                 row_cells[1].text = rating
         
         document.add_paragraph().add_run("Commentaire :").bold = True
@@ -56,21 +94,29 @@ def create_docx(student_name: str, exam_type: str, data: List[dict]):
 
     file_stream = io.BytesIO()
     document.save(file_stream)
-    file_stream.seek(0)
-    return file_stream
+    return file_stream.getvalue()
 
 # --- PDF Generation ---
-def create_pdf(student_name: str, exam_type: str, data: List[dict]):
+def create_pdf(student_name: str, exam_type: str, data: List[dict]) -> bytes:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet
+    from xml.sax.saxutils import escape
+
     file_stream = io.BytesIO()
     doc = SimpleDocTemplate(file_stream, pagesize=letter)
     elements = []
     
     styles = getSampleStyleSheet()
-    elements.append(Paragraph(f"Bilan {exam_type} - {student_name}", styles['Title']))
+    # Paragraph interprète un balisage XML : les textes saisis (nom, commentaires) sont échappés
+    elements.append(Paragraph(f"Bilan {exam_type} - {escape(student_name or '')}", styles['Title']))
     elements.append(Spacer(1, 12))
 
     for item in data:
-        elements.append(Paragraph(f"Évaluation du {item.get('date', '')}", styles['Heading2']))
+        elements.append(Paragraph(f"Évaluation du {escape(str(item.get('date') or ''))}", styles['Heading2']))
+        if item.get('domain'):
+            elements.append(Paragraph(escape(item['domain']), styles['Normal']))
         
         # Table Data
         table_data = [['Compétence', 'Note']]
@@ -92,33 +138,91 @@ def create_pdf(student_name: str, exam_type: str, data: List[dict]):
         elements.append(Spacer(1, 12))
         
         elements.append(Paragraph("<b>Commentaire:</b>", styles['Normal']))
-        elements.append(Paragraph(item.get('comment', 'Aucun commentaire.'), styles['Normal']))
+        comment = item.get('comment') or 'Aucun commentaire.'
+        elements.append(Paragraph(escape(comment).replace('\n', '<br/>'), styles['Normal']))
         elements.append(Spacer(1, 24))
 
     doc.build(elements)
-    file_stream.seek(0)
-    return file_stream
+    return file_stream.getvalue()
 
 @router.post("/export/docx")
-def export_docx(request: ExportRequest, db: Session = Depends(get_db)):
-    student = db.query(User).filter(User.id == request.student_id).first()
-    student_name = student.name if student else "Etudiant"
-    
-    stream = create_docx(student_name, request.exam_type, request.evaluations)
+async def export_docx(request: ExportRequest, db: Session = Depends(get_db), if_none_match: Optional[str] = Header(None)):
+    student_name = await run_in_threadpool(bilan_student_name, db, request.student_id)
     
     headers = {
-        'Content-Disposition': f'attachment; filename="Bilan_{request.exam_type}_{student_name}.docx"'
+        'Content-Disposition': attachment_header(f"Bilan_{request.exam_type}_{student_name}.docx")
     }
-    return StreamingResponse(stream, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", headers=headers)
+    # The student name comes from the DB, so it is part of the key
+    return await export_cache.cached_response(
+        export_cache.cache_key("bilan", request.dict(), student_name, RENDER_VERSION, "docx"),
+        if_none_match,
+        lambda: render_service.render(create_docx, student_name, request.exam_type, bilan_items(request.evaluations)),
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        headers=headers
+    )
 
 @router.post("/export/pdf")
-def export_pdf(request: ExportRequest, db: Session = Depends(get_db)):
-    student = db.query(User).filter(User.id == request.student_id).first()
-    student_name = student.name if student else "Etudiant"
-    
-    stream = create_pdf(student_name, request.exam_type, request.evaluations)
+async def export_pdf(request: ExportRequest, db: Session = Depends(get_db), if_none_match: Optional[str] = Header(None)):
+    student_name = await run_in_threadpool(bilan_student_name, db, request.student_id)
     
     headers = {
-        'Content-Disposition': f'attachment; filename="Bilan_{request.exam_type}_{student_name}.pdf"'
+        'Content-Disposition': attachment_header(f"Bilan_{request.exam_type}_{student_name}.pdf")
+    }
+    # The student name comes from the DB, so it is part of the key
+    return await export_cache.cached_response(
+        export_cache.cache_key("bilan", request.dict(), student_name, RENDER_VERSION, "pdf"),
+        if_none_match,
+        lambda: render_service.render(create_pdf, student_name, request.exam_type, bilan_items(request.evaluations)),
+        media_type="application/pdf",
+        headers=headers
+    )
+
+@router.get("/export/students/{student_id}/bilan")
+async def export_student_bilan(
+    student_id: int,
+    exam_type: Literal["E4", "E6"] = "E6",
+    format: Literal["docx", "pdf"] = "docx",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Bilan rendered from the evaluations stored server-side (no request body needed)"""
+    def load():
+        check_student_access(db, current_user, student_id)
+        student = db.query(User).filter(User.id == student_id).first()
+        if not student:
+            raise HTTPException(status_code=404, detail="Student not found")
+        evaluations = db.query(Evaluation).options(selectinload(Evaluation.scores)).filter(
+            Evaluation.student_id == student_id,
+            Evaluation.deleted_at.is_(None),
+            Evaluation.domain_id.like(f"{exam_type}\\_%", escape="\\")
+        ).order_by(Evaluation.date, Evaluation.id).all()
+        return student, evaluations
+
+    # Sync DB work off the event loop
+    student, evaluations = await run_in_threadpool(load)
+
+    data = [{
+        'date': e.date.isoformat() if e.date else None,
+        'domainId': e.domain_id,
+        'ratings': {s.skill_key: s.rating for s in e.scores if s.skill_key},
+        'comment': e.global_comment,
+    } for e in evaluations]
+
+    student_name = student.name or "Etudiant"
+    renderer = create_docx if format == "docx" else create_pdf
+    headers = {
+        'Content-Disposition': attachment_header(f"Bilan_{exam_type}_{student_name}.{format}")
     }
-    return StreamingResponse(stream, media_type="application/pdf", headers=headers)
+    # content_hash changes on every edit of an evaluation, so the key tracks the stored data
+    key = export_cache.cache_key(
+        "bilan-db", student_id, student_name, exam_type,
+        [(e.client_id, e.content_hash) for e in evaluations], RENDER_VERSION, format
+    )
+    return await export_cache.cached_response(
+        key,
+        if_none_match,
+        lambda: render_service.render(renderer, student_name, exam_type, bilan_items(data)),
+        media_type=MEDIA_TYPES[format],
+        headers=headers
+    )
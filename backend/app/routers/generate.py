@@ -1,149 +1,29 @@
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from sqlalchemy.orm import Session
 from ..database import get_db
 # Remove missing model import
 # from ..models import ActivityLog 
-from ..services.gemini_service import gemini_service
-from ..services.knowledge_service import knowledge_base
+from ..services.gemini_service import get_gemini_service, estimate_tokens, GeminiUnavailable
+from ..services.refine_sessions import RefineSessionStore
+from ..services.prompt_registry import get_registry
+from ..services.generation_queue import get_scheduler, GenerationRejected
+from ..auth import get_current_user, get_current_user_optional
+from ..models import User
+from ..services.knowledge_service import get_knowledge_base, format_passages
+from ..services.document_sections import (
+    split_sections, select_sections, outline, section_payload, parse_sections, patch_sections, unified_diff
+)
 import re
+import time
+from contextlib import contextmanager
 
 router = APIRouter()
 
-# Specialized prompt templates
-PROMPT_TEMPLATES = {
-    "jeu_de_role": """Tu es un expert créateur de sujets d'examen certifiants pour le BTS NDRC (Épreuve E4).
-Ta mission est de générer les DEUX fiches (Candidat et Jury) pour une simulation de Négociation Vente (Situation A).
-Le format doit être STRICTEMENT celui des documents officiels.
-
-CONTEXTE SOURCE : L'utilisateur va te fournir le contenu d'une fiche situation étudiant. Tu dois extraire les informations pertinentes (Produit, Cible, Objectifs) pour construire le sujet.
-
-RÈGLES D'OR :
-1. AUCUN RÉCIT, AUCUNE PHRASE D'INTRO.
-2. PAS DE MENTION "Voici le sujet".
-3. Le document doit commencer immédiatement par l'entête du BTS.
-4. Remplis la colonne de droite avec des informations réalistes et contextuelles basées sur la fiche étudiant fournie, MAIS en introduisant une variable/modification pour l'examen (le "paramètre modifié").
-5. Ne modifie PAS la colonne de gauche (Intitulés).
-
----
-
-**BTS NÉGOCIATION ET DIGITALISATION DE LA RELATION CLIENT**
-**SESSION 2025**
-**E4 – RELATION CLIENT ET NEGOCIATION VENTE**
-
-**FICHE SUJET – nom du CANDIDAT :**
-
-☑ Négociation Vente et Accompagnement de la Relation Client
-☐ Organisation et Animation d’un Évènement commercial
-
-| **MODIFICATION DES PARAMÈTRES À PRENDRE EN COMPTE PAR LE CANDIDAT POUR LA SIMULATION** | **DÉTAILS DE LA SITUATION** |
-| :--- | :--- |
-| **Objet de l’activité** | [Extrait de la fiche étudiant : Vente de...] |
-| **Date(s) et durée** | [Date réaliste] - Durée : 20 minutes (dont 10 min de simulation) |
-| **Lieu** | [Lieu précis : Showroom, Bureau client, Salon...] |
-| **Délimitation de Séquence(s)** | [Début : Accueil... Fin : Prise de congé] |
-| **Acteur(s) concernés (statut/rôle)** | [M./Mme X, fonction exacte (Jury)] |
-| **Historique de la relation / Relation à l’entreprise**<br>*(Objectif : définir à quel moment de cette relation vous intervenez)* | [Contexte basé sur la fiche : Client depuis X temps, ou Prospect qualifié...] |
-| **Objectifs de la simulation** | [Basé sur la fiche MAIS rendu plus difficile : Vendre le produit + Option, ou Faire signer le devis Z...] |
-| **Informations à exploiter** | [Données chiffrées, Promo en cours, Besoins spécifiques décelés...] |
-| **Contrainte(s)** | [Introduire une contrainte : Budget serré, Délai court, Décideur absent...] |
-
----
-
-**PAGE 2**
-
-**BTS NÉGOCIATION ET DIGITALISATION DE LA RELATION CLIENT**
-**SESSION 2025**
-**E4 – RELATION CLIENT ET NEGOCIATION VENTE**
-
-**FICHE SUJET – nom du JURY**
-
-☑ Négociation Vente et Accompagnement de la Relation Client
-☐ Organisation et Animation d’un Évènement commercial
-
-| **MODIFICATION DES PARAMÈTRES À PRENDRE EN COMPTE PAR LE JURY POUR LA SIMULATION** | **DÉTAILS POUR LE JURY** |
-| :--- | :--- |
-| **Objet de l’activité** | [Idem Candidat] |
-| **Identité** | [Nom, Âge, Profil psychologique (ex: Sceptique, Pressé, Chaleureux)] |
-| **Relation à l’entreprise** | [Ancienneté relationnelle, Niveau de satisfaction actuel] |
-| **Date de la rencontre** | [Date] |
-| **Lieu** | [Lieu] |
-| **Historique de la relation** | [Rappel du contexte] |
-| **Objectifs de la simulation** | [Ce que le vendeur doit réussir à faire] |
-| **Délimitation de Séquence (s)** | [Idem Candidat] |
-| **Motivations** | [Besoin de fiabilité, Gain de temps, Innovation, Image de marque...] |
-| **Freins** | [Peur du risque, Budget, Complexité de mise en œuvre...] |
-| **Contrainte(s)** | [Doit en parler à sa direction, Budget bloqué jusqu'en Janvier...] |
-| **Objections** | 1. [Objection majeure sur le prix]<br>2. [Objection technique ou concurrentielle]<br>3. [Objection de principe ou de délai] |
-
----
-""",
-    "jeu_de_role_evenement": """Tu es un expert créateur de sujets d'examen certifiants pour le BTS NDRC (Épreuve E4).
-Ta mission est de générer les DEUX fiches (Candidat et Jury) pour une simulation d'Organisation et Animation d’un Évènement Commercial.
-Le format doit être STRICTEMENT celui des documents officiels.
-
-RÈGLES D'OR :
-1. AUCUN RÉCIT, AUCUNE PHRASE D'INTRO.
-2. Le document doit commencer immédiatement par l'entête du BTS.
-3. Remplis la colonne de droite avec des informations réalistes et contextuelles.
-4. **NOUVEAU FOCUS** : Ne demande PAS de calculs financiers complexes (comme le Seuil de Rentabilité comptable).
-   - Centre la simulation sur la **BUDGÉTISATION**, la **NÉGOCIATION DU BUDGET** et le **ROI (Retour sur Investissement)**.
-   - Fournis des **Coûts Estimés** (Salle, Traiteur, Com) et des **Objectifs Commerciaux** (Nb de prospects, Panier moyen attendu, CA prévisionnel).
-   - L'enjeu est de justifier l'efficacité (atteinte des objectifs) et l'efficience (coût par contact) de l'événement.
-
----
-
-**BTS NÉGOCIATION ET DIGITALISATION DE LA RELATION CLIENT**
-**SESSION 2025**
-**E4 – RELATION CLIENT ET NEGOCIATION VENTE**
-
-**FICHE SUJET – nom du CANDIDAT :**
-
-☐ Négociation Vente et Accompagnement de la Relation Client
-☑ Organisation et Animation d’un Évènement commercial
-
-| **MODIFICATION DES PARAMÈTRES À PRENDRE EN COMPTE PAR LE CANDIDAT POUR LA SIMULATION** | **DÉTAILS DE LA SITUATION** |
-| :--- | :--- |
-| **Objet de l’activité** | [Type : Portes Ouvertes, Salon, Petit-déjeuner...] |
-| **Date(s) et durée** | [Dates] - Durée simulation : 20 min |
-| **Lieu** | [Lieu précis] |
-| **Délimitation de Séquence(s)** | [Focus : Validation du Budget et des Objectifs Commerciaux] |
-| **Acteur(s) concernés (statut/rôle)** | [M./Mme X, Manager (Jury)] |
-| **Contexte de l'évènement** | [Pourquoi cet évènement ? Lancement produit, fidélisation, reconquête...] |
-| **Objectifs de la simulation** | **1. Présenter le budget prévisionnel de l'opération.**<br>**2. Justifier la pertinence commerciale (ROI attendu, Cible).**<br>3. Convaincre le manager de valider l'enveloppe budgétaire. |
-| **Données Budget (ANNEXE)** | **Postes de Dépenses** : [Lister 3-4 postes clés : Location, Traiteur, Pub... avec montants]<br>**Total Budget demandé** : [Montant Total]<br>**Objectifs attendus** : [Ex: 50 participants, 20 ventes, CA de X€] |
-| **Contrainte(s)** | [Le manager trouve le budget Com trop élevé ou doute de l'impact sur les ventes.] |
-
----
-
-**PAGE 2**
-
-**BTS NÉGOCIATION ET DIGITALISATION DE LA RELATION CLIENT**
-**SESSION 2025**
-**E4 – RELATION CLIENT ET NEGOCIATION VENTE**
-
-**FICHE SUJET – nom du JURY**
-
-☐ Négociation Vente et Accompagnement de la Relation Client
-☑ Organisation et Animation d’un Évènement commercial
-
-| **MODIFICATION DES PARAMÈTRES À PRENDRE EN COMPTE PAR LE JURY POUR LA SIMULATION** | **DÉTAILS POUR LE JURY** |
-| :--- | :--- |
-| **Objet de l’activité** | [Idem Candidat] |
-| **Identité** | [Rôle : Manager vigilant sur l'utilisation des ressources] |
-| **Contexte Managérial** | [Attitude : Vous voulez investir, mais vous exigez des garanties de résultats. Vous challengez l'efficacité.] |
-| **Date de la rencontre** | [Date] |
-| **Objectifs de la simulation** | [Vérifier que le candidat maîtrise ses coûts et a des objectifs réalistes.] |
-| **Consignes de jeu** | - Questionnez le budget : "Pourquoi mettre autant dans le traiteur ?"<br>- Challengez le ROI : "Combien de ventes ferez-vous vraiment ?"<br>- Demandez le "Coût par contact" (Budget / Nb participants). |
-| **Éléments de réponse attendus** | - Le candidat doit défendre ses choix budgétaires par des bénéfices clients/image.<br>- Il doit connaître ses indicateurs : Coût Contact, CA prévisionnel.<br>- Il doit proposer un suivi post-événement (relance). |
-| **Objections** | 1. "2000€ pour une matinée, c'est cher payé. Garantissez-moi le retour sur investissement."<br>2. "Est-ce qu'on ne pourrait pas réduire la communication ?"<br>3. "Comment allez-vous mesurer l'efficacité de cet événement ?" |
-
----
-""",
-    # Other prompts can be added here
-}
+# Specialized prompt templates: versioned files in app/prompts/, validated once at startup
+PROMPT_TEMPLATES = {name: template.text for name, template in get_registry().templates.items()}
 
 class GenerateRequest(BaseModel):
     topic: str
@@ -152,32 +32,49 @@ class GenerateRequest(BaseModel):
     document_type: Literal["dossier_prof", "dossier_eleve", "jeu_de_role", "jeu_de_role_evenement", "student_fiche_e4"] = "jeu_de_role_evenement" # simplified types for now
     category: Optional[str] = "NDRC"
 
-PROMPT_TEMPLATES["student_fiche_e4"] = """Tu es un expert pédagogique en BTS NDRC.
-Ta mission est d'aider un étudiant à rédiger sa **Fiche d'Activité Professionnelle E4 (Négociation Vente)** à partir de ses notes en vrac.
-
-CONTEXTE DE L'ÉTUDIANT :
-{topic}
-
-CONSIGNES DE RÉDACTION :
-1. Rédige une fiche structurée, professionnelle et conforme aux attentes du jury.
-2. Structure attendue :
-   - **Titre de la fiche** : Clair et accrocheur.
-   - **Contexte** : Description de l'entreprise, de la cible et de l'offre.
-   - **Analyse de la situation** : Problématique client, besoins décelés.
-   - **Déroulement de la négociation** : Phases de découverte, argumentation, traitement des objections.
-   - **Résultats** : Quantitatifs (CA, Marge) et Qualitatifs (Satisfaction client, fidélisation).
-   - **Analyse Réflexive** : Ce qui a fonctionné, ce qui est à améliorer.
-
-Ton ton doit être professionnel, précis et valorisant pour l'étudiant. N'invente pas de chiffres s'ils ne sont pas fournis, mets des crochets [A COMPLÉTER] si nécessaire.
-"""
-
 class GenerateResponse(BaseModel):
     content: str
     document_type: str
     filename: Optional[str] = None
+    template_version: Optional[str] = None  # ex: "jeu_de_role@1-3fa2c1d0", à reprendre dans les exports
+
+def gemini_unavailable(error: GeminiUnavailable) -> HTTPException:
+    """Upstream down or circuit open: fail fast with 503 instead of a generic 500"""
+    print(f"❌ Gemini unavailable: {error}")
+    return HTTPException(
+        status_code=503,
+        detail="Le service de génération est momentanément indisponible, réessayez dans quelques instants.",
+        headers={"Retry-After": str(max(1, int(error.retry_after)))}
+    )
+
+def generation_client_key(request: Request, user: Optional[User] = Depends(get_current_user_optional)) -> str:
+    """Fair-queue key: the logged-in teacher, else the client address"""
+    if user is not None:
+        return f"user:{user.id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def generation_rejected(error: GenerationRejected) -> HTTPException:
+    """429 with the wait estimate; X-Queue-Position is the place the request would have had"""
+    headers = {"Retry-After": str(max(1, int(error.retry_after)))}
+    if error.position is not None:
+        headers["X-Queue-Position"] = str(error.position)
+    return HTTPException(status_code=429, detail=str(error), headers=headers)
+
+@contextmanager
+def generation_slot(client_key: str, response: Response):
+    """Waits for a turn in the fair queue; the wait is reported in X-Queue-Wait"""
+    started = time.monotonic()
+    with get_scheduler().slot(client_key):
+        response.headers["X-Queue-Wait"] = f"{time.monotonic() - started:.2f}"
+        yield
+
+@router.get("/generation/queue")
+def generation_queue_status(client_key: str = Depends(generation_client_key)):
+    """Queue state, with the position of each of the caller's pending generations"""
+    return get_scheduler().status(client_key)
 
 @router.post("/course", response_model=GenerateResponse)
-async def generate_document(request: GenerateRequest, db: Session = Depends(get_db)):
+def generate_document(request: GenerateRequest, response: Response, db: Session = Depends(get_db), client_key: str = Depends(generation_client_key)):
     """
     Generates a specific type of pedagogical document based on the selected BTS track.
     Currently focused on E4 scenario generation.
@@ -189,12 +86,11 @@ async def generate_document(request: GenerateRequest, db: Session = Depends(get_
         # Determine track, default to NDRC
         track = request.category or "NDRC"
         
-        # Get template and format it
-        # Fallback to empty string if not found, or default
-        template = PROMPT_TEMPLATES.get(request.document_type, PROMPT_TEMPLATES["jeu_de_role_evenement"])
-        
-        # Format replacing {track} with the actual track name if needed (none in this specific prompt but good practice)
-        system_prompt = template # .format(track=track) if needed
+        template = get_registry().get(request.document_type)
+        system_prompt = template.render(
+            topic=request.topic, track=track,
+            duration_hours=request.duration_hours, target_block=request.target_block
+        )
         
         user_prompt = f"""Génère le document demandé sur le thème suivant :
 
@@ -208,20 +104,23 @@ async def generate_document(request: GenerateRequest, db: Session = Depends(get_
         user_prompt += "\\n\\nIMPORTANT : La première ligne de ta réponse doit être un commentaire HTML caché contenant un nom de fichier court et simplifié (max 30 chars, pas d'espace, pas d'accents, use des underscores) basé sur le nom de l'entreprise ou le sujet principal. Format : `<!-- FILENAME: Nom_Entreprise_Court -->`."
 
         # Pass track to get_model to ensure correct regulatory grounding
-        model = gemini_service.get_model(custom_system_instruction=system_prompt, track=track)
+        # Static templates share one cached model per (track, template)
+        model = get_gemini_service().get_model(custom_system_instruction=system_prompt, track=track, cache=template.is_static)
         
         content_parts = []
         
-        # Add KB files if needed (skipped for now in knowledge_service)
-        kb_files = knowledge_base.get_file_ids_by_category(track)
-        # Add KB logic here if files are returned
+        # Ground the generation in the official texts: only the top-k passages, not whole documents
+        passages = get_knowledge_base().search(f"{request.topic} {request.target_block or ''}", category=track)
+        if passages:
+            user_prompt += "\n\nExtraits des textes officiels à respecter :\n\n" + format_passages(passages)
         
         content_parts.append(user_prompt)
         
-        response = model.generate_content(content_parts)
+        with generation_slot(client_key, response):
+            result = model.generate_content(content_parts)
         
         # Extract Filename and Clean Content
-        full_text = response.text
+        full_text = result.text
         filename = None
         
         # Regex to find <!-- FILENAME: ... -->
@@ -234,9 +133,14 @@ async def generate_document(request: GenerateRequest, db: Session = Depends(get_
         return GenerateResponse(
             content=full_text, 
             document_type=request.document_type,
-            filename=filename
+            filename=filename,
+            template_version=template.version
         )
     
+    except GeminiUnavailable as e:
+        raise gemini_unavailable(e)
+    except GenerationRejected as e:
+        raise generation_rejected(e)
     except Exception as e:
         print(f"❌ Generation error: {e}")
         import traceback
@@ -247,28 +151,81 @@ class RefineRequest(BaseModel):
     current_content: str
     instruction: str
     track: Optional[str] = "NDRC"
+    # auto : seules les sections visées par l'instruction sont envoyées quand elles se détachent
+    mode: Literal["auto", "section", "full"] = "auto"
+    sections: Optional[List[int]] = None  # numéros (1..n) imposés par le client
+
+class RefineResponse(GenerateResponse):
+    mode: str = "full"
+    sections: List[int] = []
+    diff: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+
+REFINE_OUTPUT_RULES = {
+    "full": "4. NE SOIS PAS BAVARD : Renvoie uniquement le document modifié complet, prêt à l'emploi. Pas de phrase d'intro.",
+    "section": "4. NE SOIS PAS BAVARD : Renvoie uniquement les sections modifiées, chacune précédée de sa balise <<<SECTION n>>> d'origine. Pas de phrase d'intro, pas d'autre section.",
+    "session": "4. NE SOIS PAS BAVARD : Si le message contient des sections balisées <<<SECTION n>>>, renvoie uniquement ces sections modifiées avec leurs balises. Sinon renvoie le document modifié complet. Pas de phrase d'intro.",
+}
 
-@router.post("/refine", response_model=GenerateResponse)
-async def refine_document(request: RefineRequest, db: Session = Depends(get_db)):
-    if not request.current_content or not request.instruction:
-        raise HTTPException(status_code=400, detail="Content and instruction are required")
-    
-    try:
-        track = request.track or "NDRC"
-        
-        # System Prompt for the Refinement Agent
-        system_prompt = f"""Tu es un Éditeur Pédagogique Senior expert du BTS {track}.
+def refine_system_prompt(track: str, mode: str = "full") -> str:
+    return f"""Tu es un Éditeur Pédagogique Senior expert du BTS {track}.
 Ta mission est d'améliorer ou de modifier le document pédagogique fourni en suivant STRICTEMENT les instructions de l'utilisateur.
 
 RÈGLES D'OR :
 1. CONSERVE la structure Markdown existante (titres, tableaux, listes) sauf si l'instruction demande de la changer.
 2. RESPECTE les référentiels officiels du BTS {track}.
 3. INTÈGRE les modifications de manière fluide et didactique.
-4. NE SOIS PAS BAVARD : Renvoie uniquement le document modifié complet, prêt à l'emploi. Pas de phrase d'intro.
+{REFINE_OUTPUT_RULES[mode]}
 """
-        
-        # We reuse the get_model from gemini_service but with our specific refinement system prompt
-        model = gemini_service.get_model(custom_system_instruction=system_prompt, track=track)
+
+@router.post("/refine", response_model=RefineResponse)
+def refine_document(request: RefineRequest, response: Response, db: Session = Depends(get_db), client_key: str = Depends(generation_client_key)):
+    if not request.current_content or not request.instruction:
+        raise HTTPException(status_code=400, detail="Content and instruction are required")
+    
+    try:
+        track = request.track or "NDRC"
+        sections = split_sections(request.current_content)
+
+        # Sections to rewrite: forced by the client, or matched from the instruction
+        targets = []
+        if request.mode != "full":
+            if request.sections:
+                targets = sorted({n - 1 for n in request.sections if 1 <= n <= len(sections)})
+            else:
+                targets = select_sections(sections, request.instruction)
+            if request.mode == "section" and not targets:
+                raise HTTPException(status_code=400, detail="Aucune section ne correspond à l'instruction")
+
+        if targets:
+            # Only the outline and the affected sections are sent: the cost no longer grows with the document
+            model = get_gemini_service().get_model(custom_system_instruction=refine_system_prompt(track, "section"), track=track)
+            user_message = f"""Instruction de modification : "{request.instruction}"
+
+Plan du document (pour contexte, à ne pas renvoyer) :
+{outline(sections)}
+
+Sections à modifier :
+
+{section_payload(sections, targets)}"""
+            prompt_tokens = model.count_tokens([user_message])
+            with generation_slot(client_key, response):
+                result = model.generate_content([user_message])
+            updated = parse_sections(result.text, targets)
+            if updated is not None:
+                content = patch_sections(sections, updated)
+                return RefineResponse(
+                    content=content,
+                    document_type="refined",
+                    filename=None,
+                    mode="section",
+                    sections=[i + 1 for i in sorted(updated)],
+                    diff=unified_diff(request.current_content, content),
+                    prompt_tokens=prompt_tokens
+                )
+            print("⚠️ Refine: section markers missing in response, falling back to full document")
+
+        model = get_gemini_service().get_model(custom_system_instruction=refine_system_prompt(track, "full"), track=track)
         
         # The prompt sent to the model includes the content and the instruction
         user_message = f"""Instruction de modification : "{request.instruction}"
@@ -277,17 +234,151 @@ Voici le contenu actuel à modifier :
 
 {request.current_content}
 """
+        prompt_tokens = model.count_tokens([user_message])
+        with generation_slot(client_key, response):
+            result = model.generate_content([user_message])
         
-        response = model.generate_content([user_message])
-        
-        return GenerateResponse(
-            content=response.text,
+        return RefineResponse(
+            content=result.text,
             document_type="refined", 
-            filename=None 
+            filename=None,
+            mode="full",
+            diff=unified_diff(request.current_content, result.text),
+            prompt_tokens=prompt_tokens
         )
 
+    except HTTPException:
+        raise
+    except GeminiUnavailable as e:
+        raise gemini_unavailable(e)
+    except GenerationRejected as e:
+        raise generation_rejected(e)
     except Exception as e:
         print(f"❌ Refinement error: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- Refine sessions: the server keeps the document and the chat history ---
+
+_refine_sessions = None
+
+def get_refine_sessions() -> RefineSessionStore:
+    global _refine_sessions
+    if _refine_sessions is None:
+        def chat_factory(track: str, history: list):
+            model = get_gemini_service().get_model(custom_system_instruction=refine_system_prompt(track, "session"), track=track)
+            return model.start_chat(history=history)
+        _refine_sessions = RefineSessionStore(chat_factory)
+    return _refine_sessions
+
+class RefineSessionCreate(BaseModel):
+    content: str
+    track: Optional[str] = "NDRC"
+
+class RefineSessionMessage(BaseModel):
+    instruction: str
+    sections: Optional[List[int]] = None  # numéros (1..n) imposés par le client
+
+class RefineSessionResponse(BaseModel):
+    session_id: str
+    content: str
+    turns: int
+    mode: Optional[str] = None
+    sections: List[int] = []
+    diff: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+
+def load_refine_session(session_id: str, db: Session, user: User):
+    """Session of the current teacher; someone else's session is reported as missing"""
+    session = get_refine_sessions().get(db, session_id)
+    if session is None or (session.user_id != user.id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Session de retouche introuvable ou expirée")
+    return session
+
+@router.post("/refine/sessions", response_model=RefineSessionResponse, status_code=201)
+def create_refine_session(request: RefineSessionCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if not request.content:
+        raise HTTPException(status_code=400, detail="Content is required")
+    session = get_refine_sessions().create(db, request.content, request.track or "NDRC", user_id=current_user.id)
+    return RefineSessionResponse(session_id=session.id, content=session.content, turns=session.turns)
+
+@router.get("/refine/sessions/{session_id}", response_model=RefineSessionResponse)
+def get_refine_session(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    session = load_refine_session(session_id, db, current_user)
+    return RefineSessionResponse(session_id=session.id, content=session.content, turns=session.turns)
+
+@router.post("/refine/sessions/{session_id}/messages", response_model=RefineSessionResponse)
+def send_refine_message(session_id: str, request: RefineSessionMessage, response: Response, db: Session = Depends(get_db),
+                        current_user: User = Depends(get_current_user), client_key: str = Depends(generation_client_key)):
+    """
+    One refinement turn: only the new instruction (and the targeted sections of the
+    server-held document) is sent; the earlier turns are already in the chat history.
+    """
+    if not request.instruction:
+        raise HTTPException(status_code=400, detail="Instruction is required")
+    session = load_refine_session(session_id, db, current_user)
+
+    try:
+        with session.lock:
+            before = session.content
+            sections = split_sections(before)
+            if request.sections:
+                targets = sorted({n - 1 for n in request.sections if 1 <= n <= len(sections)})
+            else:
+                targets = select_sections(sections, request.instruction)
+
+            if targets:
+                message = f"""Instruction de modification : "{request.instruction}"
+
+Sections à modifier :
+
+{section_payload(sections, targets)}"""
+            else:
+                message = f"""Instruction de modification : "{request.instruction}"
+
+Applique-la au document de travail (avec les modifications précédentes) et renvoie le document complet."""
+            prompt_tokens = estimate_tokens([turn["text"] for turn in session.history] + [message])
+
+            with generation_slot(client_key, response):
+                reply = session.chat.send_message(message).text
+            updated = parse_sections(reply, targets) if targets else None
+            if targets and updated is None:
+                print("⚠️ Refine session: section markers missing in response, asking for the full document")
+                with generation_slot(client_key, response):
+                    reply = session.chat.send_message("Renvoie le document complet modifié, sans balises.").text
+                targets = []
+            after = patch_sections(sections, updated) if updated else reply.strip() + "\n"
+
+            # The teacher's instruction is what a session rebuilt from the DB must replay, not the fallback request
+            session.record_turn(message, reply, after)
+            session.save(db)
+
+            return RefineSessionResponse(
+                session_id=session.id,
+                content=after,
+                turns=session.turns,
+                mode="section" if updated else "full",
+                sections=[i + 1 for i in sorted(updated)] if updated else [],
+                diff=unified_diff(before, after),
+                prompt_tokens=prompt_tokens
+            )
+
+    except HTTPException:
+        raise
+    except GeminiUnavailable as e:
+        raise gemini_unavailable(e)
+    except GenerationRejected as e:
+        raise generation_rejected(e)
+    except Exception as e:
+        print(f"❌ Refine session error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/refine/sessions/{session_id}", status_code=204)
+def close_refine_session(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    load_refine_session(session_id, db, current_user)
+    if not get_refine_sessions().close(db, session_id):
+        raise HTTPException(status_code=404, detail="Session de retouche introuvable ou expirée")
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Header
+from fastapi.responses import Response
+from typing import Optional
+from ..services.referentiel_service import get_index
+
+router = APIRouter(prefix="/api/referentiel", tags=["referentiel"])
+
+
+@router.get("")
+def get_referentiel(if_none_match: Optional[str] = Header(None)):
+    """Référentiel E4/E6 (domaines, compétences, critères) ; 304 si le client a déjà cette version"""
+    index = get_index()
+    headers = {"ETag": index.etag, "Cache-Control": "public, max-age=3600"}
+    if if_none_match and index.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=index.payload, media_type="application/json", headers=headers)
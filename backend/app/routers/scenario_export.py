@@ -1,116 +1,200 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from docx import Document
-from docx.shared import Inches, Pt, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_PARAGRAPH_ALIGNMENT
+from typing import List, Literal, Optional
 from io import BytesIO
+from threading import Lock
+import copy
 import os
 import re
+import zipfile
+from ..services import render_service, export_cache
 
 router = APIRouter()
 
+# Bump when the rendering code changes so cached exports are invalidated
+RENDER_VERSION = "1"
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'templates', 'PARAMETRES MODIFIES 2024 vierge- Copie copie.docx')
+
+class TemplateCache:
+    """Keeps a parsed, pristine copy of the DOCX template and hands out deep copies.
+
+    The template is reloaded only when its mtime changes, so exports no longer
+    hit the disk nor re-parse the package XML.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._pristine = None
+        self._mtime = None
+        self._lock = Lock()
+
+    def _load(self):
+        from docx import Document  # Imported on first export, not at app startup
+        mtime = os.path.getmtime(self.path)
+        if self._pristine is None or mtime != self._mtime:
+            self._pristine = Document(self.path)
+            self._mtime = mtime
+        return self._pristine
+
+    def preload(self):
+        with self._lock:
+            self._load()
+
+    @property
+    def version(self) -> str:
+        """Changes whenever the template file is modified (part of export cache keys)"""
+        return f"{RENDER_VERSION}:{os.path.getmtime(self.path)}"
+
+    def get_document(self):
+        if not os.path.exists(self.path):
+            raise HTTPException(status_code=500, detail="Template not found")
+        with self._lock:
+            return copy.deepcopy(self._load())
+
+template_cache = TemplateCache(TEMPLATE_PATH)
+
 class ScenarioExportRequest(BaseModel):
     title: str
     scenario_type: str
     content: str
     exam_type: str = "E4"
     student_name: str = ""
+    template_version: Optional[str] = None  # Version du template de génération (partie de la clé de cache)
+
+MAX_BATCH_SIZE = 200
+
+class BatchScenarioExportRequest(BaseModel):
+    scenarios: List[ScenarioExportRequest]
+    format: Literal["docx", "pdf"] = "docx"
+    mode: Literal["zip", "merged"] = "zip"  # zip: one file per candidate, merged: one document with page breaks
+
+# Keyword rules mapping a table label to a standardized field key.
+# Evaluated in order; each rule is a list of alternatives, each alternative a
+# tuple of keywords that must all appear in the lowercased label.
+FIELD_RULES = [
+    ('objet', [('objet',)]),
+    ('date_duree', [('date', 'durée'), ('date', 'duree')]),
+    ('date_rencontre', [('date', 'rencontre')]),
+    ('lieu', [('lieu',)]),
+    ('delimitation', [('délimitation',), ('delimitation',)]),
+    ('acteurs', [('acteur', 'concerné')]),
+    ('historique', [('historique',)]),
+    ('objectifs', [('objectif', 'simulation'), ('objectif', 'communication')]),
+    ('informations', [('information', 'exploiter')]),
+    ('contraintes', [('contrainte',)]),
+    ('identite', [('identité',), ('identite',)]),
+    ('relation_entreprise', [('relation', 'entreprise')]),
+    ('motivations', [('motivation',)]),
+    ('freins', [('frein',)]),
+    ('objections', [('objection',)]),
+    ('contexte', [('contexte',)]),
+    ('consignes', [('consigne',)]),
+    ('elements_reponse', [('éléments de réponse',), ('elements de reponse',)]),
+]
+
+JURY_MARKERS = ('FICHE SUJET – nom du JURY', 'PAGE 2')
+SKIPPED_LABELS = ('MODIFICATION DES', 'PARAMÈTRES')
+BR_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+
+# Labels repeat across every generated scenario: resolve each one once
+_field_key_cache = {}
+
+def field_key(label: str):
+    """Map a table label to its standardized key (None if unknown)"""
+    if label in _field_key_cache:
+        return _field_key_cache[label]
+    label_lower = label.lower()
+    key = None
+    for candidate, alternatives in FIELD_RULES:
+        if any(all(word in label_lower for word in words) for words in alternatives):
+            key = candidate
+            break
+    if len(_field_key_cache) < 1024:
+        _field_key_cache[label] = key
+    return key
+
+def extract_tables_from_markdown(content: str) -> tuple:
+    """Extract both markdown tables in one pass.
+
+    Returns (candidat_fields, jury_fields). Rows before the jury marker go to
+    the candidat table, rows after it to the jury table; without a marker,
+    every row feeds both tables.
+    """
+    split_marker = -1
+    for marker in JURY_MARKERS:
+        split_marker = content.find(marker)
+        if split_marker != -1:
+            break
+
+    candidat, jury = {}, {}
+    pos = 0
+    for line in content.splitlines(keepends=True):
+        line_start = pos
+        pos += len(line)
+        row = line.strip()
+        if not row.startswith('|') or not row.endswith('|') or len(row) < 3:
+            continue
+
+        cells = row[1:-1].split('|')
+        if len(cells) < 2:
+            continue
+        field = '|'.join(cells[:-1]).strip().strip('*').strip()
+        value = cells[-1].strip().strip('*').strip()
 
-def extract_table_from_markdown(content: str, table_index: int = 0) -> dict:
-    """Extract a markdown table and return field-value pairs"""
-    # Find all markdown tables
-    table_pattern = r'\|([^\n]+)\|([^\n]+)\|'
-    matches = re.findall(table_pattern, content)
-    
-    if not matches:
-        return {}
-    
-    # Split into two tables (candidat and jury)
-    split_marker = content.find('FICHE SUJET – nom du JURY')
-    if split_marker == -1:
-        split_marker = content.find('PAGE 2')
-    
-    result = {}
-    
-    for row in matches:
-        field = row[0].strip().strip('*').strip()
-        value = row[1].strip().strip('*').strip()
-        
         # Skip header and separator rows
-        if field.startswith(':') or 'MODIFICATION DES' in field or 'PARAMÈTRES' in field:
+        if field.startswith(':') or any(label in field for label in SKIPPED_LABELS):
             continue
-        
-        # Clean up field names
-        field_clean = field.lower()
-        
-        # Only include rows from the correct table
-        row_pos = content.find(f"|{row[0]}|{row[1]}|")
-        if table_index == 0 and split_marker > 0 and row_pos > split_marker:
-            continue  # Skip jury table for candidat
-        if table_index == 1 and split_marker > 0 and row_pos < split_marker:
-            continue  # Skip candidat table for jury
-        
-        # Map to standardized keys with more variations
-        if 'objet' in field_clean:
-            result['objet'] = value
-        elif ('date' in field_clean and 'durée' in field_clean) or ('date' in field_clean and 'duree' in field_clean):
-            result['date_duree'] = value
-        elif 'date' in field_clean and 'rencontre' in field_clean:
-            result['date_rencontre'] = value
-        elif 'lieu' in field_clean:
-            result['lieu'] = value
-        elif 'délimitation' in field_clean or 'delimitation' in field_clean:
-            result['delimitation'] = value
-        elif ('acteur' in field_clean or 'acteurs' in field_clean) and 'concerné' in field_clean:
-            result['acteurs'] = value
-        elif 'historique' in field_clean:
-            result['historique'] = value
-        elif 'objectif' in field_clean and ('simulation' in field_clean or 'communication' in field_clean):
-            result['objectifs'] = value
-        elif 'information' in field_clean and 'exploiter' in field_clean:
-            result['informations'] = value
-        elif 'contrainte' in field_clean:
-            result['contraintes'] = value
-        elif 'identité' in field_clean or 'identite' in field_clean:
-            result['identite'] = value
-        elif 'relation' in field_clean and 'entreprise' in field_clean:
-            result['relation_entreprise'] = value
-        elif 'motivation' in field_clean:
-            result['motivations'] = value
-        elif 'frein' in field_clean:
-            result['freins'] = value
-        elif 'objection' in field_clean:
-            result['objections'] = value
-        elif 'contexte' in field_clean:
-            result['contexte'] = value
-        elif 'consigne' in field_clean:
-            result['consignes'] = value
-        elif 'éléments de réponse' in field_clean or 'elements de reponse' in field_clean:
-            result['elements_reponse'] = value
-    
-    return result
 
-@router.post("/export-scenario/docx")
-async def export_scenario_docx(request: ScenarioExportRequest):
-    """Export scenario as Word using official template"""
-    
-    # Load template
-    template_path = os.path.join(os.path.dirname(__file__), '..', '..', 'templates', 'PARAMETRES MODIFIES 2024 vierge- Copie copie.docx')
-    
-    if not os.path.exists(template_path):
-        raise HTTPException(status_code=500, detail="Template not found")
-    
-    doc = Document(template_path)
+        key = field_key(field)
+        if key is None:
+            continue
+        value = BR_PATTERN.sub('\n', value)
+
+        if split_marker <= 0:
+            candidat[key] = value
+            jury[key] = value
+        elif line_start < split_marker:
+            candidat[key] = value
+        else:
+            jury[key] = value
+
+    return candidat, jury
+
+def extract_table_from_markdown(content: str, table_index: int = 0) -> dict:
+    """Extract a single markdown table (0: candidat, 1: jury) as field-value pairs"""
+    return extract_tables_from_markdown(content)[table_index]
+
+def pdf_paragraph(text: str, style):
+    """ReportLab paragraph from plain text (escapes markup, keeps line breaks)"""
+    from reportlab.platypus import Paragraph
+    from xml.sax.saxutils import escape
+    return Paragraph(escape(text).replace('\n', '<br/>'), style)
+
+def scenario_render_spec(request: ScenarioExportRequest) -> dict:
+    """Picklable render input: plain field dicts, extracted once in the API process"""
+    candidat_fields, jury_fields = extract_tables_from_markdown(request.content)
+    return {
+        'title': request.title,
+        'scenario_type': request.scenario_type,
+        'exam_type': request.exam_type,
+        'student_name': request.student_name,
+        'candidat': candidat_fields,
+        'jury': jury_fields,
+    }
+
+def render_scenario_docx(spec: dict) -> bytes:
+    """Fill the official template from a render spec and return the DOCX bytes"""
+    from docx.shared import Pt
+    doc = template_cache.get_document()
     
     # Extract data from markdown tables in generated content
-    candidat_fields = extract_table_from_markdown(request.content, table_index=0)
-    jury_fields = extract_table_from_markdown(request.content, table_index=1)
+    candidat_fields, jury_fields = spec['candidat'], spec['jury']
     
     # Update the student name in paragraphs
     for para in doc.paragraphs:
         if 'nom du CANDIDAT' in para.text:
-            para.text = para.text.replace('nom du CANDIDAT :', request.student_name or 'CANDIDAT')
+            para.text = para.text.replace('nom du CANDIDAT :', spec['student_name'] or 'CANDIDAT')
             # Restore formatting
             for run in para.runs:
                 run.font.name = 'Calibri Light'
@@ -121,12 +205,12 @@ async def export_scenario_docx(request: ScenarioExportRequest):
         if 'Négociation Vente' in para.text:
             for run in para.runs:
                 if run.font.name == 'Wingdings':
-                    is_negociation = 'negociation' in request.scenario_type.lower()
+                    is_negociation = 'negociation' in spec['scenario_type'].lower()
                     run.text = 'þ' if is_negociation else 'o'
         elif 'Evènement commercial' in para.text or 'Événement commercial' in para.text:
             for run in para.runs:
                 if run.font.name == 'Wingdings':
-                    is_event = 'evenement' in request.scenario_type.lower() or 'event' in request.scenario_type.lower()
+                    is_event = 'evenement' in spec['scenario_type'].lower() or 'event' in spec['scenario_type'].lower()
                     run.text = 'þ' if is_event else 'o'
     
     # Fill Table 1 (Candidat) - 10 rows x 3 columns
@@ -135,7 +219,7 @@ async def export_scenario_docx(request: ScenarioExportRequest):
         
         # Row 2: Objet de l'activité (fill columns 2 AND 3 with same content)
         if len(table.rows) > 1 and len(table.rows[1].cells) > 2:
-            content = candidat_fields.get('objet', request.title)[:200]
+            content = candidat_fields.get('objet', spec['title'])[:200]
             table.rows[1].cells[1].text = content
             table.rows[1].cells[2].text = content
         
@@ -196,7 +280,7 @@ async def export_scenario_docx(request: ScenarioExportRequest):
         
         # Row 2: Objet de l'activité
         if len(table.rows) > 1 and len(table.rows[1].cells) > 1:
-            table.rows[1].cells[1].text = jury_fields.get('objet', candidat_fields.get('objet', request.title))[:200]
+            table.rows[1].cells[1].text = jury_fields.get('objet', candidat_fields.get('objet', spec['title']))[:200]
         
         # Row 3: Identité
         if len(table.rows) > 2 and len(table.rows[2].cells) > 1:
@@ -245,17 +329,21 @@ async def export_scenario_docx(request: ScenarioExportRequest):
     # Save to buffer
     buffer = BytesIO()
     doc.save(buffer)
-    buffer.seek(0)
-    
-    return Response(
-        content=buffer.getvalue(),
+    return buffer.getvalue()
+
+@router.post("/export-scenario/docx")
+async def export_scenario_docx(request: ScenarioExportRequest, if_none_match: Optional[str] = Header(None)):
+    """Export scenario as Word using official template"""
+    return await export_cache.cached_response(
+        export_cache.cache_key("scenario", request.dict(), template_cache.version, "docx"),
+        if_none_match,
+        lambda: render_service.render(render_scenario_docx, scenario_render_spec(request)),
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         headers={"Content-Disposition": f"attachment; filename=Sujet_{request.exam_type}_{request.student_name or 'CANDIDAT'}.docx"}
     )
 
-@router.post("/export-scenario/pdf")
-async def export_scenario_pdf(request: ScenarioExportRequest):
-    """Export scenario as PDF matching the Word template structure"""
+def render_scenario_pdf(spec: dict) -> bytes:
+    """Render a spec as PDF bytes matching the Word template structure"""
     from reportlab.lib.pagesizes import A4
     from reportlab.lib.units import cm
     from reportlab.lib import colors
@@ -296,23 +384,22 @@ async def export_scenario_pdf(request: ScenarioExportRequest):
     )
     
     # Extract data from markdown tables
-    candidat_fields = extract_table_from_markdown(request.content, table_index=0)
-    jury_fields = extract_table_from_markdown(request.content, table_index=1)
+    candidat_fields, jury_fields = spec['candidat'], spec['jury']
     
     # Header
     story.append(Paragraph("BTS Négociation et Digitalisation de la Relation Client", title_style))
     story.append(Paragraph("Session 2024", title_style))
-    exam_num = request.exam_type[-1] if request.exam_type else '4'
+    exam_num = spec['exam_type'][-1] if spec['exam_type'] else '4'
     story.append(Paragraph(f"E{exam_num} – RELATION CLIENT et NEGOCIATION VENTE", title_style))
     story.append(Spacer(1, 0.5*cm))
     
     # Fiche sujet
-    story.append(Paragraph(f"FICHE SUJET – {request.student_name or 'CANDIDAT'}", title_style))
+    story.append(Paragraph(f"FICHE SUJET – {spec['student_name'] or 'CANDIDAT'}", title_style))
     story.append(Spacer(1, 0.3*cm))
     
     # Checkboxes
-    is_negociation = 'negociation' in request.scenario_type.lower()
-    is_event = 'evenement' in request.scenario_type.lower() or 'event' in request.scenario_type.lower()
+    is_negociation = 'negociation' in spec['scenario_type'].lower()
+    is_event = 'evenement' in spec['scenario_type'].lower() or 'event' in spec['scenario_type'].lower()
     checkbox_neg = "☑" if is_negociation else "☐"
     checkbox_evt = "☑" if is_event else "☐"
     
@@ -326,23 +413,23 @@ async def export_scenario_pdf(request: ScenarioExportRequest):
     
     table1_data = [
         [Paragraph("Objet de l'activité", header_style), 
-         Paragraph(candidat_fields.get('objet', request.title)[:200], cell_style)],
+         pdf_paragraph(candidat_fields.get('objet', spec['title'])[:200], cell_style)],
         [Paragraph("Date(s) et durée", header_style), 
-         Paragraph(candidat_fields.get('date_duree', 'À définir')[:150], cell_style)],
+         pdf_paragraph(candidat_fields.get('date_duree', 'À définir')[:150], cell_style)],
         [Paragraph("Lieu", header_style), 
-         Paragraph(candidat_fields.get('lieu', 'À définir')[:150], cell_style)],
+         pdf_paragraph(candidat_fields.get('lieu', 'À définir')[:150], cell_style)],
         [Paragraph("Délimitation de Séquence(s)", header_style), 
-         Paragraph(candidat_fields.get('delimitation', 'Durée: 30-40 minutes')[:200], cell_style)],
+         pdf_paragraph(candidat_fields.get('delimitation', 'Durée: 30-40 minutes')[:200], cell_style)],
         [Paragraph("Acteur(s) concernés", header_style), 
-         Paragraph(candidat_fields.get('acteurs', 'Client/Prospect')[:250], cell_style)],
+         pdf_paragraph(candidat_fields.get('acteurs', 'Client/Prospect')[:250], cell_style)],
         [Paragraph("Historique de la relation", header_style), 
-         Paragraph(candidat_fields.get('historique', 'Première prise de contact')[:300], cell_style)],
+         pdf_paragraph(candidat_fields.get('historique', 'Première prise de contact')[:300], cell_style)],
         [Paragraph("Objectifs de la simulation", header_style), 
-         Paragraph(candidat_fields.get('objectifs', 'Réaliser la simulation selon le scénario')[:300], cell_style)],
+         pdf_paragraph(candidat_fields.get('objectifs', 'Réaliser la simulation selon le scénario')[:300], cell_style)],
         [Paragraph("Informations à exploiter", header_style), 
-         Paragraph(candidat_fields.get('informations', 'Voir le scénario détaillé')[:400], cell_style)],
+         pdf_paragraph(candidat_fields.get('informations', 'Voir le scénario détaillé')[:400], cell_style)],
         [Paragraph("Contrainte(s)", header_style), 
-         Paragraph(candidat_fields.get('contraintes', 'Respecter le cadre professionnel')[:250], cell_style)],
+         pdf_paragraph(candidat_fields.get('contraintes', 'Respecter le cadre professionnel')[:250], cell_style)],
     ]
     
     table1 = Table(table1_data, colWidths=[5*cm, 11*cm])
@@ -369,29 +456,29 @@ async def export_scenario_pdf(request: ScenarioExportRequest):
     
     table2_data = [
         [Paragraph("Objet de l'activité", header_style), 
-         Paragraph(jury_fields.get('objet', candidat_fields.get('objet', request.title))[:200], cell_style)],
+         pdf_paragraph(jury_fields.get('objet', candidat_fields.get('objet', spec['title']))[:200], cell_style)],
         [Paragraph("Identité", header_style), 
-         Paragraph(jury_fields.get('identite', 'Profil à définir')[:250], cell_style)],
+         pdf_paragraph(jury_fields.get('identite', 'Profil à définir')[:250], cell_style)],
         [Paragraph("Relation à l'entreprise", header_style), 
-         Paragraph(jury_fields.get('relation_entreprise', 'Client potentiel')[:200], cell_style)],
+         pdf_paragraph(jury_fields.get('relation_entreprise', 'Client potentiel')[:200], cell_style)],
         [Paragraph("Date de la rencontre", header_style), 
-         Paragraph(jury_fields.get('date_rencontre', candidat_fields.get('date_duree', 'À définir'))[:150], cell_style)],
+         pdf_paragraph(jury_fields.get('date_rencontre', candidat_fields.get('date_duree', 'À définir'))[:150], cell_style)],
         [Paragraph("Lieu", header_style), 
-         Paragraph(jury_fields.get('lieu', candidat_fields.get('lieu', 'À définir'))[:150], cell_style)],
+         pdf_paragraph(jury_fields.get('lieu', candidat_fields.get('lieu', 'À définir'))[:150], cell_style)],
         [Paragraph("Historique de la relation", header_style), 
-         Paragraph(jury_fields.get('historique', candidat_fields.get('historique', 'Première prise de contact'))[:300], cell_style)],
+         pdf_paragraph(jury_fields.get('historique', candidat_fields.get('historique', 'Première prise de contact'))[:300], cell_style)],
         [Paragraph("Objectifs de la simulation", header_style), 
-         Paragraph(jury_fields.get('objectifs', 'Jouer le rôle selon le profil défini')[:300], cell_style)],
+         pdf_paragraph(jury_fields.get('objectifs', 'Jouer le rôle selon le profil défini')[:300], cell_style)],
         [Paragraph("Délimitation de Séquence(s)", header_style), 
-         Paragraph(jury_fields.get('delimitation', candidat_fields.get('delimitation', '30-40 minutes'))[:200], cell_style)],
+         pdf_paragraph(jury_fields.get('delimitation', candidat_fields.get('delimitation', '30-40 minutes'))[:200], cell_style)],
         [Paragraph("Motivations", header_style), 
-         Paragraph(jury_fields.get('motivations', 'À définir selon le profil')[:250], cell_style)],
+         pdf_paragraph(jury_fields.get('motivations', 'À définir selon le profil')[:250], cell_style)],
         [Paragraph("Freins", header_style), 
-         Paragraph(jury_fields.get('freins', 'À définir selon le profil')[:250], cell_style)],
+         pdf_paragraph(jury_fields.get('freins', 'À définir selon le profil')[:250], cell_style)],
         [Paragraph("Contrainte(s)", header_style), 
-         Paragraph(jury_fields.get('contraintes', candidat_fields.get('contraintes', 'Respecter le cadre professionnel'))[:250], cell_style)],
+         pdf_paragraph(jury_fields.get('contraintes', candidat_fields.get('contraintes', 'Respecter le cadre professionnel'))[:250], cell_style)],
         [Paragraph("Objections", header_style), 
-         Paragraph(jury_fields.get('objections', 'À définir selon le contexte')[:300], cell_style)],
+         pdf_paragraph(jury_fields.get('objections', 'À définir selon le contexte')[:300], cell_style)],
     ]
     
     table2 = Table(table2_data, colWidths=[5*cm, 11*cm])
@@ -413,10 +500,129 @@ async def export_scenario_pdf(request: ScenarioExportRequest):
     
     # Build PDF
     doc.build(story)
-    buffer.seek(0)
-    
-    return Response(
-        content=buffer.getvalue(),
+    return buffer.getvalue()
+
+@router.post("/export-scenario/pdf")
+async def export_scenario_pdf(request: ScenarioExportRequest, if_none_match: Optional[str] = Header(None)):
+    """Export scenario as PDF matching the Word template structure"""
+    return await export_cache.cached_response(
+        export_cache.cache_key("scenario", request.dict(), RENDER_VERSION, "pdf"),
+        if_none_match,
+        lambda: render_service.render(render_scenario_pdf, scenario_render_spec(request)),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename=Sujet_{request.exam_type}_{request.student_name or 'CANDIDAT'}.pdf"}
     )
+
+
+# --- Batch export (e.g. a whole CCF session) ---
+
+RENDERERS = {
+    "docx": render_scenario_docx,
+    "pdf": render_scenario_pdf,
+}
+
+MEDIA_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+    "zip": "application/zip",
+}
+
+def merge_docx(parts: List[bytes]) -> bytes:
+    """Concatenate rendered template documents, one candidate per page break"""
+    from docx import Document
+    merged = Document(BytesIO(parts[0]))
+    body = merged.element.body
+    for part in parts[1:]:
+        merged.add_page_break()
+        for element in Document(BytesIO(part)).element.body:
+            if element.tag.endswith('}sectPr'):
+                continue
+            body.sectPr.addprevious(copy.deepcopy(element))
+    buffer = BytesIO()
+    merged.save(buffer)
+    return buffer.getvalue()
+
+def merge_pdf(parts: List[bytes]) -> bytes:
+    from pypdf import PdfWriter, PdfReader
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(BytesIO(part)))
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+class _ZipStreamBuffer:
+    """Write-only, non-seekable buffer drained after each zip entry"""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def batch_filename(request: ScenarioExportRequest, index: int, fmt: str) -> str:
+    name = re.sub(r'[^\w\-]+', '_', request.student_name or 'CANDIDAT').strip('_') or 'CANDIDAT'
+    return f"{index + 1:02d}_Sujet_{request.exam_type}_{name}.{fmt}"
+
+@router.post("/export-scenario/batch")
+async def export_scenario_batch(batch: BatchScenarioExportRequest):
+    """Export N scenarios at once, rendered in parallel worker processes.
+
+    mode=zip streams a ZIP whose entries are written as each candidate is
+    rendered; mode=merged returns a single document with page breaks.
+    """
+    if not batch.scenarios:
+        raise HTTPException(status_code=400, detail="No scenario to export")
+    if len(batch.scenarios) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} scenarios per batch")
+
+    renderer = RENDERERS[batch.format]
+    # The whole batch is admitted at once (503 when the render queue is full); merged mode adds the merge job
+    admission = render_service.admit_batch(len(batch.scenarios) + (batch.mode == "merged"))
+    futures = render_service.render_all(renderer, [scenario_render_spec(scenario) for scenario in batch.scenarios], admission)
+
+    if batch.mode == "merged":
+        merge = merge_docx if batch.format == "docx" else merge_pdf
+        try:
+            parts = [await future for future in futures]
+            content = await admission.render(merge, parts)
+        finally:
+            for future in futures:
+                future.cancel()
+            admission.done()
+        return Response(
+            content=content,
+            media_type=MEDIA_TYPES[batch.format],
+            headers={"Content-Disposition": f"attachment; filename=Sujets_{len(parts)}_candidats.{batch.format}"}
+        )
+
+    async def zip_stream():
+        buffer = _ZipStreamBuffer()
+        try:
+            with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for index, (scenario, future) in enumerate(zip(batch.scenarios, futures)):
+                    archive.writestr(batch_filename(scenario, index, batch.format), await future)
+                    yield buffer.drain()
+            yield buffer.drain()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    return StreamingResponse(
+        zip_stream(),
+        media_type=MEDIA_TYPES["zip"],
+        headers={"Content-Disposition": f"attachment; filename=Sujets_{len(batch.scenarios)}_candidats.zip"}
+    )
@@ -1,15 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks, Request, Header
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from typing import List, Optional
 from datetime import datetime
 from ..database import get_db
 from ..models import User
-from ..models_tracking import Deadline, Submission
-from ..schemas_tracking import SubmissionCreate, SubmissionReview, SubmissionResponse
+from ..models_tracking import Deadline, Submission, SubmissionExtract
+from ..schemas_tracking import (
+    SubmissionCreate, SubmissionReview, SubmissionResponse, SubmissionPreview,
+    ResumableUploadInit, ResumableUploadStatus, ResumableUploadFinalize
+)
 from ..auth import get_current_user
+from ..services import extraction_service
 import os
+import re
+import json
+import time
+import uuid
+import base64
+import fcntl
+import hashlib
 import shutil
+from contextlib import contextmanager
 from pathlib import Path
 
 router = APIRouter(prefix="/api/tracking/submissions", tags=["tracking_submissions"])
@@ -18,6 +30,33 @@ router = APIRouter(prefix="/api/tracking/submissions", tags=["tracking_submissio
 UPLOAD_DIR = Path("uploads/submissions")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# Uploads reprenables : fichiers partiels hors du dossier servi par /uploads
+PARTIAL_UPLOAD_DIR = Path("uploads_partial")
+PARTIAL_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+MAX_RESUMABLE_SIZE = int(os.getenv("MAX_RESUMABLE_UPLOAD_MB", "500")) * 1024 * 1024
+# Upload abandonné : plus aucun morceau reçu depuis ce délai, fichiers partiels supprimés
+RESUMABLE_UPLOAD_TTL = float(os.getenv("RESUMABLE_UPLOAD_TTL_HOURS", "24")) * 3600
+SWEEP_INTERVAL = 600  # secondes entre deux nettoyages déclenchés par un nouvel upload
+_last_sweep = 0.0
+
+
+def attach_previews(db: Session, responses: List[SubmissionResponse]):
+    """Ajoute l'aperçu extrait aux réponses (une seule requête pour toute la liste)"""
+    file_urls = [r.file_url for r in responses if r.file_url]
+    if not file_urls:
+        return responses
+    extracts = db.query(SubmissionExtract.file_url, SubmissionExtract.status, SubmissionExtract.preview).filter(
+        SubmissionExtract.file_url.in_(file_urls)
+    ).all()
+    by_url = {e.file_url: e for e in extracts}
+    for response in responses:
+        extract = by_url.get(response.file_url)
+        if extract:
+            response.preview = extract.preview
+            response.extraction_status = extract.status
+    return responses
+
+
 @router.post("", response_model=SubmissionResponse, status_code=status.HTTP_201_CREATED)
 def create_submission(
     submission_data: SubmissionCreate,
@@ -73,6 +112,7 @@ def create_submission(
 
 @router.post("/upload", status_code=status.HTTP_201_CREATED)
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user)
 ):
@@ -93,6 +133,9 @@ async def upload_file(
     # Retourner l'URL relative
     file_url = f"/uploads/submissions/{unique_filename}"
     
+    # Extraction du texte et de l'aperçu en arrière-plan (pool de processus)
+    background_tasks.add_task(extraction_service.enqueue_extraction, file_url, file_path)
+    
     return {
         "file_url": file_url,
         "file_name": file.filename,
@@ -100,6 +143,222 @@ async def upload_file(
     }
 
 
+# --- Upload reprenable (init, PATCH par morceaux, finalisation) ---
+
+def _partial_paths(upload_id: str):
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+        raise HTTPException(status_code=404, detail="Upload non trouvé")
+    return PARTIAL_UPLOAD_DIR / f"{upload_id}.part", PARTIAL_UPLOAD_DIR / f"{upload_id}.json"
+
+
+def sweep_partial_uploads(force: bool = False) -> int:
+    """
+    Supprime les fichiers partiels (.part / .json) sans activité depuis RESUMABLE_UPLOAD_TTL.
+    Appelé au démarrage et, au plus toutes les SWEEP_INTERVAL secondes, à chaque nouvel upload.
+    """
+    global _last_sweep
+    now = time.time()
+    if not force and now - _last_sweep < SWEEP_INTERVAL:
+        return 0
+    _last_sweep = now
+    removed = 0
+    for upload_id in {path.stem for path in PARTIAL_UPLOAD_DIR.glob("*") if path.suffix in (".part", ".json")}:
+        part_path, meta_path = PARTIAL_UPLOAD_DIR / f"{upload_id}.part", PARTIAL_UPLOAD_DIR / f"{upload_id}.json"
+        try:
+            # mtime du .part : date du dernier morceau reçu (le .json n'est écrit qu'à l'init)
+            last_activity = (part_path if part_path.exists() else meta_path).stat().st_mtime
+        except FileNotFoundError:
+            continue  # Finalisé ou supprimé entre-temps
+        if now - last_activity <= RESUMABLE_UPLOAD_TTL:
+            continue
+        for path in (part_path, meta_path):
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+    if removed:
+        print(f"🧹 Uploads reprenables : {removed} fichier(s) partiel(s) expiré(s) supprimé(s)")
+    return removed
+
+
+@contextmanager
+def _upload_lock(part_path: Path):
+    """
+    Verrou exclusif par upload (flock sur le fichier partiel, valable entre workers) :
+    deux PATCH simultanés écriraient au même offset. Non bloquant : 409, le client relit l'offset.
+    """
+    with part_path.open("ab") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise HTTPException(
+                status_code=409,
+                detail="Envoi déjà en cours pour cet upload",
+                headers={"Upload-Offset": str(part_path.stat().st_size)}
+            )
+        yield handle
+
+
+def _parse_checksum(value: Optional[str]) -> Optional[bytes]:
+    """En-tête Upload-Checksum : 'sha256 <empreinte du morceau en base64>'"""
+    if value is None:
+        return None
+    algorithm, _, encoded = value.partition(" ")
+    if algorithm.lower() != "sha256":
+        raise HTTPException(status_code=400, detail="Algorithme d'empreinte non supporté (sha256 attendu)")
+    try:
+        return base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Empreinte Upload-Checksum invalide")
+
+
+def _load_upload(upload_id: str, current_user: User):
+    part_path, meta_path = _partial_paths(upload_id)
+    if not meta_path.exists() or not part_path.exists():
+        raise HTTPException(status_code=404, detail="Upload non trouvé")
+    meta = json.loads(meta_path.read_text())
+    if meta["user_id"] != current_user.id:
+        raise HTTPException(status_code=403, detail="Accès non autorisé")
+    return part_path, meta_path, meta
+
+
+def _upload_status(upload_id: str, part_path: Path, meta: dict):
+    return ResumableUploadStatus(
+        upload_id=upload_id,
+        file_name=meta["file_name"],
+        file_size=meta["file_size"],
+        offset=part_path.stat().st_size
+    )
+
+
+@router.post("/upload/resumable", response_model=ResumableUploadStatus, status_code=status.HTTP_201_CREATED)
+def init_resumable_upload(
+    init_data: ResumableUploadInit,
+    current_user: User = Depends(get_current_user)
+):
+    """Démarrer un upload reprenable (gros fichiers, connexion instable)"""
+    if current_user.role != "student":
+        raise HTTPException(status_code=403, detail="Seuls les élèves peuvent uploader des fichiers")
+    
+    if init_data.file_size <= 0 or init_data.file_size > MAX_RESUMABLE_SIZE:
+        raise HTTPException(status_code=413, detail="Taille de fichier non autorisée")
+    
+    sweep_partial_uploads()
+    upload_id = uuid.uuid4().hex
+    part_path, meta_path = _partial_paths(upload_id)
+    meta = {
+        "user_id": current_user.id,
+        "file_name": init_data.file_name,
+        "file_size": init_data.file_size,
+        "created_at": datetime.now().isoformat()
+    }
+    part_path.touch()
+    meta_path.write_text(json.dumps(meta))
+    
+    return _upload_status(upload_id, part_path, meta)
+
+
+@router.get("/upload/resumable/{upload_id}", response_model=ResumableUploadStatus)
+def get_resumable_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Connaître l'offset à partir duquel reprendre l'envoi"""
+    part_path, _, meta = _load_upload(upload_id, current_user)
+    return _upload_status(upload_id, part_path, meta)
+
+
+@router.patch("/upload/resumable/{upload_id}", response_model=ResumableUploadStatus)
+async def append_resumable_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    upload_checksum: Optional[str] = Header(None, alias="Upload-Checksum"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ajouter un morceau au fichier partiel. L'offset doit correspondre aux octets déjà reçus.
+    Avec Upload-Checksum, le morceau est vérifié et retiré s'il ne correspond pas (422, à renvoyer).
+    """
+    part_path, _, meta = _load_upload(upload_id, current_user)
+    expected = _parse_checksum(upload_checksum)
+    
+    with _upload_lock(part_path) as buffer:
+        # Offset relu sous verrou : un autre PATCH a pu écrire entre-temps
+        current_offset = part_path.stat().st_size
+        if upload_offset != current_offset:
+            # Le client reprend avec un mauvais offset : il doit interroger le statut
+            raise HTTPException(
+                status_code=409,
+                detail="Offset invalide",
+                headers={"Upload-Offset": str(current_offset)}
+            )
+        
+        received = current_offset
+        digest = hashlib.sha256()
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > meta["file_size"]:
+                buffer.truncate(current_offset)
+                raise HTTPException(status_code=413, detail="Le morceau dépasse la taille annoncée")
+            buffer.write(chunk)
+            digest.update(chunk)
+        
+        if expected is not None and digest.digest() != expected:
+            buffer.truncate(current_offset)
+            raise HTTPException(status_code=422, detail="Empreinte du morceau invalide, veuillez le renvoyer")
+    
+    return _upload_status(upload_id, part_path, meta)
+
+
+@router.post("/upload/resumable/{upload_id}/finalize", status_code=status.HTTP_201_CREATED)
+def finalize_resumable_upload(
+    upload_id: str,
+    finalize_data: ResumableUploadFinalize,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Vérifier le fichier complet et le déplacer dans le stockage des soumissions.
+    L'empreinte du client est facultative (morceaux déjà vérifiés par Upload-Checksum) ;
+    celle calculée par le serveur est renvoyée.
+    """
+    part_path, meta_path, meta = _load_upload(upload_id, current_user)
+    
+    with _upload_lock(part_path):
+        if part_path.stat().st_size != meta["file_size"]:
+            raise HTTPException(status_code=409, detail="Upload incomplet")
+        
+        digest = hashlib.sha256()
+        with part_path.open("rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        
+        if finalize_data.sha256 and digest.hexdigest() != finalize_data.sha256.lower():
+            # Fichier corrompu : on repart de zéro
+            part_path.unlink()
+            meta_path.unlink()
+            raise HTTPException(status_code=422, detail="Empreinte SHA-256 invalide, veuillez recommencer l'envoi")
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_extension = os.path.splitext(meta["file_name"])[1]
+        unique_filename = f"{current_user.id}_{timestamp}{file_extension}"
+        file_path = UPLOAD_DIR / unique_filename
+        shutil.move(str(part_path), str(file_path))
+        meta_path.unlink()
+    
+    file_url = f"/uploads/submissions/{unique_filename}"
+    background_tasks.add_task(extraction_service.enqueue_extraction, file_url, file_path)
+    
+    return {
+        "file_url": file_url,
+        "file_name": meta["file_name"],
+        "sha256": digest.hexdigest(),
+        "message": "Fichier uploadé avec succès"
+    }
+
+
 @router.get("", response_model=List[SubmissionResponse])
 def list_submissions(
     deadline_id: Optional[int] = None,
@@ -159,7 +418,7 @@ def list_submissions(
         submission_response.deadline_title = deadline.title if deadline else None
         result.append(submission_response)
     
-    return result
+    return attach_previews(db, result)
 
 
 @router.get("/{submission_id}", response_model=SubmissionResponse)
@@ -190,9 +449,40 @@ def get_submission(
     submission_response.student_name = student.name if student else None
     submission_response.deadline_title = deadline.title if deadline else None
     
+    attach_previews(db, [submission_response])
     return submission_response
 
 
+@router.get("/{submission_id}/preview", response_model=SubmissionPreview)
+def get_submission_preview(
+    submission_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Récupérer le texte extrait et l'aperçu de la première page d'une soumission"""
+    submission = db.query(Submission).filter(Submission.id == submission_id).first()
+    
+    if not submission:
+        raise HTTPException(status_code=404, detail="Soumission non trouvée")
+    
+    if current_user.role == "student" and submission.student_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Accès non autorisé")
+    
+    if current_user.role == "teacher":
+        student = db.query(User).filter(User.id == submission.student_id).first()
+        if student and student.teacher_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Accès non autorisé")
+    
+    if not submission.file_url:
+        raise HTTPException(status_code=404, detail="Aucun fichier pour cette soumission")
+    
+    extract = db.query(SubmissionExtract).filter(SubmissionExtract.file_url == submission.file_url).first()
+    if not extract:
+        return SubmissionPreview(file_url=submission.file_url, status="pending")
+    
+    return SubmissionPreview.from_orm(extract)
+
+
 @router.put("/{submission_id}/review", response_model=SubmissionResponse)
 def review_submission(
     submission_id: int,
@@ -264,6 +554,7 @@ def delete_submission(
         file_path = Path(".") / submission.file_url.lstrip("/")
         if file_path.exists():
             file_path.unlink()
+        db.query(SubmissionExtract).filter(SubmissionExtract.file_url == submission.file_url).delete()
     
     db.delete(submission)
     db.commit()
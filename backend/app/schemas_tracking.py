@@ -99,10 +99,38 @@ class SubmissionResponse(BaseModel):
     student_name: Optional[str] = None
     deadline_title: Optional[str] = None
 
+    # Aperçu extrait en arrière-plan
+    preview: Optional[str] = None
+    extraction_status: Optional[str] = None
+
     class Config:
         orm_mode = True
         from_attributes = True
 
+class SubmissionPreview(BaseModel):
+    file_url: str
+    status: str  # 'pending', 'done', 'failed', 'unsupported'
+    preview: Optional[str] = None
+    text: Optional[str] = None
+    page_count: Optional[int] = None
+
+    class Config:
+        orm_mode = True
+        from_attributes = True
+
+class ResumableUploadInit(BaseModel):
+    file_name: str
+    file_size: int  # Taille totale attendue en octets
+
+class ResumableUploadStatus(BaseModel):
+    upload_id: str
+    file_name: str
+    file_size: int
+    offset: int  # Nombre d'octets déjà reçus
+
+class ResumableUploadFinalize(BaseModel):
+    sha256: Optional[str] = None  # Empreinte hexadécimale du fichier complet, si le client l'a calculée
+
 # ============================================
 # SCHEMAS POUR L'ADMINISTRATION
 # ============================================
@@ -0,0 +1,349 @@
+"""
+Statistiques de maîtrise des compétences à partir des EvaluationScore.
+
+Toutes les agrégations (moyennes pondérées par AssessmentCriterion.weight,
+regroupements par élève / compétence / date) sont faites en SQL : Python ne
+reçoit que des lignes déjà agrégées (quelques dizaines par élève), jamais les
+objets ORM des scores. Les résultats sont renvoyés sous forme de colonnes pour
+que le front puisse les tracer sans retraitement.
+
+Sans filtre de dates, moyennes et cartes de chaleur sont lues dans
+CompetencyRollup (élève x compétence x session), tenue à jour par
+refresh_rollups dans la transaction qui modifie les scores.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import func, insert, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .referentiel_service import get_index, competency_code
+from ..models import (
+    User, Evaluation, EvaluationScore, AssessmentCriterion, Competency, ExamBlock, Class, ClassStudent, CompetencyRollup
+)
+
+# INSERT ... ON CONFLICT DO UPDATE pour refresh_rollups ; autres bases : suppression puis insertion
+UPSERT_DIALECTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+ROLLUP_VALUES = ("weighted_sum", "weight_total", "score_count", "average", "level", "last_evaluated")
+
+# Seuils de niveau (échelle TI=5, I=10, S=15, TS=20)
+MASTERY_LEVELS = [(7.5, "TI"), (12.5, "I"), (17.5, "S")]
+
+
+def mastery_level(average: Optional[float]) -> Optional[str]:
+    if average is None:
+        return None
+    for threshold, level in MASTERY_LEVELS:
+        if average < threshold:
+            return level
+    return "TS"
+
+
+def _weighted_columns():
+    weight = func.coalesce(AssessmentCriterion.weight, 1.0)
+    return func.sum(EvaluationScore.score * weight).label("weighted_sum"), func.sum(weight).label("weight_total")
+
+
+def _scores_query(db: Session, *columns, student_ids=None, block: Optional[ExamBlock] = None,
+                  date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """Scores notés, rattachés à une compétence du référentiel"""
+    query = db.query(*columns).select_from(EvaluationScore).join(
+        Evaluation, Evaluation.id == EvaluationScore.evaluation_id
+    ).join(
+        AssessmentCriterion, AssessmentCriterion.id == EvaluationScore.criterion_id
+    ).join(
+        Competency, Competency.id == AssessmentCriterion.competency_id
+    ).filter(EvaluationScore.score.isnot(None))
+    if student_ids is not None:
+        query = query.filter(Evaluation.student_id.in_(student_ids))
+    if block is not None:
+        query = query.filter(Competency.block == block)
+    if date_from:
+        query = query.filter(Evaluation.date >= date_from)
+    if date_to:
+        query = query.filter(Evaluation.date <= date_to)
+    return query
+
+
+def accessible_students(db: Session, user: User):
+    """
+    Ids des élèves dont le professeur gère évaluations et statistiques (sous-requête), None pour un admin.
+    Même périmètre que la liste d'élèves du front (/api/auth/students/{class_code}),
+    plus les élèves inscrits dans ses classes.
+    """
+    if user.role == "admin":
+        return None
+    return db.query(User.id).filter(User.role == "student", or_(
+        User.teacher_id == user.id,
+        User.teacher_id.is_(None),
+        User.id.in_(db.query(ClassStudent.student_id).join(Class, Class.id == ClassStudent.class_id).filter(Class.teacher_id == user.id))
+    ))
+
+
+def class_student_ids(db: Session, class_id: Optional[int] = None, class_name: Optional[str] = None):
+    """Sous-requête des élèves d'une classe (par id de Class ou par User.class_name)"""
+    if class_id is not None:
+        return db.query(ClassStudent.student_id).filter(ClassStudent.class_id == class_id)
+    return db.query(User.id).filter(User.role == "student", User.class_name == class_name)
+
+
+def _average(weighted_sum, weight_total) -> Optional[float]:
+    if not weight_total:
+        return None
+    return round(weighted_sum / weight_total, 2)
+
+
+def _rollup_query(db: Session, *columns, student_ids=None, block: Optional[ExamBlock] = None,
+                  session_id: Optional[int] = None):
+    query = db.query(*columns).select_from(CompetencyRollup).join(
+        Competency, Competency.id == CompetencyRollup.competency_id
+    )
+    if student_ids is not None:
+        query = query.filter(CompetencyRollup.student_id.in_(student_ids))
+    if block is not None:
+        query = query.filter(Competency.block == block)
+    if session_id is not None:
+        query = query.filter(CompetencyRollup.session_id == session_id)
+    return query
+
+
+def competency_averages(db: Session, student_ids=None, block: Optional[ExamBlock] = None,
+                        date_from: Optional[date] = None, date_to: Optional[date] = None,
+                        session_id: Optional[int] = None) -> Dict[str, list]:
+    """Moyenne pondérée et nombre de scores par Competency.code"""
+    if date_from or date_to:
+        weighted_sum, weight_total = _weighted_columns()
+        query = _scores_query(
+            db, Competency.code, Competency.block, weighted_sum, weight_total, func.count(EvaluationScore.id),
+            student_ids=student_ids, block=block, date_from=date_from, date_to=date_to
+        )
+        if session_id is not None:
+            query = query.filter(Evaluation.session_id == session_id)
+    else:
+        query = _rollup_query(
+            db, Competency.code, Competency.block, func.sum(CompetencyRollup.weighted_sum),
+            func.sum(CompetencyRollup.weight_total), func.sum(CompetencyRollup.score_count),
+            student_ids=student_ids, block=block, session_id=session_id
+        )
+    rows = query.group_by(Competency.code, Competency.block).order_by(Competency.code).all()
+
+    index = get_index()
+    result = {"code": [], "label": [], "block": [], "average": [], "level": [], "count": []}
+    for code, competency_block, total, weights, count in rows:
+        average = _average(total, weights)
+        competency = index.competency(code)
+        result["code"].append(code)
+        result["label"].append(competency["description"] if competency else code)
+        result["block"].append(competency_block.value if competency_block else None)
+        result["average"].append(average)
+        result["level"].append(mastery_level(average))
+        result["count"].append(count)
+    return result
+
+
+def _bucket(day: date, period: str) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def progress_curve(db: Session, student_id: int, block: Optional[ExamBlock] = None, period: str = "week") -> dict:
+    """
+    Courbes de progression d'un élève : pour chaque compétence, moyenne pondérée
+    par période et moyenne cumulée à la fin de chaque période.
+    """
+    weighted_sum, weight_total = _weighted_columns()
+    # Agrégation par jour en SQL (portable SQLite / Postgres), regroupement en périodes ensuite
+    rows = _scores_query(
+        db, Competency.code, Evaluation.date, weighted_sum, weight_total,
+        student_ids=[student_id], block=block
+    ).filter(Evaluation.date.isnot(None)).group_by(Competency.code, Evaluation.date).all()
+
+    sums = defaultdict(lambda: [0.0, 0.0])  # (code, période) -> [somme pondérée, poids]
+    for code, day, total, weights in rows:
+        bucket = sums[(code, _bucket(day, period))]
+        bucket[0] += total or 0.0
+        bucket[1] += weights or 0.0
+
+    periods = sorted({p for _, p in sums})
+    codes = sorted({c for c, _ in sums})
+    series = {}
+    for code in codes:
+        averages, cumulative = [], []
+        running_sum, running_weight = 0.0, 0.0
+        for p in periods:
+            total, weights = sums.get((code, p), (0.0, 0.0))
+            running_sum += total
+            running_weight += weights
+            averages.append(_average(total, weights))
+            cumulative.append(_average(running_sum, running_weight))
+        series[code] = {"average": averages, "cumulative": cumulative}
+
+    return {
+        "student_id": student_id,
+        "period": period,
+        "periods": [p.isoformat() for p in periods],
+        "competencies": series,
+    }
+
+
+def class_heatmap(db: Session, student_ids_query, block: Optional[ExamBlock] = None,
+                  session_id: Optional[int] = None) -> dict:
+    """Matrice élèves x compétences des moyennes pondérées (None si jamais évalué)"""
+    students = db.query(User.id, User.name).filter(User.id.in_(student_ids_query)).order_by(User.name).all()
+    rows = _rollup_query(
+        db, CompetencyRollup.student_id, Competency.code,
+        func.sum(CompetencyRollup.weighted_sum), func.sum(CompetencyRollup.weight_total),
+        student_ids=student_ids_query, block=block, session_id=session_id
+    ).group_by(CompetencyRollup.student_id, Competency.code).all()
+
+    codes = sorted({code for _, code, _, _ in rows})
+    row_index = {student_id: i for i, (student_id, _) in enumerate(students)}
+    column_index = {code: j for j, code in enumerate(codes)}
+    values: List[List[Optional[float]]] = [[None] * len(codes) for _ in students]
+    for student_id, code, total, weights in rows:
+        if student_id in row_index:
+            values[row_index[student_id]][column_index[code]] = _average(total, weights)
+
+    # Moyenne de classe par compétence (sur les élèves évalués)
+    column_averages = []
+    for j in range(len(codes)):
+        column = [row[j] for row in values if row[j] is not None]
+        column_averages.append(round(sum(column) / len(column), 2) if column else None)
+
+    return {
+        "students": [{"id": student_id, "name": name} for student_id, name in students],
+        "competencies": codes,
+        "labels": [get_index().skill_label(None, code) for code in codes],
+        "values": values,
+        "class_average": column_averages,
+    }
+
+
+# --- Rollups ---
+
+def _fresh_rollups(db: Session, student_ids=None) -> list:
+    """Agrégats élève x compétence x session recalculés depuis les scores"""
+    weighted_sum, weight_total = _weighted_columns()
+    rows = _scores_query(
+        db, Evaluation.student_id, AssessmentCriterion.competency_id, Evaluation.session_id,
+        weighted_sum, weight_total, func.count(EvaluationScore.id), func.max(Evaluation.date),
+        student_ids=student_ids
+    ).group_by(Evaluation.student_id, AssessmentCriterion.competency_id, Evaluation.session_id).all()
+
+    rollups = []
+    for student_id, competency_id, session_id, total, weights, count, last_evaluated in rows:
+        average = _average(total, weights)
+        rollups.append({
+            "student_id": student_id,
+            "competency_id": competency_id,
+            "session_id": session_id,
+            "weighted_sum": total or 0.0,
+            "weight_total": weights or 0.0,
+            "score_count": count,
+            "average": average,
+            "level": mastery_level(average),
+            "last_evaluated": last_evaluated,
+        })
+    return rollups
+
+
+def refresh_rollups(db: Session, student_ids) -> int:
+    """
+    Recalcule les rollups des élèves dont les scores ont changé.
+    À appeler après flush, dans la même transaction que l'écriture des scores.
+    """
+    student_ids = list({sid for sid in student_ids if sid is not None})
+    if not student_ids:
+        return 0
+    rollups = _fresh_rollups(db, student_ids)
+    dialect = db.get_bind().dialect.name
+    if dialect not in UPSERT_DIALECTS:
+        db.query(CompetencyRollup).filter(CompetencyRollup.student_id.in_(student_ids)).delete(synchronize_session=False)
+        if rollups:
+            db.execute(insert(CompetencyRollup), rollups)
+        return len(rollups)
+
+    # Upsert sur l'index unique (élève, compétence, session) puis suppression des clés disparues :
+    # deux rafraîchissements concurrents du même élève ne peuvent plus insérer de doublons
+    if rollups:
+        stmt = UPSERT_DIALECTS[dialect](CompetencyRollup).values(rollups)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CompetencyRollup.student_id, CompetencyRollup.competency_id, func.coalesce(CompetencyRollup.session_id, literal_column("0"))],
+            set_={**{column: getattr(stmt.excluded, column) for column in ROLLUP_VALUES}, "updated_at": func.now()},
+        )
+        db.execute(stmt)
+    fresh = {(r["student_id"], r["competency_id"], r["session_id"]) for r in rollups}
+    stale = [row.id for row in db.query(
+        CompetencyRollup.id, CompetencyRollup.student_id, CompetencyRollup.competency_id, CompetencyRollup.session_id
+    ).filter(CompetencyRollup.student_id.in_(student_ids)) if (row.student_id, row.competency_id, row.session_id) not in fresh]
+    if stale:
+        db.query(CompetencyRollup).filter(CompetencyRollup.id.in_(stale)).delete(synchronize_session=False)
+    return len(rollups)
+
+
+def criterion_ids_by_code(db: Session) -> Dict[str, int]:
+    """Premier critère de chaque compétence, en une seule requête"""
+    rows = db.query(Competency.code, func.min(AssessmentCriterion.id)).join(
+        AssessmentCriterion, AssessmentCriterion.competency_id == Competency.id
+    ).group_by(Competency.code).all()
+    return {code: criterion_id for code, criterion_id in rows}
+
+
+def remap_sync_scores(db: Session) -> int:
+    """
+    Recalcule le critère des scores synchronisés (skill_key + domaine du front) avec
+    referentiel_service.competency_code. Retourne le nombre de scores corrigés. Ne commite pas.
+    """
+    criteria = criterion_ids_by_code(db)
+    moves = defaultdict(list)  # critère attendu -> ids des scores à corriger
+    rows = db.query(EvaluationScore.id, EvaluationScore.skill_key, EvaluationScore.criterion_id, Evaluation.domain_id).join(
+        Evaluation, Evaluation.id == EvaluationScore.evaluation_id
+    ).filter(EvaluationScore.skill_key.isnot(None)).all()
+    for score_id, skill_key, criterion_id, domain_id in rows:
+        code = competency_code(domain_id, skill_key)
+        expected = criteria.get(code) if code else None
+        if expected != criterion_id:
+            moves[expected].append(score_id)
+    for criterion_id, score_ids in moves.items():
+        db.query(EvaluationScore).filter(EvaluationScore.id.in_(score_ids)).update(
+            {EvaluationScore.criterion_id: criterion_id}, synchronize_session=False
+        )
+    return sum(len(score_ids) for score_ids in moves.values())
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Reconstruction complète (backfill). Ne commite pas."""
+    db.query(CompetencyRollup).delete(synchronize_session=False)
+    rollups = _fresh_rollups(db)
+    if rollups:
+        db.execute(insert(CompetencyRollup), rollups)
+    return len(rollups)
+
+
+def check_rollups(db: Session, tolerance: float = 1e-6) -> List[dict]:
+    """Compare la table de rollups aux agrégats recalculés. Retourne les écarts."""
+    expected = {(r["student_id"], r["competency_id"], r["session_id"]): r for r in _fresh_rollups(db)}
+    stored = {}
+    for r in db.query(CompetencyRollup).all():
+        stored[(r.student_id, r.competency_id, r.session_id)] = {
+            "weighted_sum": r.weighted_sum, "weight_total": r.weight_total, "score_count": r.score_count
+        }
+
+    issues = []
+    for k in expected.keys() | stored.keys():
+        if k not in stored:
+            issues.append({"key": k, "problem": "missing"})
+        elif k not in expected:
+            issues.append({"key": k, "problem": "orphan"})
+        else:
+            exp, got = expected[k], stored[k]
+            if (exp["score_count"] != got["score_count"]
+                    or abs(exp["weighted_sum"] - (got["weighted_sum"] or 0.0)) > tolerance
+                    or abs(exp["weight_total"] - (got["weight_total"] or 0.0)) > tolerance):
+                issues.append({"key": k, "problem": "mismatch", "expected": exp["score_count"], "stored": got["score_count"]})
+    return sorted(issues, key=lambda issue: str(issue["key"]))
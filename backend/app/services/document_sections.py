@@ -0,0 +1,136 @@
+"""
+Découpage d'un document Markdown généré en sections, pour /api/refine.
+
+Une section commence à un titre Markdown (#) ou après une ligne de séparation
+(---). Le séparateur et les lignes vides qui la terminent sont gardés à part
+(`trailer`) : le modèle ne renvoie que le corps, et
+"".join(s["body"] + s["trailer"] for s in sections) redonne le document exact.
+"""
+import difflib
+import math
+import re
+from typing import Dict, List, Optional
+from .knowledge_index import tokenize
+
+_RULE = re.compile(r"^\s*(-{3,}|\*{3,}|_{3,})\s*$")
+_HEADING = re.compile(r"^\s*#{1,6}\s")
+_MARKER = re.compile(r"^<<<SECTION (\d+)>>>\s*$", re.MULTILINE)
+_LABEL_STRIP = re.compile(r"[*#_|]")
+_BOLD = re.compile(r"\*\*(.+?)\*\*")
+
+
+def split_sections(content: str) -> List[Dict]:
+    sections, current = [], []
+
+    def close():
+        if not current:
+            return
+        lines = list(current)
+        trailer = []
+        while lines and (not lines[-1].strip() or _RULE.match(lines[-1])):
+            trailer.insert(0, lines.pop())
+        sections.append({"body": "".join(lines), "trailer": "".join(trailer)})
+        current.clear()
+
+    for line in content.splitlines(keepends=True):
+        if _HEADING.match(line) and any(l.strip() and not _RULE.match(l) for l in current):
+            close()
+        current.append(line)
+        if _RULE.match(line):
+            close()
+    close()
+
+    for i, section in enumerate(sections):
+        section["index"] = i
+        section["label"] = section_label(section["body"])
+    return sections
+
+
+def section_label(body: str) -> str:
+    """Ligne la plus distinctive : le titre, sinon la dernière ligne en gras avant un tableau"""
+    label = ""
+    for line in body.splitlines():
+        if line.lstrip().startswith("|"):
+            break
+        if _HEADING.match(line) or line.strip().startswith("**"):
+            label = _LABEL_STRIP.sub("", line).strip()
+            if _HEADING.match(line):
+                break
+    return label or _LABEL_STRIP.sub("", body.strip().split("\n", 1)[0]).strip()[:80]
+
+
+def join_sections(sections: List[Dict]) -> str:
+    return "".join(section["body"] + section["trailer"] for section in sections)
+
+
+def _stems(text: str) -> set:
+    # Pluriels ramenés au singulier : "contraintes" / "Contrainte(s)"
+    return {token[:-1] if len(token) > 3 and token[-1] in "sx" else token for token in tokenize(text)}
+
+
+def select_sections(sections: List[Dict], instruction: str) -> List[int]:
+    """
+    Sections visées par l'instruction : les termes de l'instruction sont pondérés
+    par leur rareté entre sections (un terme présent partout ne discrimine rien),
+    et comptent double dans les intitulés en gras (lignes des tableaux, titres).
+    Liste vide si aucune section ne se détache.
+    """
+    terms = _stems(instruction)
+    if not terms or len(sections) < 2:
+        return []
+    vocabularies = [_stems(section["body"]) for section in sections]
+    labels = [_stems(" ".join(_BOLD.findall(section["body"]))) for section in sections]
+    scores = []
+    for vocabulary, label_terms in zip(vocabularies, labels):
+        score = 0.0
+        for term in terms & vocabulary:
+            df = sum(1 for v in vocabularies if term in v)
+            score += math.log(len(sections) / df) * (2 if term in label_terms else 1)
+        scores.append(score)
+    best = max(scores)
+    if best <= 0:
+        return []
+    selected = [i for i, score in enumerate(scores) if score > best / 2]
+    return selected if len(selected) < len(sections) else []
+
+
+def outline(sections: List[Dict]) -> str:
+    return "\n".join(f"{section['index'] + 1}. {section['label']}" for section in sections)
+
+
+def section_payload(sections: List[Dict], indexes: List[int]) -> str:
+    return "\n".join(f"<<<SECTION {i + 1}>>>\n{sections[i]['body'].strip()}\n" for i in indexes)
+
+
+def parse_sections(text: str, indexes: List[int]) -> Optional[Dict[int, str]]:
+    """Sections renvoyées par le modèle (index -> corps) ; None si la réponse est inexploitable"""
+    parts = _MARKER.split(text)
+    if len(parts) == 1:
+        # Une seule section demandée : le modèle a parfois omis la balise
+        return {indexes[0]: text.strip()} if len(indexes) == 1 and text.strip() else None
+    updated = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        index = int(number) - 1
+        if index in indexes and body.strip():
+            updated[index] = body.strip()
+    return updated or None
+
+
+def patch_sections(sections: List[Dict], updated: Dict[int, str]) -> str:
+    patched = []
+    for section in sections:
+        body = section["body"]
+        if section["index"] in updated:
+            # Conserve les lignes vides d'origine autour du corps
+            leading = body[:len(body) - len(body.lstrip("\n"))]
+            ending = body[len(body.rstrip("\n")):] or ("\n" if section["trailer"] else "")
+            body = leading + updated[section["index"]] + ending
+        patched.append({**section, "body": body})
+    return join_sections(patched)
+
+
+def unified_diff(before: str, after: str) -> str:
+    return "".join(difflib.unified_diff(
+        before.splitlines(keepends=True), after.splitlines(keepends=True),
+        fromfile="avant", tofile="après", n=1
+    ))
@@ -0,0 +1,132 @@
+"""
+Cache disque des exports rendus (DOCX / PDF).
+
+Un export est une fonction déterministe de la requête : la clé est un hash de
+(type d'export, payload, version du template, format). Les fichiers sont
+évincés par ordre d'accès (LRU, via la date de modification) dès que la taille
+totale dépasse EXPORT_CACHE_MAX_MB. Les réponses portent un ETag pour que les
+re-téléchargements puissent se conclure par un 304.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Awaitable, Callable, Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+EXPORT_CACHE_DIR = Path(os.getenv("EXPORT_CACHE_DIR", Path(__file__).resolve().parent.parent.parent / "cache" / "exports"))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_MB", "200")) * 1024 * 1024
+
+EXPORT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+_lock = Lock()
+_total_bytes: Optional[int] = None  # Calculé au premier accès, puis maintenu
+
+
+def cache_key(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def etag(key: str) -> str:
+    return f'"{key}"'
+
+
+def _path(key: str) -> Path:
+    return EXPORT_CACHE_DIR / f"{key}.bin"
+
+
+def _scan_total() -> int:
+    return sum(f.stat().st_size for f in EXPORT_CACHE_DIR.glob("*.bin"))
+
+
+def get(key: str) -> Optional[bytes]:
+    path = _path(key)
+    try:
+        content = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    # Marque l'entrée comme récemment utilisée
+    now = time.time()
+    try:
+        os.utime(path, (now, now))
+    except FileNotFoundError:
+        pass
+    return content
+
+
+def _evict(needed: int):
+    """Supprime les entrées les moins récemment utilisées jusqu'à libérer la place"""
+    global _total_bytes
+    entries = []
+    for f in EXPORT_CACHE_DIR.glob("*.bin"):
+        try:
+            stat = f.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, f))
+    entries.sort()
+    # Les autres workers écrivent aussi dans le dossier : on repart du disque
+    _total_bytes = sum(size for _, size, _ in entries)
+    for _, size, f in entries:
+        if _total_bytes + needed <= EXPORT_CACHE_MAX_BYTES:
+            break
+        try:
+            f.unlink()
+            _total_bytes -= size
+        except FileNotFoundError:
+            pass
+
+
+def put(key: str, content: bytes):
+    global _total_bytes
+    if len(content) > EXPORT_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _scan_total()
+        if _total_bytes + len(content) > EXPORT_CACHE_MAX_BYTES:
+            _evict(len(content))
+        # Écriture atomique : un lecteur ne voit jamais de fichier partiel
+        fd, tmp_path = tempfile.mkstemp(dir=EXPORT_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        # Clé déjà présente (autre worker, rendu concurrent) : l'ancien fichier est remplacé, pas ajouté
+        try:
+            replaced = _path(key).stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, _path(key))
+        _total_bytes += len(content) - replaced
+
+
+def clear():
+    global _total_bytes
+    with _lock:
+        for f in EXPORT_CACHE_DIR.glob("*.bin"):
+            f.unlink(missing_ok=True)
+        _total_bytes = 0
+
+
+async def cached_response(
+    key: str,
+    if_none_match: Optional[str],
+    render: Callable[[], Awaitable[bytes]],
+    media_type: str,
+    headers: dict
+) -> Response:
+    """Sert l'export depuis le cache (304 si l'ETag correspond), sinon le rend et le stocke"""
+    response_headers = {**headers, "ETag": etag(key), "Cache-Control": "private, no-cache"}
+    if if_none_match and etag(key) in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=response_headers)
+
+    # Lecture, écriture et éviction (parcours du dossier) sont des I/O disque : hors de la boucle d'événements
+    content = await run_in_threadpool(get, key)
+    if content is None:
+        content = await render()
+        await run_in_threadpool(put, key, content)
+    return Response(content=content, media_type=media_type, headers=response_headers)
@@ -0,0 +1,145 @@
+"""
+Pipeline d'extraction des documents déposés par les élèves.
+
+Chaque fichier uploadé est envoyé dans un pool de processus qui en extrait le
+texte brut (docx via python-docx, PDF via pypdf) et un aperçu de la première
+page. Les résultats sont stockés dans `SubmissionExtract`, indexés par
+`file_url`, pour que les correcteurs aient un aperçu immédiat et que la
+génération de scénarios puisse réutiliser le texte sans re-parser le fichier.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from ..database import SessionLocal
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+PREVIEW_MAX_CHARS = 1500
+TEXT_MAX_CHARS = 200_000
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = Lock()
+
+
+# --- Fonctions exécutées dans les processus du pool (doivent rester picklables) ---
+
+def _extract_docx(path: str) -> dict:
+    import docx
+
+    document = docx.Document(path)
+    pages = [[]]
+    for para in document.paragraphs:
+        # Les sauts de page explicites délimitent la "première page"
+        if 'w:br w:type="page"' in para._p.xml and pages[-1]:
+            pages.append([])
+        if para.text.strip():
+            pages[-1].append(para.text)
+    for table in document.tables:
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+            if cells:
+                pages[-1].append(" | ".join(cells))
+
+    return {
+        "text": "\n".join(line for page in pages for line in page),
+        "preview": "\n".join(pages[0]),
+        "page_count": len(pages),
+    }
+
+
+def _extract_pdf(path: str) -> dict:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    texts = [(page.extract_text() or "") for page in reader.pages]
+    return {
+        "text": "\n".join(texts),
+        "preview": texts[0] if texts else "",
+        "page_count": len(texts),
+    }
+
+
+def extract_text(path: str) -> str:
+    """Texte intégral d'un .docx / .pdf, sans troncature (indexation de knowledge/)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".docx":
+        return _extract_docx(path)["text"]
+    if extension == ".pdf":
+        return _extract_pdf(path)["text"]
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def extract_document(path: str) -> dict:
+    """Extrait texte et aperçu d'un fichier. Retourne un dict sérialisable."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".docx":
+        result = _extract_docx(path)
+    elif extension == ".pdf":
+        result = _extract_pdf(path)
+    else:
+        return {"status": "unsupported", "text": None, "preview": None, "page_count": None}
+
+    result["status"] = "done"
+    result["text"] = result["text"][:TEXT_MAX_CHARS]
+    result["preview"] = result["preview"].strip()[:PREVIEW_MAX_CHARS]
+    return result
+
+
+# --- Côté serveur ---
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _store_result(file_url: str, result: dict):
+    from ..models_tracking import SubmissionExtract
+
+    db = SessionLocal()
+    try:
+        extract = db.query(SubmissionExtract).filter(SubmissionExtract.file_url == file_url).first()
+        if not extract:
+            extract = SubmissionExtract(file_url=file_url)
+            db.add(extract)
+        extract.status = result.get("status", "failed")
+        extract.text = result.get("text")
+        extract.preview = result.get("preview")
+        extract.page_count = result.get("page_count")
+        extract.error = result.get("error")
+        db.commit()
+    except Exception as e:
+        print(f"❌ Extraction: impossible d'enregistrer le résultat pour {file_url}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def enqueue_extraction(file_url: str, file_path: Path):
+    """Enregistre une extraction 'pending' et la soumet au pool de processus."""
+    _store_result(file_url, {"status": "pending"})
+
+    def _on_done(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"❌ Extraction échouée pour {file_url}: {e}")
+            result = {"status": "failed", "error": str(e)[:500]}
+        _store_result(file_url, result)
+
+    future = get_executor().submit(extract_document, str(file_path))
+    future.add_done_callback(_on_done)
+    return future
@@ -0,0 +1,252 @@
+"""
+Client Gemini factice, local et déterministe (GEMINI_PROVIDER=fake).
+
+Même surface que google.genai.Client pour ce que l'application utilise :
+    client.models.generate_content(model, contents, config)
+    client.models.generate_content_stream(model, contents, config)
+    client.models.count_tokens(model, contents)
+    client.chats.create(model, config, history).send_message(message, config)
+
+Les réponses dépendent uniquement du prompt et de FAKE_GEMINI_SEED :
+- génération d'un sujet E4 : le gabarit Markdown de PROMPT_TEMPLATES présent
+  dans l'instruction système, placeholders [..] remplis ;
+- retouche : sections <<<SECTION n>>> ou document renvoyés avec une modification.
+
+Réglages (variables d'environnement) :
+    FAKE_GEMINI_LATENCY          latence moyenne d'un appel, en secondes (0.5)
+    FAKE_GEMINI_JITTER           variation +/- de la latence, en secondes (0.2)
+    FAKE_GEMINI_STREAM_INTERVAL  délai entre deux morceaux en streaming (0.02)
+    FAKE_GEMINI_ERROR_RATE       proportion d'appels en erreur, 0..1 (0)
+    FAKE_GEMINI_ERROR_CODES      codes tirés pour ces erreurs ("503,429")
+    FAKE_GEMINI_DOWN_MODELS      modèles toujours en 503 (ex: "gemini-2.0-flash")
+    FAKE_GEMINI_SEED             graine des tirages (0)
+"""
+import hashlib
+import os
+import random
+import re
+import time
+from threading import Lock
+from types import SimpleNamespace
+from typing import Iterator, List, Optional
+
+SECTION_BLOCK = re.compile(r"<<<SECTION (\d+)>>>\n(.*?)(?=\n<<<SECTION |\Z)", re.DOTALL)
+PLACEHOLDER = re.compile(r"\[([^\]\n]{2,200})\]")
+WORK_DOCUMENT = "Voici le document de travail :\n\n"
+CURRENT_CONTENT = "Voici le contenu actuel à modifier :\n\n"
+
+# Valeurs de remplissage par mot-clé du placeholder (premier trouvé)
+FILLERS = [
+    ("date", ["Mardi 14 janvier 2025", "Jeudi 6 mars 2025", "Lundi 12 mai 2025"]),
+    ("lieu", ["Showroom de l'agence de Lyon", "Bureau du client à Nantes", "Stand du salon Bâtimat"]),
+    ("nom", ["M. Durand", "Mme Lefèvre", "M. Benali"]),
+    ("identit", ["Mme Lefèvre, 45 ans, responsable achats, profil sceptique", "M. Durand, 38 ans, gérant pressé"]),
+    ("objection", ["\"Votre prix est 15 % au-dessus du concurrent.\"", "\"Je ne vois pas l'intérêt de l'option.\"", "\"Revenez vers moi au trimestre prochain.\""]),
+    ("budget", ["**Postes de Dépenses** : Location 800 €, Traiteur 600 €, Communication 400 €<br>**Total Budget demandé** : 1 800 €<br>**Objectifs attendus** : 40 participants, 12 ventes, CA de 9 000 €"]),
+    ("contrainte", ["Budget plafonné à 5 000 € HT", "Décision à valider par la direction", "Livraison exigée sous 10 jours"]),
+    ("objectif", ["Faire signer le devis avec l'option maintenance", "Obtenir un rendez-vous de démonstration"]),
+]
+
+
+class FakeGeminiError(Exception):
+    """Erreur HTTP simulée ; `code` est lu par gemini_service.is_retryable comme pour google.genai"""
+    def __init__(self, code: int, message: str = "Fake Gemini error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def _text(contents) -> str:
+    """Texte d'un contenu : chaîne, liste, ContentDict {'role', 'parts': [{'text'}]} ou objet Content"""
+    if contents is None:
+        return ""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, dict):
+        return "\n".join(_text(part.get("text") if isinstance(part, dict) else part) for part in contents.get("parts", []))
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_text(part) for part in contents)
+    parts = getattr(contents, "parts", None)
+    if parts is not None:
+        return "\n".join(getattr(part, "text", "") or "" for part in parts)
+    return str(getattr(contents, "text", contents))
+
+
+def _tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _response(text: str, prompt: str) -> SimpleNamespace:
+    usage = SimpleNamespace(
+        prompt_token_count=_tokens(prompt),
+        candidates_token_count=_tokens(text),
+        total_token_count=_tokens(prompt) + _tokens(text),
+    )
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+def _revise(markdown: str, instruction: str) -> str:
+    """Modification visible et déterministe : dernière ligne de tableau annotée, sinon note ajoutée"""
+    lines = markdown.rstrip("\n").split("\n")
+    for i in range(len(lines) - 1, -1, -1):
+        line = lines[i].rstrip()
+        if line.startswith("|") and line.endswith("|") and not set(line) <= set("|:- "):
+            lines[i] = line[:-1].rstrip() + " (révisé) |"
+            return "\n".join(lines)
+    return "\n".join(lines) + f"\n\n_Modification : {instruction}_"
+
+
+class FakeModels:
+    def __init__(self, client: "FakeGeminiClient"):
+        self._client = client
+
+    def generate_content(self, model: str, contents, config=None):
+        return self._client.respond(model, config, _text(contents))
+
+    def generate_content_stream(self, model: str, contents, config=None) -> Iterator[SimpleNamespace]:
+        response = self._client.respond(model, config, _text(contents))
+        text = response.text
+        for start in range(0, len(text), 200):
+            if start:
+                time.sleep(self._client.stream_interval)
+            yield _response(text[start:start + 200], "")
+
+    def count_tokens(self, model: str, contents, config=None):
+        return SimpleNamespace(total_tokens=_tokens(_text(contents)))
+
+
+class FakeChat:
+    def __init__(self, client: "FakeGeminiClient", model: str, config, history):
+        self._client = client
+        self._model = model
+        self._config = config
+        self._history: List[str] = [_text(turn) for turn in history or []]
+
+    def send_message(self, message, config=None):
+        message = _text(message)
+        response = self._client.respond(self._model, config or self._config, message, history=self._history)
+        self._history += [message, response.text]
+        return response
+
+    def get_history(self):
+        return list(self._history)
+
+
+class FakeChats:
+    def __init__(self, client: "FakeGeminiClient"):
+        self._client = client
+
+    def create(self, model: str, config=None, history=None):
+        return FakeChat(self._client, model, config, history)
+
+
+class FakeGeminiClient:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, stream_interval: float = 0.02,
+                 error_rate: float = 0.0, error_codes=(503, 429), down_models=(), seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.stream_interval = stream_interval
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes) or (503,)
+        self.down_models = set(down_models)
+        self.seed = seed
+        self.calls = 0
+        self._faults = random.Random(seed)  # Séquence d'erreurs reproductible d'un run à l'autre
+        self._lock = Lock()
+        self.models = FakeModels(self)
+        self.chats = FakeChats(self)
+
+    @classmethod
+    def from_env(cls) -> "FakeGeminiClient":
+        def codes(value):
+            return [int(code) for code in value.split(",") if code.strip()]
+        return cls(
+            latency=float(os.getenv("FAKE_GEMINI_LATENCY", "0.5")),
+            jitter=float(os.getenv("FAKE_GEMINI_JITTER", "0.2")),
+            stream_interval=float(os.getenv("FAKE_GEMINI_STREAM_INTERVAL", "0.02")),
+            error_rate=float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0")),
+            error_codes=codes(os.getenv("FAKE_GEMINI_ERROR_CODES", "503,429")),
+            down_models=[m.strip() for m in os.getenv("FAKE_GEMINI_DOWN_MODELS", "").split(",") if m.strip()],
+            seed=int(os.getenv("FAKE_GEMINI_SEED", "0")),
+        )
+
+    def respond(self, model: str, config, prompt: str, history: Optional[List[str]] = None) -> SimpleNamespace:
+        system = getattr(config, "system_instruction", None) or ""
+        rng = random.Random(hashlib.sha256(f"{self.seed}|{model}|{system}|{prompt}".encode("utf-8")).digest())
+        with self._lock:
+            self.calls += 1
+            fault = self._faults.random() < self.error_rate
+            fault_code = self._faults.choice(self.error_codes)
+
+        delay = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        http_options = getattr(config, "http_options", None)
+        timeout = getattr(http_options, "timeout", None)
+        if timeout is not None and delay > timeout / 1000:
+            time.sleep(timeout / 1000)
+            raise TimeoutError(f"Fake Gemini: timed out after {timeout} ms")
+        time.sleep(delay)
+
+        if model in self.down_models:
+            raise FakeGeminiError(503, f"{model} unavailable")
+        if fault:
+            raise FakeGeminiError(fault_code, "injected error")
+        text = self.compose(system, prompt, history or [], rng)
+        return _response(text, system + prompt)
+
+    def compose(self, system: str, prompt: str, history: List[str], rng: random.Random) -> str:
+        instruction = re.search(r'Instruction de modification : "(.*?)"', prompt, re.DOTALL)
+        instruction = instruction.group(1) if instruction else ""
+
+        sections = SECTION_BLOCK.findall(prompt)
+        if sections:
+            return "\n".join(f"<<<SECTION {n}>>>\n{_revise(body.strip(), instruction)}" for n, body in sections)
+        if CURRENT_CONTENT in prompt:
+            return _revise(prompt.split(CURRENT_CONTENT, 1)[1], instruction)
+        if instruction or "document complet" in prompt:
+            return _revise(self._latest_document(history), instruction)
+        if "FICHE SUJET" in system and "---" in system:
+            return self._scenario(system, prompt, rng)
+        if "Fiche d'Activité Professionnelle E4" in system:
+            return self._fiche(rng)
+        return f"Réponse simulée ({rng.randint(1000, 9999)})."
+
+    def _latest_document(self, history: List[str]) -> str:
+        """Dernier document complet de la conversation (réponse du modèle ou document de départ)"""
+        for turn in reversed(history):
+            if turn.startswith(WORK_DOCUMENT):
+                return turn[len(WORK_DOCUMENT):]
+            if "|" in turn and "<<<SECTION" not in turn and len(turn) > 200:
+                return turn
+        return ""
+
+    def _scenario(self, system: str, prompt: str, rng: random.Random) -> str:
+        """Gabarit Markdown du template (après la première ligne ---), placeholders remplis"""
+        template = system.split("\n---\n", 1)[1]
+        topic = re.search(r"\*\*Thème\*\* : (.*)", prompt)
+        company = (topic.group(1).strip() if topic else "Entreprise")[:40]
+
+        offset, used = rng.randrange(1000), {}
+
+        def fill(match):
+            hint = match.group(1)
+            lowered = hint.lower()
+            for keyword, values in FILLERS:
+                if keyword in lowered:
+                    # Valeurs parcourues à tour de rôle : trois objections différentes, pas la même trois fois
+                    used[keyword] = used.get(keyword, -1) + 1
+                    return values[(offset + used[keyword]) % len(values)]
+            if lowered.startswith("idem"):
+                return "Voir fiche candidat"
+            return f"{company} — {hint.split(':')[0].strip().rstrip('.')}"
+
+        filename = re.sub(r"[^A-Za-z0-9]+", "_", company).strip("_")[:30] or "Sujet"
+        return f"<!-- FILENAME: {filename} -->\n" + PLACEHOLDER.sub(fill, template).strip() + "\n"
+
+    def _fiche(self, rng: random.Random) -> str:
+        return (
+            "**Titre de la fiche** : Négociation d'un contrat de maintenance\n\n"
+            f"**Contexte** : PME de {rng.randint(10, 80)} salariés, cible professionnels du BTP.\n\n"
+            "**Analyse de la situation** : Besoin de fiabiliser le parc matériel.\n\n"
+            "**Déroulement de la négociation** : Découverte, argumentation CAP, traitement des objections prix.\n\n"
+            "**Résultats** : [A COMPLÉTER]\n\n"
+            "**Analyse Réflexive** : Mieux préparer la reformulation.\n"
+        )
@@ -1,9 +1,17 @@
 
 import os
-from google import genai
-from google.genai import types
+import random
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import Callable, List, Optional, Sequence
 from dotenv import load_dotenv
 from pathlib import Path
+from .metrics import record_gemini_call, record_gemini_usage
+
+# google.genai (~0.5 s d'import) n'est importé qu'à la première génération :
+# voir GeminiService.client et les imports locaux de `types` ci-dessous.
 
 # Load env vars safely by finding the backend root (2 levels up from services)
 env_path = Path(__file__).resolve().parent.parent.parent / '.env'
@@ -33,21 +41,193 @@ CONSIGNE : Ne jamais inventer de modalités d'examen. Si une demande de l'utilis
     # Other tracks can be added here
 }
 
+# Modèles et résilience des appels
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "gemini-1.5-flash")  # "" : pas de repli
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")  # ex: serveur Gemini factice local pour les tests
+GEMINI_PROVIDER = os.getenv("GEMINI_PROVIDER", "google")  # 'google' | 'fake' (hors ligne, voir fake_gemini.py)
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))  # secondes, par tentative
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", "60"))  # secondes, toutes tentatives et modèles confondus
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))  # par modèle
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))  # échecs consécutifs avant ouverture
+GEMINI_BREAKER_RESET = float(os.getenv("GEMINI_BREAKER_RESET", "30"))  # secondes avant une tentative de sonde
+
+MODEL_CACHE_SIZE = 64  # modèles (instruction système complète) gardés par GeminiService.get_model
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+class GeminiUnavailable(Exception):
+    """Gemini indisponible (circuit ouvert, délai dépassé ou erreurs répétées) : à traduire en 503"""
+    def __init__(self, message: str, retry_after: float = GEMINI_BREAKER_RESET):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    closed : les appels passent ; open : échec immédiat pendant reset_timeout ;
+    half_open : un seul appel de sonde, qui referme ou rouvre le circuit.
+    """
+    def __init__(self, name: str, failure_threshold: int = GEMINI_BREAKER_FAILURES, reset_timeout: float = GEMINI_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"🔌 Gemini circuit {self.name} ouvert ({self.failures} échecs)")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+_breakers = {}
+_breakers_lock = Lock()
+
+def get_breaker(model_name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if model_name not in _breakers:
+            _breakers[model_name] = CircuitBreaker(model_name)
+        return _breakers[model_name]
+
+def is_retryable(error: Exception) -> bool:
+    """429 / 5xx / délais et erreurs réseau ; les autres 4xx sont des erreurs de la requête"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    import httpx
+    return isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError))
+
+def backoff_delay(attempt: int) -> float:
+    """Backoff exponentiel avec jitter complet"""
+    return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+
+def call_gemini(call: Callable[[str, float], object], models: Sequence[str], deadline: float = GEMINI_DEADLINE):
+    """
+    call(model_name, timeout_s) avec tentatives, backoff, circuit par modèle et
+    repli sur les modèles suivants. Lève GeminiUnavailable si rien n'a abouti.
+    """
+    start = time.monotonic()
+    last_error: Optional[Exception] = None
+    retry_after = GEMINI_BREAKER_RESET
+    for model_name in models:
+        breaker = get_breaker(model_name)
+        for attempt in range(GEMINI_MAX_ATTEMPTS):
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                raise GeminiUnavailable(f"Gemini: délai de {deadline:.0f} s dépassé", retry_after=1) from last_error
+            if not breaker.allow():
+                retry_after = min(retry_after, breaker.retry_after)
+                break
+            started = time.monotonic()
+            try:
+                response = call(model_name, min(GEMINI_TIMEOUT, remaining))
+            except Exception as e:
+                if not is_retryable(e):
+                    # Gemini a répondu : le service est joignable, l'erreur vient de la requête
+                    record_gemini_call(model_name, "error", time.monotonic() - started)
+                    breaker.record_success()
+                    raise
+                record_gemini_call(model_name, "retryable_error", time.monotonic() - started)
+                breaker.record_failure()
+                last_error = e
+                print(f"⚠️ Gemini {model_name} tentative {attempt + 1}/{GEMINI_MAX_ATTEMPTS} échouée: {e}")
+                delay = backoff_delay(attempt)
+                if attempt + 1 < GEMINI_MAX_ATTEMPTS and delay < deadline - (time.monotonic() - start):
+                    time.sleep(delay)
+                continue
+            record_gemini_call(model_name, "ok", time.monotonic() - started)
+            record_gemini_usage(model_name, response)
+            breaker.record_success()
+            if model_name != models[0]:
+                print(f"↪️ Gemini: réponse du modèle de repli {model_name}")
+            return response
+    raise GeminiUnavailable(f"Gemini indisponible ({last_error or 'circuit ouvert'})", retry_after=retry_after) from last_error
+
+def request_config(system_instruction: str, timeout: float):
+    return _request_config(system_instruction, int(timeout * 1000))
+
+@lru_cache(maxsize=128)
+def _request_config(system_instruction: str, timeout_ms: int):
+    # Partagé entre requêtes : la plupart des appels ont la même instruction et le délai par défaut
+    from google.genai import types
+    return types.GenerateContentConfig(
+        system_instruction=system_instruction,
+        http_options=types.HttpOptions(timeout=timeout_ms)
+    )
+
+# Estimation locale (~4 caractères par token pour Gemini) : pas d'appel réseau par requête.
+# count_tokens(exact=True) interroge l'API quand un chiffre exact est nécessaire.
+CHARS_PER_TOKEN = 4
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "30000"))
+
+def estimate_tokens(contents) -> int:
+    """Taille approximative d'un texte ou d'une liste de textes, en tokens"""
+    if contents is None:
+        return 0
+    if isinstance(contents, str):
+        return (len(contents) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return sum(estimate_tokens(part) for part in contents if isinstance(part, str))
+
 class LegacyCompatibleModel:
     """Wraps the new google-genai Client to mimic the old GenerativeModel behavior."""
-    def __init__(self, client: genai.Client, model_name: str, system_instruction: str):
+    def __init__(self, client, model_name: str, system_instruction: str, fallback_models: Sequence[str] = ()):
         self.client = client
         self.model_name = model_name
         self.system_instruction = system_instruction
+        self.fallback_models = [m for m in fallback_models if m and m != model_name]
+
+    def count_tokens(self, contents, exact: bool = False) -> int:
+        """Taille du prompt complet (instruction système comprise)"""
+        if exact and self.client is not None:
+            try:
+                system = self.client.models.count_tokens(model=self.model_name, contents=self.system_instruction)
+                prompt = self.client.models.count_tokens(model=self.model_name, contents=contents)
+                return system.total_tokens + prompt.total_tokens
+            except Exception as e:
+                print(f"⚠️ Gemini count_tokens failed, using estimate: {e}")
+        return estimate_tokens(self.system_instruction) + estimate_tokens(contents)
 
     def generate_content(self, contents):
-        config = types.GenerateContentConfig(system_instruction=self.system_instruction)
+        prompt_tokens = self.count_tokens(contents)
+        if prompt_tokens > PROMPT_TOKEN_BUDGET:
+            print(f"⚠️ Gemini prompt ~{prompt_tokens} tokens exceeds budget {PROMPT_TOKEN_BUDGET}")
         try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=contents,
-                config=config
+            response = call_gemini(
+                lambda model_name, timeout: self.client.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=request_config(self.system_instruction, timeout)
+                ),
+                [self.model_name] + self.fallback_models
             )
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                print(f"🔢 Gemini {self.model_name}: prompt {usage.prompt_token_count} tokens (estimé {prompt_tokens}), réponse {usage.candidates_token_count}")
             return response
         except Exception as e:
             print(f"❌ Gemini generate_content failed: {e}")
@@ -58,8 +238,10 @@ class LegacyCompatibleModel:
 
 class LegacyCompatibleChat:
     def __init__(self, client, model_name, system_instruction, history):
+        from google.genai import types
         self.client = client
         self.model_name = model_name
+        self.system_instruction = system_instruction
         self.config = types.GenerateContentConfig(system_instruction=system_instruction)
         self.chat = self.client.chats.create(
             model=model_name,
@@ -68,45 +250,99 @@ class LegacyCompatibleChat:
         )
 
     def send_message(self, message):
-        return self.chat.send_message(message)
+        # Pas de repli de modèle : l'historique appartient au chat de ce modèle
+        return call_gemini(
+            lambda model_name, timeout: self.chat.send_message(message, config=request_config(self.system_instruction, timeout)),
+            [self.model_name]
+        )
+
+def google_client():
+    """Client google-genai (None sans clé ni GEMINI_BASE_URL)"""
+    if not (API_KEY or GEMINI_BASE_URL):
+        return None
+    from google import genai
+    from google.genai import types
+    http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+    return genai.Client(api_key=API_KEY or "local", http_options=http_options)
+
+def fake_client():
+    """Client local déterministe, pour le développement hors ligne et les tests de charge"""
+    from .fake_gemini import FakeGeminiClient
+    return FakeGeminiClient.from_env()
+
+# Fournisseurs : fabrique d'un objet ayant la surface de google.genai.Client utilisée ici
+PROVIDERS = {
+    "google": google_client,
+    "fake": fake_client,
+}
 
 class GeminiService:
     def __init__(self):
         self._model_name = None
-        self.client = None
-        if not API_KEY:
+        self._client = None
+        self._client_lock = Lock()
+        self._models: "OrderedDict[tuple, LegacyCompatibleModel]" = OrderedDict()
+        self._models_lock = Lock()
+        if GEMINI_PROVIDER not in PROVIDERS:
+            print(f"❌ Unknown GEMINI_PROVIDER '{GEMINI_PROVIDER}', expected one of {sorted(PROVIDERS)}")
+        elif GEMINI_PROVIDER != "google":
+            print(f"🧪 Gemini provider: {GEMINI_PROVIDER}")
+        elif not API_KEY:
              print("⚠️ WARNING: GOOGLE_API_KEY is missing. Gemini features will fail.")
-             return
-        
-        try:
-            self.client = genai.Client(api_key=API_KEY)
-        except Exception as e:
-            print(f"❌ Gemini config failed: {e}")
+
+    @property
+    def client(self):
+        """Client du fournisseur GEMINI_PROVIDER, créé (et importé) à la première utilisation"""
+        if self._client is None and GEMINI_PROVIDER in PROVIDERS:
+            with self._client_lock:
+                if self._client is None:
+                    try:
+                        self._client = PROVIDERS[GEMINI_PROVIDER]()
+                    except Exception as e:
+                        print(f"❌ Gemini config failed: {e}")
+        return self._client
 
     @property
     def model_name(self):
-        if self._model_name:
-            return self._model_name
-        
-        try:
-            # Simple fallback for now since list call might fail if not authenticated
-            self._model_name = "gemini-2.0-flash" 
-        except Exception as e:
-             self._model_name = "gemini-1.5-flash"
-        
-        return self._model_name
+        return self._model_name or GEMINI_MODEL
+
+    def get_model(self, custom_system_instruction: str = "", track: str = "NDRC", cache: bool = True):
+        """
+        Returns a LegacyCompatibleModel with regulatory grounding and custom instructions.
+        Models for static instructions (templates, refine prompts) are built once and reused;
+        pass cache=False when the instruction embeds per-request values.
+        """
+        key = (track, custom_system_instruction)
+        if cache:
+            with self._models_lock:
+                model = self._models.get(key)
+                if model is not None:
+                    self._models.move_to_end(key)
+                    return model
 
-    def get_model(self, custom_system_instruction: str = "", track: str = "NDRC"):
-        """Returns a LegacyCompatibleModel with regulatory grounding and custom instructions."""
         grounding = REGULATORY_GROUNDINGS.get(track, REGULATORY_GROUNDINGS["NDRC"])
         full_system_instruction = grounding
         if custom_system_instruction:
             full_system_instruction += "\n" + custom_system_instruction
         
-        return LegacyCompatibleModel(
+        model = LegacyCompatibleModel(
             client=self.client,
             model_name=self.model_name,
-            system_instruction=full_system_instruction
+            system_instruction=full_system_instruction,
+            fallback_models=[GEMINI_FALLBACK_MODEL]
         )
+        if cache and model.client is not None:
+            with self._models_lock:
+                self._models[key] = model
+                while len(self._models) > MODEL_CACHE_SIZE:
+                    self._models.popitem(last=False)
+        return model
+
+_gemini_service = None
 
-gemini_service = GeminiService()
+def get_gemini_service() -> GeminiService:
+    """Instance partagée (construite dans le lifespan de l'app, ou au premier appel)"""
+    global _gemini_service
+    if _gemini_service is None:
+        _gemini_service = GeminiService()
+    return _gemini_service
@@ -0,0 +1,252 @@
+"""
+File d'attente équitable devant Gemini.
+
+- Seaux à jetons : un par utilisateur (GENERATION_USER_RATE / min) et un global
+  (GENERATION_GLOBAL_RATE / min, le quota de l'API).
+- Au plus GENERATION_CONCURRENCY appels Gemini simultanés.
+- Les demandes en attente sont servies à tour de rôle entre utilisateurs : un
+  professeur qui lance 40 générations passe une fois par tour, pas 40 fois de suite.
+- Chaque demande en attente occupe un thread du threadpool (40 par défaut) : la
+  file est bornée (GENERATION_QUEUE_MAX au total, GENERATION_USER_QUEUE_MAX par
+  utilisateur) et une demande dont l'attente estimée dépasse GENERATION_QUEUE_TIMEOUT
+  est refusée tout de suite (429 avec sa position) au lieu de bloquer un thread.
+
+Usage (handlers synchrones, donc dans le threadpool) :
+    with get_scheduler().slot(client_key):
+        model.generate_content(...)
+"""
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from threading import Condition
+from typing import Dict, List, Optional
+
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+GENERATION_USER_RATE = float(os.getenv("GENERATION_USER_RATE", "6"))  # générations par minute et par utilisateur
+GENERATION_USER_BURST = float(os.getenv("GENERATION_USER_BURST", "3"))
+GENERATION_GLOBAL_RATE = float(os.getenv("GENERATION_GLOBAL_RATE", "30"))  # générations par minute, tous utilisateurs
+GENERATION_GLOBAL_BURST = float(os.getenv("GENERATION_GLOBAL_BURST", "10"))
+GENERATION_USER_QUEUE_MAX = int(os.getenv("GENERATION_USER_QUEUE_MAX", "2"))  # demandes en attente par utilisateur
+GENERATION_QUEUE_MAX = int(os.getenv("GENERATION_QUEUE_MAX", "16"))  # demandes en attente au total, bien en dessous du threadpool
+GENERATION_QUEUE_TIMEOUT = float(os.getenv("GENERATION_QUEUE_TIMEOUT", "120"))  # secondes d'attente maximum
+BUCKET_PRUNE_INTERVAL = 60.0  # secondes entre deux purges des seaux inactifs
+
+
+class GenerationRejected(Exception):
+    """File pleine ou attente trop longue : à traduire en 429 avec Retry-After"""
+    def __init__(self, message: str, retry_after: float, position: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.position = position  # place qu'aurait eue la demande dans la file
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """0 si un jeton est disponible, sinon délai avant le prochain"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class Ticket:
+    def __init__(self, key: str):
+        self.key = key
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class FairScheduler:
+    def __init__(self, concurrency: int = GENERATION_CONCURRENCY,
+                 user_rate: float = GENERATION_USER_RATE, user_burst: float = GENERATION_USER_BURST,
+                 global_rate: float = GENERATION_GLOBAL_RATE, global_burst: float = GENERATION_GLOBAL_BURST,
+                 user_queue_max: int = GENERATION_USER_QUEUE_MAX, queue_max: int = GENERATION_QUEUE_MAX,
+                 queue_timeout: float = GENERATION_QUEUE_TIMEOUT):
+        self.concurrency = concurrency
+        self.user_rate, self.user_burst = user_rate, user_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.user_queue_max = user_queue_max
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.active_by_key: Dict[str, int] = {}
+        self.avg_duration = 20.0  # moyenne glissante d'un appel, pour estimer l'attente
+        # Ordre du tourniquet : l'utilisateur servi passe en fin de liste
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._pruned_at = time.monotonic()
+        self._cond = Condition()
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def _prune_buckets(self, now: float):
+        """Oublie les seaux pleins des utilisateurs sans demande en cours : un seau plein vaut un seau neuf"""
+        if now - self._pruned_at < BUCKET_PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        for key in [key for key, bucket in self._buckets.items()
+                    if key not in self._queues and key not in self.active_by_key and bucket.is_full(now)]:
+            del self._buckets[key]
+
+    def _dispatch(self) -> float:
+        """Attribue les places libres à tour de rôle ; renvoie le délai avant le prochain jeton utile"""
+        now = time.monotonic()
+        next_wake = float("inf")
+        while self.active < self.concurrency and self._queues:
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                return global_wait
+            chosen = None
+            for key in self._queues:
+                wait = self._bucket(key).wait_time(now)
+                if wait == 0:
+                    chosen = key
+                    break
+                next_wake = min(next_wake, wait)
+            if chosen is None:
+                return next_wake
+            queue = self._queues.pop(chosen)
+            ticket = queue.popleft()
+            if queue:
+                self._queues[chosen] = queue  # Réinséré en fin de tour
+            self._bucket(chosen).take()
+            self.global_bucket.take()
+            ticket.granted = True
+            self.active += 1
+            self.active_by_key[chosen] = self.active_by_key.get(chosen, 0) + 1
+            self._cond.notify_all()
+        return next_wake
+
+    def _position(self, ticket: Ticket) -> int:
+        """Nombre de demandes servies avant celle-ci (à tour de rôle)"""
+        queue = self._queues.get(ticket.key)
+        if queue is None or ticket not in queue:
+            return 0
+        rank = queue.index(ticket)
+        position, before = rank, True
+        for key, other in self._queues.items():
+            if key == ticket.key:
+                before = False
+                continue
+            # Les utilisateurs placés avant dans le tour passent une fois de plus
+            position += min(len(other), rank + 1 if before else rank)
+        return position
+
+    def acquire(self, key: str) -> Ticket:
+        ticket = Ticket(key)
+        deadline = ticket.enqueued_at + self.queue_timeout
+        with self._cond:
+            self._prune_buckets(ticket.enqueued_at)
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+            queue.append(ticket)
+            self._dispatch()
+            if not ticket.granted:
+                # Refus immédiat plutôt qu'un thread bloqué jusqu'au délai maximum
+                position = self._position(ticket)
+                wait = self.estimated_wait(position)
+                reason = None
+                if len(queue) > self.user_queue_max:
+                    reason = "Trop de générations en attente pour ce compte"
+                elif self.queued() > self.queue_max or wait > self.queue_timeout:
+                    reason = "File de génération saturée, réessayez plus tard"
+                if reason:
+                    self._remove(ticket)
+                    raise GenerationRejected(reason, retry_after=wait, position=position + 1)
+            while True:
+                next_wake = self._dispatch()
+                if ticket.granted:
+                    return ticket
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    position = self._position(ticket)
+                    self._remove(ticket)
+                    raise GenerationRejected("File de génération saturée, réessayez plus tard",
+                                             retry_after=self.estimated_wait(position), position=position + 1)
+                self._cond.wait(timeout=min(next_wake, remaining))
+
+    def _remove(self, ticket: Ticket):
+        queue = self._queues.get(ticket.key)
+        if queue is not None:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.key]
+
+    def release(self, ticket: Ticket, duration: float):
+        with self._cond:
+            self.active -= 1
+            self.active_by_key[ticket.key] -= 1
+            if not self.active_by_key[ticket.key]:
+                del self.active_by_key[ticket.key]
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, key: str):
+        ticket = self.acquire(key)
+        started = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, time.monotonic() - started)
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def estimated_wait(self, position: int) -> float:
+        return round((position // max(1, self.concurrency) + 1) * self.avg_duration, 1)
+
+    def status(self, key: Optional[str] = None) -> dict:
+        """État de la file ; avec key, la position de chacune des demandes de ce client"""
+        with self._cond:
+            mine: List[dict] = []
+            now = time.monotonic()
+            for ticket in self._queues.get(key, ()) if key else ():
+                position = self._position(ticket)
+                mine.append({
+                    "position": position + 1,
+                    "waiting_s": round(now - ticket.enqueued_at, 1),
+                    "estimated_wait_s": self.estimated_wait(position),
+                })
+            return {
+                "active": self.active,
+                "concurrency": self.concurrency,
+                "queued": self.queued(),
+                "users_waiting": len(self._queues),
+                "running": self.active_by_key.get(key, 0) if key else None,
+                "mine": mine,
+            }
+
+
+_scheduler = None
+
+
+def get_scheduler() -> FairScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FairScheduler()
+    return _scheduler
@@ -0,0 +1,323 @@
+"""
+Index de recherche BM25 sur les documents de knowledge/ (circulaires, référentiels).
+
+L'index est construit hors ligne (build_knowledge_index.py) et écrit sur disque :
+    <KNOWLEDGE_INDEX_DIR>/CURRENT          nom de la génération active
+    <KNOWLEDGE_INDEX_DIR>/gen-<n>/meta.json    vocabulaire, passages, fichiers sources
+    <KNOWLEDGE_INDEX_DIR>/gen-<n>/postings.bin paires uint32 (passage, fréquence) par terme
+    <KNOWLEDGE_INDEX_DIR>/gen-<n>/texts.bin    texte UTF-8 des passages, bout à bout
+
+postings.bin et texts.bin sont ouverts en mmap : le démarrage ne lit que
+meta.json, et une requête ne touche que les listes des termes recherchés.
+Une nouvelle génération est écrite à côté de l'active puis publiée en
+remplaçant CURRENT (os.replace, atomique).
+
+update_index() est incrémental : seuls les documents dont la taille, le
+mtime puis le sha256 ont changé sont ré-extraits ; les passages des autres
+sont repris de la génération active.
+"""
+import fcntl
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import unicodedata
+from array import array
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+INDEX_FORMAT = 1
+K1 = 1.5
+B = 0.75
+CHUNK_WORDS = 150
+CHUNK_OVERLAP = 30
+SUPPORTED_EXTENSIONS = (".docx", ".pdf", ".txt", ".md")
+GENERAL_CATEGORY = "general"  # Fichiers à la racine de knowledge/ : valables pour toutes les filières
+
+STOPWORDS = frozenset("""
+au aux avec ce ces dans de des du elle en et eux il ils je la le les leur lui ma mais me meme mes moi mon ne nos
+notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre vous est sont
+ete etre avoir a ont cette cet leurs dont plus ainsi si tout tous toutes sans sous entre doit peut
+""".split())
+_TOKEN = re.compile(r"[a-z0-9]{2,}")
+
+
+def tokenize(text: str) -> List[str]:
+    """Minuscules, sans accents, sans mots vides"""
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [token for token in _TOKEN.findall(text) if token not in STOPWORDS]
+
+
+def chunk_text(text: str) -> List[str]:
+    """Fenêtres de CHUNK_WORDS mots qui se chevauchent de CHUNK_OVERLAP mots"""
+    words = text.split()
+    if not words:
+        return []
+    step = CHUNK_WORDS - CHUNK_OVERLAP
+    return [" ".join(words[i:i + CHUNK_WORDS]) for i in range(0, max(len(words) - CHUNK_OVERLAP, 1), step)]
+
+
+def file_category(relative_path: str) -> str:
+    """knowledge/NDRC/circulaire.pdf -> 'NDRC' ; knowledge/guide.pdf -> 'general'"""
+    parts = Path(relative_path).parts
+    return parts[0] if len(parts) > 1 else GENERAL_CATEGORY
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_documents(knowledge_dir: Path) -> Dict[str, dict]:
+    """Documents indexables : chemin relatif -> {mtime, size}"""
+    documents = {}
+    for path in sorted(knowledge_dir.rglob("*")):
+        if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS and not path.name.startswith((".", "~$")):
+            stat = path.stat()
+            documents[path.relative_to(knowledge_dir).as_posix()] = {"mtime": stat.st_mtime, "size": stat.st_size}
+    return documents
+
+
+def read_chunks(path: Path) -> List[str]:
+    from .extraction_service import extract_text
+    return chunk_text(extract_text(str(path)))
+
+
+# --- Écriture ---
+
+def write_generation(index_root: Path, files: Dict[str, dict], chunks_by_file: Dict[str, List[str]]) -> str:
+    """
+    Écrit une nouvelle génération d'index et la publie.
+    files : chemin relatif -> {mtime, size, sha256} ; chunks_by_file : chemin relatif -> passages.
+    """
+    index_root.mkdir(parents=True, exist_ok=True)
+    current = read_current(index_root)
+    number = int(current.split("-")[1]) + 1 if current else 1
+    name = f"gen-{number}"
+    generation_dir = index_root / name
+    if generation_dir.exists():
+        shutil.rmtree(generation_dir)
+    generation_dir.mkdir()
+
+    chunks, postings = [], defaultdict(list)
+    texts = bytearray()
+    for relative_path in sorted(chunks_by_file):
+        category = file_category(relative_path)
+        first = len(chunks)
+        for text in chunks_by_file[relative_path]:
+            chunk_id = len(chunks)
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                postings[term].append((chunk_id, tf))
+            encoded = text.encode("utf-8")
+            chunks.append([relative_path, category, sum(counts.values()), len(texts), len(encoded)])
+            texts += encoded
+        files[relative_path]["chunks"] = [first, len(chunks)]
+
+    vocabulary, flat = {}, array("I")
+    for term in sorted(postings):
+        entries = postings[term]
+        vocabulary[term] = [len(flat) // 2, len(entries)]
+        for chunk_id, tf in entries:
+            flat.append(chunk_id)
+            flat.append(tf)
+
+    total_length = sum(chunk[2] for chunk in chunks)
+    meta = {
+        "format": INDEX_FORMAT,
+        "avgdl": total_length / len(chunks) if chunks else 0.0,
+        "files": files,
+        "chunks": chunks,  # [fichier, catégorie, longueur en tokens, offset texte, taille texte]
+        "vocabulary": vocabulary,  # terme -> [offset dans postings (en paires), nombre de passages]
+    }
+    with open(generation_dir / "postings.bin", "wb") as f:
+        flat.tofile(f)
+    with open(generation_dir / "texts.bin", "wb") as f:
+        f.write(texts)
+    with open(generation_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    publish(index_root, name)
+    return name
+
+
+def publish(index_root: Path, name: str):
+    """Bascule atomique vers la génération `name`, puis suppression des anciennes"""
+    previous = read_current(index_root)
+    tmp = index_root / "CURRENT.tmp"
+    tmp.write_text(name)
+    os.replace(tmp, index_root / "CURRENT")
+    # La génération précédente est gardée : un worker qui vient de lire l'ancien
+    # CURRENT peut encore l'ouvrir. Les plus anciennes restent lisibles (mmap)
+    # par ceux qui les ont déjà ouvertes.
+    for old in index_root.glob("gen-*"):
+        if old.name not in (name, previous):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def read_current(index_root: Path) -> Optional[str]:
+    try:
+        return (index_root / "CURRENT").read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def writer_lock(index_root: Path):
+    """Un seul processus (worker, script) écrit une génération à la fois"""
+    index_root.mkdir(parents=True, exist_ok=True)
+    with open(index_root / ".lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_index(knowledge_dir: Path, index_root: Path) -> dict:
+    """Reconstruction complète : extrait et découpe tous les documents"""
+    with writer_lock(index_root):
+        files, chunks_by_file = {}, {}
+        for relative_path, info in scan_documents(knowledge_dir).items():
+            path = knowledge_dir / relative_path
+            try:
+                chunks_by_file[relative_path] = read_chunks(path)
+            except Exception as e:
+                print(f"❌ Knowledge: lecture impossible de {relative_path}: {e}")
+                continue
+            files[relative_path] = {**info, "sha256": file_sha256(path)}
+        name = write_generation(index_root, files, chunks_by_file)
+    return {"generation": name, "files": len(files), "chunks": sum(len(c) for c in chunks_by_file.values())}
+
+
+def update_index(knowledge_dir: Path, index_root: Path) -> dict:
+    """
+    Mise à jour incrémentale. Ne publie une génération que si un document a été
+    ajouté, modifié ou supprimé ; generation vaut None sinon.
+    """
+    with writer_lock(index_root):
+        try:
+            current = open_current(index_root)
+        except Exception as e:
+            print(f"❌ Knowledge: index actif illisible ({e}), reconstruction complète")
+            current = None
+        previous = current.files if current else {}
+
+        files, chunks_by_file = {}, {}
+        added, changed, touched = [], [], 0
+        for relative_path, info in scan_documents(knowledge_dir).items():
+            path = knowledge_dir / relative_path
+            known = previous.get(relative_path)
+            if known and known["size"] == info["size"] and known["mtime"] == info["mtime"]:
+                files[relative_path] = dict(known)
+                chunks_by_file[relative_path] = current.file_chunks(relative_path)
+                continue
+            digest = file_sha256(path)
+            if known and known["sha256"] == digest:
+                # Copié ou touché sans modification : passages repris tels quels
+                files[relative_path] = {**known, **info}
+                chunks_by_file[relative_path] = current.file_chunks(relative_path)
+                touched += 1
+                continue
+            try:
+                chunks_by_file[relative_path] = read_chunks(path)
+            except Exception as e:
+                print(f"❌ Knowledge: lecture impossible de {relative_path}: {e}")
+                continue
+            files[relative_path] = {**info, "sha256": digest}
+            (changed if known else added).append(relative_path)
+        removed = [relative_path for relative_path in previous if relative_path not in files]
+
+        stats = {"generation": None, "added": added, "changed": changed, "removed": removed,
+                 "files": len(files), "chunks": sum(len(c) for c in chunks_by_file.values())}
+        if current is not None and not (added or changed or removed or touched):
+            return stats
+        stats["generation"] = write_generation(index_root, files, chunks_by_file)
+    return stats
+
+
+# --- Lecture ---
+
+def _map(path: Path):
+    if path.stat().st_size == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class KnowledgeIndex:
+    """Génération d'index ouverte en lecture (immuable)"""
+    def __init__(self, generation_dir: Path):
+        self.generation = generation_dir.name
+        with open(generation_dir / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Format d'index {meta.get('format')} non supporté")
+        self.files = meta["files"]
+        self.chunks = meta["chunks"]
+        self.vocabulary = meta["vocabulary"]
+        self.avgdl = meta["avgdl"] or 1.0
+        self._postings = _map(generation_dir / "postings.bin")
+        self._texts = _map(generation_dir / "texts.bin")
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def text(self, chunk_id: int) -> str:
+        _, _, _, offset, length = self.chunks[chunk_id]
+        return self._texts[offset:offset + length].decode("utf-8")
+
+    def file_chunks(self, relative_path: str) -> List[str]:
+        first, last = self.files[relative_path].get("chunks", [0, 0])
+        return [self.text(chunk_id) for chunk_id in range(first, last)]
+
+    def _postings_for(self, term: str):
+        entry = self.vocabulary.get(term)
+        if entry is None or self._postings is None:
+            return None
+        offset, count = entry
+        return memoryview(self._postings)[offset * 8:(offset + count) * 8].cast("I")
+
+    def search(self, query: str, k: int = 4, categories: Optional[List[str]] = None) -> List[dict]:
+        """Top-k passages (BM25) ; categories limite aux dossiers donnés (+ 'general')"""
+        total = len(self.chunks)
+        if not total:
+            return []
+        allowed = set(categories) | {GENERAL_CATEGORY} if categories else None
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings_for(term)
+            if postings is None:
+                continue
+            df = len(postings) // 2
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for i in range(0, len(postings), 2):
+                chunk_id, tf = postings[i], postings[i + 1]
+                length = self.chunks[chunk_id][2]
+                scores[chunk_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / self.avgdl))
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        results = []
+        for chunk_id, score in ranked:
+            relative_path, category = self.chunks[chunk_id][0], self.chunks[chunk_id][1]
+            if allowed is not None and category not in allowed:
+                continue
+            results.append({"file": relative_path, "category": category, "score": round(score, 3), "text": self.text(chunk_id)})
+            if len(results) >= k:
+                break
+        return results
+
+
+def open_current(index_root: Path) -> Optional[KnowledgeIndex]:
+    name = read_current(index_root)
+    if not name or not (index_root / name / "meta.json").exists():
+        return None
+    return KnowledgeIndex(index_root / name)
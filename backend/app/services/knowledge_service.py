@@ -1,32 +1,110 @@
-
 import os
+import threading
 from pathlib import Path
-import docx
-from .gemini_service import gemini_service
+from typing import List, Optional
+from .knowledge_index import KnowledgeIndex, open_current, read_current, update_index, GENERAL_CATEGORY, file_category
 
 # Chemin dynamique : dossier 'knowledge' à la racine du backend
 KNOWLEDGE_DIR = Path(__file__).parent.parent.parent / "knowledge"
-
-if not KNOWLEDGE_DIR.exists():
-    # Création silencieuse si absent pour éviter le crash
-    KNOWLEDGE_DIR.mkdir(parents=True, exist_ok=True)
-    print(f"📁 Created missing knowledge directory at: {KNOWLEDGE_DIR}")
-else:
-    print(f"✅ Knowledge directory found at: {KNOWLEDGE_DIR}")
+# Index BM25 construit par build_knowledge_index.py
+KNOWLEDGE_INDEX_DIR = Path(os.getenv("KNOWLEDGE_INDEX_DIR", Path(__file__).parent.parent.parent / "cache" / "knowledge_index"))
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "4"))
+# Intervalle de scrutation de knowledge/ en secondes (0 : désactivé)
+KNOWLEDGE_WATCH_INTERVAL = float(os.getenv("KNOWLEDGE_WATCH_INTERVAL", "30"))
 
 class KnowledgeBase:
     def __init__(self):
-        self.files = []
-        print(f"📚 Knowledge Base initialized. Root: {KNOWLEDGE_DIR}")
-
-    def get_file_ids_by_category(self, category: str):
-        # Placeholder: returning empty list for now to avoid complex file loading logic here 
-        # unless user asks for it. The V1 logic uploaded files. Here we might just want to 
-        # let Gemini read them if needed or use RAG later.
-        # For scenario generation, we just need the PROMPT templates.
-        # The V1 logic was uploading files to Gemini on startup. Let's skip that heavy process for now
-        # to ensure fast startup, and rely on prompts.
-        # If we need specific files, we can add them later.
-        return []
-
-knowledge_base = KnowledgeBase()
+        if not KNOWLEDGE_DIR.exists():
+            # Création silencieuse si absent pour éviter le crash
+            KNOWLEDGE_DIR.mkdir(parents=True, exist_ok=True)
+            print(f"📁 Created missing knowledge directory at: {KNOWLEDGE_DIR}")
+        else:
+            print(f"✅ Knowledge directory found at: {KNOWLEDGE_DIR}")
+
+        # Ouverture en mmap : seul meta.json est lu au démarrage
+        self.index: Optional[KnowledgeIndex] = None
+        try:
+            self.index = open_current(KNOWLEDGE_INDEX_DIR)
+        except Exception as e:
+            print(f"❌ Knowledge index illisible ({e}), lancer build_knowledge_index.py")
+        if self.index is None:
+            print(f"📚 Knowledge Base initialized without index. Root: {KNOWLEDGE_DIR}")
+        else:
+            print(f"📚 Knowledge Base initialized: {len(self.index.files)} documents, {len(self.index)} passages")
+
+    def reload(self) -> bool:
+        """Bascule sur la génération publiée dans CURRENT si elle a changé"""
+        name = read_current(KNOWLEDGE_INDEX_DIR)
+        if name == (self.index.generation if self.index else None):
+            return False
+        index = open_current(KNOWLEDGE_INDEX_DIR)
+        # Remplacement de la référence : les recherches en cours finissent sur l'ancien index
+        self.index = index
+        print(f"🔄 Knowledge index {name} chargé ({len(index) if index else 0} passages)")
+        return True
+
+    def refresh(self) -> dict:
+        """Ré-indexe les documents ajoutés/modifiés/supprimés puis recharge"""
+        stats = update_index(KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR)
+        if stats["generation"]:
+            print(f"📚 Knowledge: +{len(stats['added'])} ~{len(stats['changed'])} -{len(stats['removed'])} documents")
+        self.reload()
+        return stats
+
+    def get_file_ids_by_category(self, category: str) -> List[str]:
+        """Documents indexés pour une filière (dossier knowledge/<filière>/) et documents généraux"""
+        if self.index is None:
+            return []
+        return [path for path in self.index.files if file_category(path) in (category, GENERAL_CATEGORY)]
+
+    def search(self, query: str, category: Optional[str] = None, k: int = KNOWLEDGE_TOP_K) -> List[dict]:
+        """Passages les plus pertinents (BM25) pour ancrer une génération"""
+        if self.index is None or not query.strip():
+            return []
+        return self.index.search(query, k=k, categories=[category] if category else None)
+
+def format_passages(passages: List[dict]) -> str:
+    """Bloc de contexte à ajouter au prompt"""
+    return "\n\n".join(f"[Source : {p['file']}]\n{p['text']}" for p in passages)
+
+class KnowledgeWatcher(threading.Thread):
+    """Scrute knowledge/ et recharge l'index sans redémarrer les workers"""
+    def __init__(self, knowledge_base: KnowledgeBase, interval: float):
+        super().__init__(name="knowledge-watcher", daemon=True)
+        self.knowledge_base = knowledge_base
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                # Le verrou de knowledge_index fait qu'un seul worker écrit ; les autres rechargent
+                self.knowledge_base.refresh()
+            except Exception as e:
+                print(f"❌ Knowledge watcher: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+_knowledge_base = None
+_watcher: Optional[KnowledgeWatcher] = None
+
+def get_knowledge_base() -> KnowledgeBase:
+    """Instance partagée (construite dans le lifespan de l'app, ou au premier appel)"""
+    global _knowledge_base
+    if _knowledge_base is None:
+        _knowledge_base = KnowledgeBase()
+    return _knowledge_base
+
+def start_watcher():
+    global _watcher
+    if KNOWLEDGE_WATCH_INTERVAL <= 0 or _watcher is not None:
+        return
+    _watcher = KnowledgeWatcher(get_knowledge_base(), KNOWLEDGE_WATCH_INTERVAL)
+    _watcher.start()
+
+def shutdown():
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
@@ -0,0 +1,270 @@
+"""
+Métriques de l'application, exposées sur GET /metrics au format texte Prometheus.
+
+- HTTP : latence par route (gabarit de chemin, ex. /classes/{class_id}), requêtes en cours ;
+- base de données : nombre et durée des requêtes SQL par requête HTTP
+  (hooks SQLAlchemy sur `engine`, voir app/database.py) ;
+- Gemini : durée de chaque tentative par modèle et issue, tokens consommés ;
+- exports : durée de rendu DOCX / PDF par fonction de rendu.
+
+prometheus_client n'étant pas une dépendance, compteurs, jauges et
+histogrammes sont implémentés ici (format d'exposition 0.0.4). Les valeurs
+sont propres à chaque processus : avec plusieurs workers uvicorn, chacun
+expose les siennes.
+"""
+import time
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+GEMINI_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Par jeu de labels : [compte par intervalle (non cumulé)..., somme, nombre]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._values.get(self._key(labels))
+        return int(series[-1]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_format_value(series[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "Requêtes HTTP traitées", ("method", "route", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP (jusqu'au dernier octet de la réponse)", ("method", "route")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "Requêtes HTTP en cours de traitement"))
+REQUEST_DB_QUERIES = REGISTRY.register(Histogram(
+    "http_request_db_queries", "Nombre de requêtes SQL par requête HTTP", ("method", "route"), QUERY_COUNT_BUCKETS))
+REQUEST_DB_TIME = REGISTRY.register(Histogram(
+    "http_request_db_seconds", "Temps passé en base par requête HTTP", ("method", "route")))
+DB_QUERIES = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Durée des requêtes SQL (toutes origines, tâches de fond comprises)"))
+GEMINI_LATENCY = REGISTRY.register(Histogram(
+    "gemini_request_duration_seconds", "Durée d'une tentative d'appel Gemini", ("model", "outcome"), GEMINI_BUCKETS))
+GEMINI_TOKENS = REGISTRY.register(Counter(
+    "gemini_tokens_total", "Tokens Gemini consommés (usage_metadata)", ("model", "kind")))
+EXPORT_RENDER = REGISTRY.register(Histogram(
+    "export_render_duration_seconds", "Durée d'un rendu d'export, attente dans le pool comprise", ("renderer",)))
+
+
+class RequestStats:
+    """Compteurs SQL de la requête HTTP en cours"""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Posé par MetricsMiddleware ; les handlers synchrones (threadpool) héritent du contexte
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def record_query(statement: str, elapsed: float):
+    """Appelé par le hook after_cursor_execute de l'engine (app/database.py)"""
+    DB_QUERIES.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def record_gemini_call(model: str, outcome: str, elapsed: float):
+    GEMINI_LATENCY.observe(elapsed, model=model, outcome=outcome)
+
+
+def record_gemini_usage(model: str, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    GEMINI_TOKENS.inc(getattr(usage, "prompt_token_count", None) or 0, model=model, kind="prompt")
+    GEMINI_TOKENS.inc(getattr(usage, "candidates_token_count", None) or 0, model=model, kind="response")
+
+
+def route_label(scope: dict, status: int) -> str:
+    """Gabarit de la route (/classes/{class_id}), jamais le chemin brut : cardinalité bornée.
+
+    Reconstruit depuis path_params, posés par le routeur sur la route trouvée :
+    indépendant de la façon dont FastAPI range les routes des routeurs inclus.
+    """
+    params = scope.get("path_params")
+    if params is None:
+        return "<unmatched>" if status == 404 else "<other>"
+    if scope.get("route") is None and scope.get("root_path"):
+        # Application montée (StaticFiles de /uploads) : un seul libellé pour tous ses fichiers
+        return scope["root_path"] + "/{path}"
+    path = scope["path"]
+    segments = {}
+    for name, value in params.items():
+        value = str(value)
+        if "/" in value and path.endswith(value):
+            # Paramètre {x:path} : toute la fin du chemin
+            path = path[:-len(value)] + "{" + name + "}"
+        else:
+            segments[value] = "{" + name + "}"
+    if not segments:
+        return path
+    return "/".join(segments.get(segment, segment) for segment in path.split("/"))
+
+
+class MetricsMiddleware:
+    """Middleware ASGI : latence, statut, requêtes en cours et SQL par route"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            _request_stats.reset(token)
+            method = scope["method"]
+            route = route_label(scope, status)
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(status))
+            HTTP_LATENCY.observe(elapsed, method=method, route=route)
+            REQUEST_DB_QUERIES.observe(stats.queries, method=method, route=route)
+            REQUEST_DB_TIME.observe(stats.db_seconds, method=method, route=route)
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,100 @@
+"""
+Registre des templates de prompts (app/prompts/).
+
+templates.json décrit chaque template : fichier Markdown, version et
+placeholders attendus ({topic}, ...). Tout est lu et vérifié une seule fois,
+au chargement de l'application : un placeholder non déclaré, manquant ou mal
+formé fait échouer le chargement au lieu d'envoyer un prompt à moitié rempli
+à Gemini.
+
+La version publiée d'un template ("jeu_de_role@1-3fa2c1d0") combine la version
+déclarée et l'empreinte du fichier : elle change même si l'on oublie
+d'incrémenter la version, et sert dans les clés de cache des résultats.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from string import Formatter
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts")
+MANIFEST = "templates.json"
+DEFAULT_TEMPLATE = "jeu_de_role_evenement"
+# Valeurs qu'un template peut demander, fournies par /api/course
+ALLOWED_PLACEHOLDERS = frozenset({"topic", "track", "duration_hours", "target_block"})
+
+
+class TemplateError(Exception):
+    """Template invalide (détecté au chargement)"""
+
+
+class PromptTemplate:
+    def __init__(self, name: str, text: str, version: int, placeholders, description: str = ""):
+        self.name = name
+        self.text = text
+        self.description = description
+        self.placeholders = frozenset(placeholders)
+        self.digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+        self.version = f"{name}@{version}-{self.digest}"
+        self._validate()
+
+    def _validate(self):
+        try:
+            fields = {field for _, field, _, _ in Formatter().parse(self.text) if field is not None}
+        except ValueError as e:
+            raise TemplateError(f"{self.name}: accolade mal formée ({e})")
+        if "" in fields or any(not field.isidentifier() for field in fields):
+            raise TemplateError(f"{self.name}: placeholder positionnel ou composé interdit ({sorted(fields)})")
+        if fields != self.placeholders:
+            raise TemplateError(f"{self.name}: placeholders du fichier {sorted(fields)} != déclarés {sorted(self.placeholders)}")
+        unknown = fields - ALLOWED_PLACEHOLDERS
+        if unknown:
+            raise TemplateError(f"{self.name}: placeholders inconnus {sorted(unknown)}")
+
+    @property
+    def is_static(self) -> bool:
+        """Sans placeholder : l'instruction système (et le modèle) peut être partagée entre requêtes"""
+        return not self.placeholders
+
+    def render(self, **values) -> str:
+        if self.is_static:
+            return self.text
+        return self.text.format(**{name: values.get(name) or "" for name in self.placeholders})
+
+
+class TemplateRegistry:
+    def __init__(self, templates: Mapping[str, PromptTemplate]):
+        self.templates: Mapping[str, PromptTemplate] = MappingProxyType(dict(templates))
+
+    def get(self, name: Optional[str]) -> PromptTemplate:
+        """Template demandé, sinon le template par défaut (types de documents sans template dédié)"""
+        return self.templates.get(name or "") or self.templates[DEFAULT_TEMPLATE]
+
+    def versions(self) -> Mapping[str, str]:
+        return {name: template.version for name, template in self.templates.items()}
+
+
+def load_registry(directory: str = PROMPTS_DIR) -> TemplateRegistry:
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    templates = {}
+    for name, entry in manifest.items():
+        try:
+            with open(os.path.join(directory, entry["file"]), "r", encoding="utf-8") as f:
+                text = f.read()
+        except (KeyError, OSError) as e:
+            raise TemplateError(f"{name}: fichier illisible ({e})")
+        templates[name] = PromptTemplate(
+            name, text, entry.get("version", 1), entry.get("placeholders", []), entry.get("description", "")
+        )
+    if DEFAULT_TEMPLATE not in templates:
+        raise TemplateError(f"Template par défaut '{DEFAULT_TEMPLATE}' absent de {MANIFEST}")
+    return TemplateRegistry(templates)
+
+
+@lru_cache(maxsize=1)
+def get_registry() -> TemplateRegistry:
+    """Registre partagé, chargé et validé une fois, à l'import de app/routers/generate.py (PROMPT_TEMPLATES)"""
+    return load_registry()
@@ -0,0 +1,130 @@
+"""
+Détecteur de requêtes N+1 (mode debug : QUERY_DEBUG=1).
+
+Compte les requêtes SQL exécutées par chaque requête HTTP (hook sur `engine`)
+et les regroupe par forme : même SQL, valeurs et listes IN (...) neutralisées.
+Quand une même forme revient au moins QUERY_DEBUG_REPEAT fois, ou que la requête
+HTTP dépasse QUERY_DEBUG_MAX requêtes SQL, un avertissement indique la route et
+la requête répétée :
+
+    ⚠️ N+1 GET /api/deadlines : 8 requêtes SQL, 6x SELECT count(*) AS count_1 FROM (SELECT ... FROM submissions WHERE submissions.deadline_id = ?) AS anon_1
+
+Les derniers rapports restent dans get_detector().reports : check_queries.py
+s'en sert pour faire échouer la vérification des routes de suivi.
+"""
+import os
+import re
+from collections import Counter, deque
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from sqlalchemy import event
+from .metrics import route_label
+
+QUERY_DEBUG = os.getenv("QUERY_DEBUG") == "1"
+QUERY_DEBUG_REPEAT = int(os.getenv("QUERY_DEBUG_REPEAT", "5"))  # même forme de requête dans une requête HTTP
+QUERY_DEBUG_MAX = int(os.getenv("QUERY_DEBUG_MAX", "50"))  # requêtes SQL par requête HTTP
+
+_WHITESPACE = re.compile(r"\s+")
+_COLUMNS = re.compile(r"\bSELECT (DISTINCT )?[^()]*? FROM\b", re.IGNORECASE)
+_IN_LIST = re.compile(r"\bIN\s*\((?:[^()]|\([^()]*\))*\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_NAMED_PARAM = re.compile(r"%\(\w+\)s|:\w+|\$\d+")
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(statement: str) -> str:
+    """SQL normalisé : les requêtes qui ne diffèrent que par leurs valeurs ont la même forme"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _STRING.sub("?", shape)
+    shape = _NAMED_PARAM.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("IN (...)", shape)
+    # Listes de colonnes sans parenthèses : seules les tables et conditions distinguent les requêtes
+    return _COLUMNS.sub(lambda m: f"SELECT {m.group(1) or ''}... FROM", shape)
+
+
+class QueryReport:
+    def __init__(self, method: str, route: str, total: int, repeated: List[Tuple[str, int]]):
+        self.method = method
+        self.route = route
+        self.total = total
+        self.repeated = repeated  # (forme, nombre d'exécutions), la plus répétée d'abord
+
+    def __str__(self):
+        worst = f", {self.repeated[0][1]}x {self.repeated[0][0][:300]}" if self.repeated else ""
+        return f"{self.method} {self.route} : {self.total} requêtes SQL{worst}"
+
+
+# Formes exécutées par la requête HTTP en cours (None hors requête : tâches de fond, démarrage)
+_statements: ContextVar[Optional[Counter]] = ContextVar("query_debug_statements", default=None)
+
+
+class QueryDetector:
+    def __init__(self, repeat_threshold: int = QUERY_DEBUG_REPEAT, max_queries: int = QUERY_DEBUG_MAX, keep: int = 200):
+        self.repeat_threshold = repeat_threshold
+        self.max_queries = max_queries
+        self.reports = deque(maxlen=keep)
+        self._engines = set()
+
+    def attach(self, engine):
+        if id(engine) not in self._engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+            self._engines.add(id(engine))
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        statements = _statements.get()
+        if statements is not None:
+            statements[statement] += 1
+
+    def check(self, method: str, route: str, statements: Counter) -> Optional[QueryReport]:
+        total = sum(statements.values())
+        shapes = Counter()
+        for statement, count in statements.items():
+            shapes[statement_shape(statement)] += count
+        repeated = [(shape, count) for shape, count in shapes.most_common() if count >= self.repeat_threshold]
+        if not repeated and total <= self.max_queries:
+            return None
+        report = QueryReport(method, route, total, repeated)
+        self.reports.append(report)
+        print(f"⚠️ N+1 {report}")
+        return report
+
+
+class QueryDebugMiddleware:
+    """Middleware ASGI : ouvre le compteur de requêtes SQL et vérifie les seuils en fin de requête"""
+    def __init__(self, app, detector: Optional[QueryDetector] = None):
+        self.app = app
+        self.detector = detector or get_detector()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        statements = Counter()
+        token = _statements.set(statements)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _statements.reset(token)
+            self.detector.check(scope["method"], route_label(scope, status), statements)
+
+
+_detector: Optional[QueryDetector] = None
+
+
+def get_detector() -> QueryDetector:
+    global _detector
+    if _detector is None:
+        _detector = QueryDetector()
+    return _detector
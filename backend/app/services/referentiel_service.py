@@ -0,0 +1,156 @@
+"""
+Référentiel BTS NDRC (E4 / E6) en mémoire.
+
+Les fichiers app/referentiel_e4.json et app/referentiel_e6.json sont lus une
+seule fois (au démarrage) ; les codes de compétences suivent la même
+convention que init_db.seed_referentiel (f"{domaine}_{rang}", ex. 'E6.D_1').
+
+L'index est immuable (MappingProxyType / tuples) : il est partagé entre les
+requêtes sans verrou, et toutes les recherches sont des accès dict en O(1).
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENTIEL_FILES = {"E6": "referentiel_e6.json", "E4": "referentiel_e4.json"}
+
+# Domaines du front -> préfixe des codes Competency
+DOMAIN_CODES = {
+    "E6_DISTRIBUTION": "E6.D",
+    "E6_PARTENARIAT": "E6.P",
+    "E6_VD": "E6.VD",
+    "E4_CIBLER_PROSPECTER": "E4.CIBLER",
+    "E4_NEGOCIER": "E4.NEGOCIER",
+    "E4_EVENEMENT": "E4.EVENT",
+    "E4_INFO": "E4.INFO",
+}
+
+
+# Compétences notées par le front (frontend/app/constants.ts, DOMAINS[...].skills) :
+# id front -> (code Competency, libellé du front). Correspondance explicite, pas par rang :
+# les compétences E4 du front ne suivent pas l'ordre du référentiel. None : pas
+# d'équivalent sûr dans le référentiel, le score est gardé sans critère.
+FRONT_SKILLS = {
+    "E6_DISTRIBUTION": {
+        "1": ("E6.D_1", "Valoriser l’offre sur le lieu de vente"),
+        "2": ("E6.D_2", "Développer la présence réseau"),
+        "3": ("E6.D_3", "Proposer une animation commerciale"),
+        "4": ("E6.D_4", "Évaluer l’efficacité de l’animation"),
+    },
+    "E6_PARTENARIAT": {
+        "1": ("E6.P_1", "Participer au développement du réseau"),
+        "2": ("E6.P_2", "Mobiliser et évaluer le réseau"),
+    },
+    "E6_VD": {
+        "1": ("E6.VD_1", "Prospecter et vendre en réunion"),
+        "2": ("E6.VD_2", "Recruter et former des vendeurs"),
+        "3": ("E6.VD_3", "Impulser une dynamique de réseau"),
+    },
+    "E4_CIBLER_PROSPECTER": {
+        "101": (None, "Collecter et analyser l'information"),
+        "102": ("E4.CIBLER_3", "Organiser et conduire la prospection"),
+    },
+    "E4_NEGOCIER": {
+        "201": ("E4.NEGOCIER_1", "Négocier et vendre"),
+        "202": ("E4.NEGOCIER_2", "Accompagner la relation client"),
+    },
+    "E4_EVENEMENT": {
+        "301": ("E4.EVENT_1", "Concevoir une opération événementielle"),
+        "302": (None, "Mettre en œuvre et évaluer"),  # à cheval sur EVENT_2 (animer) et EVENT_3 (exploiter)
+    },
+    "E4_INFO": {
+        "401": ("E4.INFO_1", "Remonter et valoriser l'information"),
+        "402": ("E4.INFO_2", "Collaborer à l'interne"),
+    },
+}
+
+
+def competency_code(domain_id: Optional[str], skill_key: str) -> Optional[str]:
+    """Code Competency pour une clé de notation du front ('E4.CIBLER_1', ou '201' + domaine) ; None si inconnue"""
+    if "." in skill_key and "_" in skill_key:
+        return skill_key
+    code, _ = FRONT_SKILLS.get(domain_id or "", {}).get(str(skill_key), (None, None))
+    return code
+
+
+class ReferentielIndex:
+    def __init__(self, domains: list):
+        competencies, by_description, by_criterion, by_block, domain_index = {}, {}, {}, {}, {}
+        for domain in domains:
+            domain_index[domain["code"]] = MappingProxyType({
+                "code": domain["code"], "description": domain["description"], "block": domain["block"]
+            })
+            for i, skill in enumerate(domain["children"]):
+                code = f"{domain['code']}_{i+1}"
+                competency = MappingProxyType({
+                    "code": code,
+                    "description": skill["description"],
+                    "block": domain["block"],
+                    "domain": domain["code"],
+                    "criteria": tuple(skill["criteria"]),
+                })
+                competencies[code] = competency
+                by_description[skill["description"]] = code
+                for criterion in skill["criteria"]:
+                    by_criterion.setdefault(criterion, code)
+                by_block.setdefault(domain["block"], []).append(code)
+
+        self.competencies: Mapping[str, Mapping] = MappingProxyType(competencies)   # code -> compétence
+        self.domains: Mapping[str, Mapping] = MappingProxyType(domain_index)        # 'E6.D' -> domaine
+        self.by_description: Mapping[str, str] = MappingProxyType(by_description)   # libellé -> code
+        self.by_criterion: Mapping[str, str] = MappingProxyType(by_criterion)       # critère -> code
+        self.by_block: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+            {block: tuple(codes) for block, codes in by_block.items()}
+        )                                                                           # 'E4' -> codes
+
+        # Réponse de /api/referentiel, sérialisée une fois
+        self.payload = json.dumps({
+            "domains": list(domain_index.values()),
+            "competencies": list(competencies.values()),
+            "domain_codes": DOMAIN_CODES,
+        }, ensure_ascii=False, default=dict).encode("utf-8")
+        self.etag = f'"{hashlib.sha256(self.payload).hexdigest()[:32]}"'
+
+    def competency(self, code: Optional[str]) -> Optional[Mapping]:
+        return self.competencies.get(code) if code else None
+
+    def criteria(self, code: str) -> Tuple[str, ...]:
+        competency = self.competencies.get(code)
+        return competency["criteria"] if competency else ()
+
+    def code_for_description(self, description: str) -> Optional[str]:
+        return self.by_description.get(description) or self.by_criterion.get(description)
+
+    def block_competencies(self, block: str) -> Tuple[Mapping, ...]:
+        return tuple(self.competencies[code] for code in self.by_block.get(block, ()))
+
+    def skill_label(self, domain_id: Optional[str], skill_key: str) -> str:
+        """Libellé officiel d'une clé de notation du front (à défaut celui du front, puis la clé elle-même)"""
+        competency = self.competency(competency_code(domain_id, str(skill_key)))
+        if competency:
+            return competency["description"]
+        _, front_label = FRONT_SKILLS.get(domain_id or "", {}).get(str(skill_key), (None, None))
+        return front_label or str(skill_key)
+
+    def domain_label(self, domain_id: Optional[str]) -> Optional[str]:
+        domain = self.domains.get(DOMAIN_CODES.get(domain_id or "", ""))
+        return domain["description"] if domain else domain_id
+
+
+def build_index() -> ReferentielIndex:
+    domains = []
+    for block, filename in REFERENTIEL_FILES.items():
+        with open(os.path.join(APP_DIR, filename), "r", encoding="utf-8") as f:
+            for domain in json.load(f):
+                domains.append({**domain, "block": domain.get("block", block)})
+    return ReferentielIndex(domains)
+
+
+@lru_cache(maxsize=1)
+def get_index() -> ReferentielIndex:
+    """Index partagé, construit au premier appel (préchargé dans main.on_startup)"""
+    return build_index()
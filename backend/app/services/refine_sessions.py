@@ -0,0 +1,154 @@
+"""
+Sessions de retouche (/api/refine/sessions) : le serveur garde le document et
+l'historique du chat, le client n'envoie plus que la nouvelle instruction.
+
+- Base de données (RefineSession) : document courant + historique JSON, pour
+  survivre aux redémarrages et être repris par n'importe quel worker.
+- Mémoire : LRU des sessions actives (LegacyCompatibleChat déjà construit),
+  évincées après REFINE_SESSION_IDLE secondes sans activité ou au-delà de
+  REFINE_SESSIONS_MAX. Une session évincée est reconstruite depuis la base.
+
+L'historique envoyé au modèle est borné : au-delà de REFINE_HISTORY_TURNS
+échanges, le chat repart du document courant et des derniers échanges.
+"""
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Callable, List, Optional
+from sqlalchemy.orm import Session
+from ..models import RefineSession
+
+REFINE_SESSIONS_MAX = int(os.getenv("REFINE_SESSIONS_MAX", "200"))
+REFINE_SESSION_IDLE = float(os.getenv("REFINE_SESSION_IDLE", "900"))
+REFINE_HISTORY_TURNS = int(os.getenv("REFINE_HISTORY_TURNS", "4"))
+REFINE_SESSION_RETENTION_DAYS = int(os.getenv("REFINE_SESSION_RETENTION_DAYS", "7"))
+
+SEED_ACK = "Document reçu. J'attends les instructions de modification."
+
+
+def seed_history(content: str, exchanges: Optional[List[dict]] = None) -> List[dict]:
+    """Premier échange : le document de travail ; puis les derniers échanges conservés"""
+    return [
+        {"role": "user", "text": f"Voici le document de travail :\n\n{content}"},
+        {"role": "model", "text": SEED_ACK},
+    ] + list(exchanges or [])
+
+
+def to_contents(history: List[dict]) -> List[dict]:
+    """Format attendu par google-genai (ContentDict)"""
+    return [{"role": turn["role"], "parts": [{"text": turn["text"]}]} for turn in history]
+
+
+class LiveSession:
+    def __init__(self, record: RefineSession, chat_factory: Callable):
+        self.id = record.id
+        self.track = record.track or "NDRC"
+        self.user_id = record.user_id
+        self.content = record.content or ""
+        self.history = json.loads(record.history or "[]") or seed_history(self.content)
+        self.turns = record.turns or 0
+        self.chat_factory = chat_factory
+        self.chat = chat_factory(self.track, to_contents(self.history))
+        self.last_used = time.monotonic()
+        self.lock = Lock()  # Un seul tour à la fois par session
+
+    def record_turn(self, message: str, reply: str, content: str):
+        self.history += [{"role": "user", "text": message}, {"role": "model", "text": reply}]
+        self.content = content
+        self.turns += 1
+        exchanges = self.history[2:]
+        if len(exchanges) > 2 * REFINE_HISTORY_TURNS:
+            # Le document courant remplace les anciens échanges : la taille du prompt reste bornée
+            self.history = seed_history(content, exchanges[-2 * REFINE_HISTORY_TURNS:])
+            self.chat = self.chat_factory(self.track, to_contents(self.history))
+
+    def save(self, db: Session):
+        db.query(RefineSession).filter(RefineSession.id == self.id).update({
+            RefineSession.content: self.content,
+            RefineSession.history: json.dumps(self.history, ensure_ascii=False),
+            RefineSession.turns: self.turns,
+            RefineSession.updated_at: datetime.now(timezone.utc),
+        }, synchronize_session=False)
+        db.commit()
+
+
+class RefineSessionStore:
+    def __init__(self, chat_factory: Callable, max_live: int = REFINE_SESSIONS_MAX, idle_timeout: float = REFINE_SESSION_IDLE):
+        self.chat_factory = chat_factory  # (track, history) -> LegacyCompatibleChat
+        self.max_live = max_live
+        self.idle_timeout = idle_timeout
+        self._live: "OrderedDict[str, LiveSession]" = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._live)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._live:
+            oldest = next(iter(self._live.values()))
+            if len(self._live) > self.max_live or now - oldest.last_used > self.idle_timeout:
+                self._live.popitem(last=False)
+            else:
+                break
+
+    def create(self, db: Session, content: str, track: str, user_id: Optional[int] = None) -> LiveSession:
+        purge_expired(db)
+        record = RefineSession(
+            id=str(uuid.uuid4()), user_id=user_id, track=track, content=content,
+            history=json.dumps(seed_history(content), ensure_ascii=False), turns=0
+        )
+        db.add(record)
+        db.commit()
+        session = LiveSession(record, self.chat_factory)
+        with self._lock:
+            self._live[session.id] = session
+            self._evict()
+        return session
+
+    def get(self, db: Session, session_id: str) -> Optional[LiveSession]:
+        with self._lock:
+            session = self._live.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._live.move_to_end(session_id)
+            self._evict()
+        if session is not None:
+            # Avec plusieurs workers, un autre a pu jouer un tour : la base fait foi
+            turns = db.query(RefineSession.turns).filter(RefineSession.id == session_id).scalar()
+            if turns == session.turns:
+                return session
+
+        record = db.query(RefineSession).filter(RefineSession.id == session_id).first()
+        if record is None:
+            with self._lock:
+                self._live.pop(session_id, None)
+            return None
+        loaded = LiveSession(record, self.chat_factory)
+        with self._lock:
+            # Un autre thread a pu la recharger entre-temps : on garde la plus avancée
+            current = self._live.get(session_id)
+            if current is None or current.turns < loaded.turns:
+                self._live[session_id] = loaded
+            session = self._live[session_id]
+            self._live.move_to_end(session_id)
+            self._evict()
+        return session
+
+    def close(self, db: Session, session_id: str) -> bool:
+        with self._lock:
+            self._live.pop(session_id, None)
+        deleted = db.query(RefineSession).filter(RefineSession.id == session_id).delete(synchronize_session=False)
+        db.commit()
+        return bool(deleted)
+
+
+def purge_expired(db: Session):
+    """Supprime les sessions inactives depuis plus de REFINE_SESSION_RETENTION_DAYS jours"""
+    limit = datetime.now(timezone.utc) - timedelta(days=REFINE_SESSION_RETENTION_DAYS)
+    db.query(RefineSession).filter(RefineSession.updated_at < limit).delete(synchronize_session=False)
+
@@ -0,0 +1,126 @@
+"""
+Pool de processus pour le rendu des exports (DOCX / PDF).
+
+python-docx et ReportLab sont liés au CPU et gardent le GIL : les rendus sont
+donc exécutés dans des processus séparés pour ne pas bloquer la boucle
+d'événements ni les autres requêtes.
+
+Les fonctions de rendu reçoivent une "spec" picklable (dicts de champs) et
+retournent des bytes. La file d'attente est bornée : au-delà de
+EXPORT_MAX_PENDING rendus en cours, les nouveaux exports reçoivent un 503
+avec Retry-After plutôt que de s'empiler.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import List, Optional
+from fastapi import HTTPException
+from .metrics import EXPORT_RENDER
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_MAX_PENDING = int(os.getenv("EXPORT_MAX_PENDING", str(EXPORT_WORKERS * 4)))
+EXPORT_RETRY_AFTER = int(os.getenv("EXPORT_RETRY_AFTER", "5"))
+
+# Places de rendu occupées (unitaires en cours ou en attente + places réservées par les lots),
+# modifié uniquement depuis la boucle d'événements
+_pending = 0
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=EXPORT_WORKERS)
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def submit(fn, *args) -> asyncio.Future:
+    """Soumet un rendu au pool et retourne un future awaitable"""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(get_executor(), fn, *args)
+
+
+def pending() -> int:
+    return _pending
+
+
+def check_capacity(slots: int = 1):
+    """Lève un 503 (avec Retry-After) si la file de rendu ne peut pas accueillir `slots` rendus de plus"""
+    if _pending + slots > EXPORT_MAX_PENDING:
+        raise HTTPException(
+            status_code=503,
+            detail="Trop d'exports en cours, veuillez réessayer dans quelques secondes",
+            headers={"Retry-After": str(EXPORT_RETRY_AFTER)}
+        )
+
+
+async def _timed_submit(fn, *args):
+    start = time.perf_counter()
+    try:
+        return await submit(fn, *args)
+    finally:
+        EXPORT_RENDER.observe(time.perf_counter() - start, renderer=getattr(fn, "__name__", "render"))
+
+
+async def render(fn, *args):
+    """Exécute fn(*args) dans le pool, après admission dans la file (503 si saturée)"""
+    global _pending
+    check_capacity()
+    _pending += 1
+    try:
+        return await _timed_submit(fn, *args)
+    finally:
+        _pending -= 1
+
+
+class BatchAdmission:
+    """Places réservées par un lot : au plus EXPORT_WORKERS rendus de ce lot à la fois.
+
+    Le lot compte pour min(jobs, EXPORT_WORKERS) places dans _pending, réservées
+    à l'admission (503 si elles ne sont pas disponibles) et rendues quand ses
+    `jobs` rendus sont terminés ou annulés : plusieurs lots simultanés ne font
+    jamais dépasser EXPORT_MAX_PENDING.
+    """
+    def __init__(self, jobs: int):
+        global _pending
+        self.slots = max(1, min(jobs, EXPORT_WORKERS))
+        check_capacity(self.slots)
+        _pending += self.slots
+        self.remaining = jobs
+        self.window = asyncio.Semaphore(self.slots)
+
+    async def render(self, fn, *args):
+        async with self.window:
+            return await _timed_submit(fn, *args)
+
+    def done(self, *_):
+        """Un rendu du lot est terminé (ou annulé) ; libère les places après le dernier"""
+        global _pending
+        self.remaining -= 1
+        if self.remaining == 0:
+            _pending -= self.slots
+
+
+def admit_batch(jobs: int) -> BatchAdmission:
+    return BatchAdmission(jobs)
+
+
+def render_all(fn, specs: List[dict], admission: BatchAdmission) -> List[asyncio.Task]:
+    """Rend un lot de specs dans les places réservées par admission (fenêtre glissante)"""
+    tasks = [asyncio.ensure_future(admission.render(fn, spec)) for spec in specs]
+    for task in tasks:
+        task.add_done_callback(admission.done)
+    return tasks
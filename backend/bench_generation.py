@@ -0,0 +1,115 @@
+"""
+Benchmark hors ligne de la chaîne génération -> retouche -> export, avec le
+fournisseur Gemini factice (GEMINI_PROVIDER=fake, voir app/services/fake_gemini.py).
+
+Chaque "professeur" enchaîne : génération d'un sujet E4 (/api/course), une
+retouche en session (/api/refine/sessions), puis l'export DOCX et PDF.
+La base est une SQLite temporaire : aucune donnée réelle n'est touchée.
+
+Usage : python bench_generation.py [professeurs] [sujets_par_professeur]
+    FAKE_GEMINI_LATENCY=2 FAKE_GEMINI_ERROR_RATE=0.1 python bench_generation.py 8 5
+    GENERATION_USER_RATE=6 GENERATION_USER_BURST=3 python bench_generation.py 4 10   (file équitable)
+"""
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["GEMINI_PROVIDER"] = "fake"
+os.environ.setdefault("FAKE_GEMINI_LATENCY", "0.5")
+os.environ.setdefault("GEMINI_BACKOFF_BASE", "0.1")
+os.environ.setdefault("KNOWLEDGE_WATCH_INTERVAL", "0")
+# Quotas larges par défaut : on mesure la chaîne, pas le limiteur (à réduire pour observer la file)
+os.environ.setdefault("GENERATION_USER_RATE", "600")
+os.environ.setdefault("GENERATION_USER_BURST", "50")
+os.environ.setdefault("GENERATION_GLOBAL_RATE", "6000")
+os.environ.setdefault("GENERATION_GLOBAL_BURST", "200")
+os.environ.setdefault("GENERATION_USER_QUEUE_MAX", "50")
+os.environ.setdefault("GENERATION_QUEUE_MAX", "200")
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_generation_"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from fastapi.testclient import TestClient  # noqa: E402
+import main  # noqa: E402
+from app.auth import create_access_token  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import User  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def create_teachers(count: int):
+    db = SessionLocal()
+    headers = []
+    for i in range(count):
+        email = f"bench{i}@example.com"
+        if not db.query(User).filter(User.email == email).first():
+            db.add(User(name=f"Bench {i}", email=email, role="teacher", hashed_password=""))
+        headers.append({"Authorization": f"Bearer {create_access_token({'sub': email})}"})
+    db.commit()
+    db.close()
+    return headers
+
+
+def scenario(client: TestClient, headers: dict, index: int, timings, statuses):
+    def step(name, method, url, **kwargs):
+        start = time.perf_counter()
+        response = client.request(method, url, headers=headers, **kwargs)
+        timings[name].append(time.perf_counter() - start)
+        statuses[(name, response.status_code)] += 1
+        return response if response.status_code < 300 else None
+
+    generated = step("generate", "POST", "/api/course", json={
+        "topic": f"Vente de solutions de rayonnage, client {index}",
+        "document_type": "jeu_de_role",
+        "target_block": "E4",
+    })
+    if generated is None:
+        return
+    content = generated.json()["content"]
+
+    session = step("refine_open", "POST", "/api/refine/sessions", json={"content": content})
+    if session is not None:
+        refined = step("refine_turn", "POST", f"/api/refine/sessions/{session.json()['session_id']}/messages",
+                       json={"instruction": "Rends les objections plus difficiles"})
+        if refined is not None:
+            content = refined.json()["content"]
+
+    export = {"title": f"Sujet {index}", "scenario_type": "jeu_de_role", "content": content,
+              "exam_type": "E4", "student_name": f"Candidat {index}"}
+    step("export_docx", "POST", "/api/export-scenario/docx", json=export)
+    step("export_pdf", "POST", "/api/export-scenario/pdf", json=export)
+
+
+def main_bench():
+    teachers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    per_teacher = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    timings, statuses = defaultdict(list), Counter()
+
+    with TestClient(main.app) as client:
+        headers = create_teachers(teachers)
+        jobs = [(headers[t], t * per_teacher + i) for t in range(teachers) for i in range(per_teacher)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            for future in [pool.submit(scenario, client, h, i, timings, statuses) for h, i in jobs]:
+                future.result()
+        elapsed = time.perf_counter() - start
+
+    print(f"\n{teachers} professeurs x {per_teacher} sujets en {elapsed:.1f} s "
+          f"(latence factice {os.environ['FAKE_GEMINI_LATENCY']} s)\n")
+    print(f"{'Étape':<14} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name in ("generate", "refine_open", "refine_turn", "export_docx", "export_pdf"):
+        values = [t * 1000 for t in timings[name]]
+        print(f"{name:<14} {len(values):>4} {percentile(values, 50):9.0f} {percentile(values, 95):9.0f} {max(values or [0]):9.0f}")
+    print("\nCodes HTTP : " + ", ".join(f"{name} {code}: {n}" for (name, code), n in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    main_bench()
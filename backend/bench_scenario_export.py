@@ -0,0 +1,199 @@
+"""
+Benchmark des exports de sujets :
+- latence par export DOCX avant/après la mise en cache du template ;
+- extraction des tableaux markdown (ancienne implémentation vs passe unique),
+  avec vérification d'équivalence sur les templates de generate.py.
+
+Usage : python bench_scenario_export.py [nombre_d_exports]
+"""
+import random
+import re
+import sys
+import time
+from docx import Document
+from app.routers import scenario_export
+from app.routers.scenario_export import (
+    ScenarioExportRequest, TEMPLATE_PATH, BR_PATTERN,
+    render_scenario_docx, scenario_render_spec, extract_tables_from_markdown
+)
+from app.routers.generate import PROMPT_TEMPLATES
+
+
+def sample_request(i: int = 0) -> ScenarioExportRequest:
+    return ScenarioExportRequest(
+        title=f"Sujet {i}",
+        scenario_type="negociation",
+        content=PROMPT_TEMPLATES["jeu_de_role"],
+        exam_type="E4",
+        student_name=f"Candidat {i}"
+    )
+
+
+def timed(label: str, fn, n: int):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed_ms = (time.perf_counter() - start) * 1000 / n
+    print(f"{label:<45} {elapsed_ms:8.2f} ms/appel")
+    return elapsed_ms
+
+
+def legacy_extract_table_from_markdown(content: str, table_index: int = 0) -> dict:
+    """Ancienne implémentation (référence) : re.findall + content.find par ligne"""
+    # Find all markdown tables
+    table_pattern = r'\|([^\n]+)\|([^\n]+)\|'
+    matches = re.findall(table_pattern, content)
+    
+    if not matches:
+        return {}
+    
+    # Split into two tables (candidat and jury)
+    split_marker = content.find('FICHE SUJET – nom du JURY')
+    if split_marker == -1:
+        split_marker = content.find('PAGE 2')
+    
+    result = {}
+    
+    for row in matches:
+        field = row[0].strip().strip('*').strip()
+        value = row[1].strip().strip('*').strip()
+        
+        # Skip header and separator rows
+        if field.startswith(':') or 'MODIFICATION DES' in field or 'PARAMÈTRES' in field:
+            continue
+        
+        # Clean up field names
+        field_clean = field.lower()
+        
+        # Only include rows from the correct table
+        row_pos = content.find(f"|{row[0]}|{row[1]}|")
+        if table_index == 0 and split_marker > 0 and row_pos > split_marker:
+            continue  # Skip jury table for candidat
+        if table_index == 1 and split_marker > 0 and row_pos < split_marker:
+            continue  # Skip candidat table for jury
+        
+        # Map to standardized keys with more variations
+        if 'objet' in field_clean:
+            result['objet'] = value
+        elif ('date' in field_clean and 'durée' in field_clean) or ('date' in field_clean and 'duree' in field_clean):
+            result['date_duree'] = value
+        elif 'date' in field_clean and 'rencontre' in field_clean:
+            result['date_rencontre'] = value
+        elif 'lieu' in field_clean:
+            result['lieu'] = value
+        elif 'délimitation' in field_clean or 'delimitation' in field_clean:
+            result['delimitation'] = value
+        elif ('acteur' in field_clean or 'acteurs' in field_clean) and 'concerné' in field_clean:
+            result['acteurs'] = value
+        elif 'historique' in field_clean:
+            result['historique'] = value
+        elif 'objectif' in field_clean and ('simulation' in field_clean or 'communication' in field_clean):
+            result['objectifs'] = value
+        elif 'information' in field_clean and 'exploiter' in field_clean:
+            result['informations'] = value
+        elif 'contrainte' in field_clean:
+            result['contraintes'] = value
+        elif 'identité' in field_clean or 'identite' in field_clean:
+            result['identite'] = value
+        elif 'relation' in field_clean and 'entreprise' in field_clean:
+            result['relation_entreprise'] = value
+        elif 'motivation' in field_clean:
+            result['motivations'] = value
+        elif 'frein' in field_clean:
+            result['freins'] = value
+        elif 'objection' in field_clean:
+            result['objections'] = value
+        elif 'contexte' in field_clean:
+            result['contexte'] = value
+        elif 'consigne' in field_clean:
+            result['consignes'] = value
+        elif 'éléments de réponse' in field_clean or 'elements de reponse' in field_clean:
+            result['elements_reponse'] = value
+    
+    return result
+
+
+def legacy_extract_tables(content: str):
+    return (
+        legacy_extract_table_from_markdown(content, table_index=0),
+        legacy_extract_table_from_markdown(content, table_index=1)
+    )
+
+
+def normalize(fields: dict) -> dict:
+    # La nouvelle implémentation convertit les <br> en retours à la ligne
+    return {k: BR_PATTERN.sub("\n", v) for k, v in fields.items()}
+
+
+def perturbed_scenario(template: str, rng: random.Random) -> str:
+    """Scénario "raffiné" : prose ajoutée entre les lignes, cellules modifiées"""
+    lines = []
+    for line in template.splitlines():
+        if line.startswith("|") and rng.random() < 0.3:
+            line = line[:-1] + f" Variante {rng.randint(0, 999)} |"
+        lines.append(line)
+        if rng.random() < 0.2:
+            lines.append(f"Note du correcteur {rng.randint(0, 999)} : " + "texte " * rng.randint(1, 40))
+    return "\n".join(lines)
+
+
+def large_scenario(template: str, size_factor: int) -> str:
+    """Scénario volumineux : beaucoup de texte libre autour des deux tableaux"""
+    filler = "\n".join(f"Paragraphe {i} : " + "contexte détaillé " * 30 for i in range(size_factor))
+    parts = template.split("**PAGE 2**")
+    return filler + parts[0] + filler + "**PAGE 2**" + parts[1] + filler
+
+
+def check_equivalence(samples: int = 200):
+    rng = random.Random(42)
+    checked = 0
+    for name in ("jeu_de_role", "jeu_de_role_evenement"):
+        template = PROMPT_TEMPLATES[name]
+        variants = [template, template.replace("FICHE SUJET – nom du JURY", "FICHE JURY")]
+        variants += [perturbed_scenario(template, rng) for _ in range(samples)]
+        for content in variants:
+            old_candidat, old_jury = legacy_extract_tables(content)
+            new_candidat, new_jury = extract_tables_from_markdown(content)
+            assert normalize(old_candidat) == new_candidat, f"{name}: candidat différent"
+            assert normalize(old_jury) == new_jury, f"{name}: jury différent"
+            checked += 1
+        assert extract_tables_from_markdown(template)[0], f"{name}: tableau candidat vide"
+        assert extract_tables_from_markdown(template)[1], f"{name}: tableau jury vide"
+    print(f"Équivalence ancienne/nouvelle extraction vérifiée sur {checked} scénarios\n")
+
+
+class UncachedTemplate:
+    """Ancien comportement : relecture et parsing du fichier à chaque export"""
+    def get_document(self):
+        return Document(TEMPLATE_PATH)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    spec = scenario_render_spec(sample_request())
+    print(f"{n} exports DOCX par mesure\n")
+
+    timed("Chargement template (disque + parsing)", lambda: Document(TEMPLATE_PATH), n)
+    timed("Chargement template (copie en mémoire)", scenario_export.template_cache.get_document, n)
+
+    cached = scenario_export.template_cache
+    scenario_export.template_cache = UncachedTemplate()
+    before = timed("Export complet AVANT (template relu)", lambda: render_scenario_docx(spec), n)
+    scenario_export.template_cache = cached
+    after = timed("Export complet APRÈS (template en cache)", lambda: render_scenario_docx(spec), n)
+
+    print(f"\nGain : {before - after:.2f} ms/export ({(1 - after / before) * 100:.0f} %)\n")
+
+    check_equivalence()
+    for size_factor in (10, 100, 1000):
+        content = large_scenario(PROMPT_TEMPLATES["jeu_de_role"], size_factor)
+        runs = max(1, n // size_factor)
+        print(f"Scénario de {len(content) // 1024} Ko ({runs} extractions)")
+        before = timed("  Extraction AVANT (2 appels, find par ligne)", lambda: legacy_extract_tables(content), runs)
+        after = timed("  Extraction APRÈS (passe unique)", lambda: extract_tables_from_markdown(content), runs)
+        print(f"  Facteur : x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Construit l'index BM25 des documents de knowledge/ (.docx, .pdf, .txt, .md).
+
+Les sous-dossiers de knowledge/ servent de catégories (ex: knowledge/NDRC/) ;
+les fichiers à la racine sont utilisés pour toutes les filières.
+
+Usage : python build_knowledge_index.py ["requête de test"]
+"""
+import sys
+import time
+from app.services.knowledge_index import build_index, open_current
+from app.services.knowledge_service import KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR
+
+
+def main():
+    start = time.perf_counter()
+    stats = build_index(KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Index {stats['generation']} : {stats['files']} documents, {stats['chunks']} passages en {elapsed:.1f} s")
+    print(f"   {KNOWLEDGE_INDEX_DIR}")
+
+    if len(sys.argv) > 1:
+        index = open_current(KNOWLEDGE_INDEX_DIR)
+        for result in index.search(sys.argv[1]):
+            print(f"\n[{result['score']}] {result['file']}\n{result['text'][:300]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Vérification des requêtes N+1 sur les routes de suivi (classes, échéances,
+soumissions, administration) avec le détecteur QUERY_DEBUG (app/services/query_debug.py).
+
+La base est une SQLite temporaire : un professeur, ses classes, ses élèves,
+des échéances et une soumission par élève et par échéance. Chaque route est
+appelée une fois ; une requête SQL répétée par ligne (QUERY_DEBUG_REPEAT fois
+ou plus) est signalée.
+
+Code de sortie 1 si un appel échoue (4xx/5xx) ou si une route absente de
+KNOWN_N_PLUS_ONE est signalée : à lancer avant de modifier ces routeurs, pour
+ne pas réintroduire de N+1.
+
+Usage : python check_queries.py [élèves]
+"""
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ["QUERY_DEBUG"] = "1"
+os.environ.setdefault("KNOWLEDGE_WATCH_INTERVAL", "0")
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="check_queries_"), "check.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from fastapi.testclient import TestClient  # noqa: E402
+import main  # noqa: E402
+from app.auth import create_access_token  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import User  # noqa: E402
+from app.models_classes import Class, ClassStudent  # noqa: E402
+from app.models_tracking import Deadline, Submission  # noqa: E402
+from app.services.query_debug import get_detector  # noqa: E402
+
+# Routes encore en N+1 (une requête par ligne) : à retirer de la liste une fois corrigées
+KNOWN_N_PLUS_ONE = {
+    ("GET", "/api/classes"),
+    ("GET", "/api/deadlines"),
+    ("GET", "/api/deadlines/calendar/{year}/{month}"),
+    ("GET", "/api/tracking/submissions"),
+    ("GET", "/api/admin/teachers"),
+}
+
+
+def seed(students: int):
+    db = SessionLocal()
+    admin = User(name="Admin Check", email="admin.check@example.com", role="admin", hashed_password="")
+    teachers = [User(name=f"Prof {i}", email=f"prof{i}.check@example.com", role="teacher", hashed_password="") for i in range(6)]
+    db.add_all([admin] + teachers)
+    db.flush()
+    teacher = teachers[0]
+    pupils = [User(name=f"Élève {i}", email=f"eleve{i}.check@example.com", role="student", teacher_id=teacher.id)
+              for i in range(students)]
+    classes = [Class(name=f"BTS NDRC {i}", teacher_id=teacher.id) for i in range(6)]
+    today = date.today()
+    deadlines = [Deadline(title=f"Échéance {i}", document_type="compte_rendu_hebdo", exam_type="E4",
+                          due_date=today + timedelta(days=i), teacher_id=teacher.id) for i in range(6)]
+    db.add_all(pupils + classes + deadlines)
+    db.flush()
+    db.add_all([ClassStudent(class_id=classes[i % len(classes)].id, student_id=pupil.id) for i, pupil in enumerate(pupils)])
+    db.add_all([Submission(student_id=pupil.id, deadline_id=deadline.id, file_name="rapport.pdf")
+                for pupil in pupils for deadline in deadlines])
+    db.commit()
+    ids = {
+        "admin": admin.email, "teacher": teacher.email, "student": pupils[0].email,
+        "class_id": classes[0].id, "deadline_id": deadlines[0].id,
+        "submission_id": db.query(Submission.id).first()[0],
+    }
+    db.close()
+    return ids
+
+
+def main_check():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    with TestClient(main.app) as client:
+        ids = seed(students)
+        today = date.today()
+        calls = [
+            ("teacher", "/api/classes"),
+            ("teacher", f"/api/classes/{ids['class_id']}"),
+            ("teacher", f"/api/classes/{ids['class_id']}/students"),
+            ("teacher", "/api/deadlines"),
+            ("student", "/api/deadlines"),
+            ("teacher", f"/api/deadlines/{ids['deadline_id']}"),
+            ("teacher", f"/api/deadlines/calendar/{today.year}/{today.month}"),
+            ("teacher", "/api/tracking/submissions"),
+            ("student", "/api/tracking/submissions"),
+            ("teacher", f"/api/tracking/submissions/{ids['submission_id']}"),
+            ("admin", "/api/admin/teachers"),
+            ("admin", "/api/admin/stats"),
+        ]
+        failed = []
+        for role, url in calls:
+            headers = {"Authorization": f"Bearer {create_access_token({'sub': ids[role]})}"}
+            response = client.get(url, headers=headers)
+            if response.status_code >= 400:
+                # Une route en erreur n'exécute presque aucune requête : elle paraîtrait saine
+                failed.append(f"{url} ({role}) : HTTP {response.status_code}")
+
+    reports = list(get_detector().reports)
+    flagged = {(report.method, report.route) for report in reports}
+    new = [report for report in reports if (report.method, report.route) not in KNOWN_N_PLUS_ONE]
+    print(f"\n{len(calls)} appels, {students} élèves : {len(reports)} signalement(s)")
+    for key in sorted(KNOWN_N_PLUS_ONE - flagged):
+        print(f"✅ {' '.join(key)} n'est plus signalée : à retirer de KNOWN_N_PLUS_ONE")
+    for report in new:
+        print(f"❌ Nouveau N+1 : {report}")
+    for failure in failed:
+        print(f"❌ Appel en échec : {failure}")
+    return 1 if new or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
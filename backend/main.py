@@ -1,22 +1,44 @@
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
 from fastapi import FastAPI, Depends, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from app.database import engine, get_db, Base
 from app import models, init_db
-from app.models import User, Evaluation, EvaluationScore, SituationType, EvaluationType
+from app.models import User, Evaluation, EvaluationScore, EvaluationAttachment, SituationType, EvaluationType
 import uvicorn
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
 from datetime import date, datetime
 
-# Init DB models
-Base.metadata.create_all(bind=engine)
-
 from app.routers import generate, export, submissions, auth, scenario_export
-from app.routers import classes, deadlines, tracking_submissions, admin, students
+from app.routers import classes, deadlines, tracking_submissions, admin, students, evaluations, analytics, referentiel
 from app.auth import get_current_user_optional
+from app.services import analytics_service, metrics, query_debug
+from app.services.metrics import MetricsMiddleware
+from app.services.referentiel_service import get_index as get_referentiel_index
+from app.services.gemini_service import get_gemini_service
+from app.services.knowledge_service import get_knowledge_base, start_watcher as start_knowledge_watcher
+
+# PROFILE_STARTUP=1 prints the duration of each startup step (import breakdown: profile_startup.py)
+PROFILE_STARTUP = os.getenv("PROFILE_STARTUP") == "1"
+
+@contextmanager
+def startup_step(name: str):
+    start = time.perf_counter()
+    yield
+    if PROFILE_STARTUP:
+        print(f"⏱️ Startup: {name} {(time.perf_counter() - start) * 1000:.1f} ms")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    on_startup()
+    yield
+    on_shutdown()
 
-app = FastAPI(title="ProfVirtuel V2 - E6 & CCF")
+app = FastAPI(title="ProfVirtuel V2 - E6 & CCF", lifespan=lifespan)
 
 app.include_router(generate.router, prefix="/api", tags=["Generate"])
 app.include_router(submissions.router, prefix="/api", tags=["Submissions"])
@@ -30,6 +52,9 @@ app.include_router(deadlines.router, tags=["Deadlines"])
 app.include_router(tracking_submissions.router, tags=["Tracking Submissions"])
 app.include_router(admin.router, tags=["Admin"])
 app.include_router(students.router, tags=["Students"])
+app.include_router(evaluations.router, tags=["Evaluations"])
+app.include_router(analytics.router, tags=["Analytics"])
+app.include_router(referentiel.router, tags=["Referentiel"])
 
 # --- Schemas Pydantic (Entrée/Sortie API) ---
 
@@ -47,17 +72,7 @@ class StudentRead(BaseModel):
     class Config:
         orm_mode = True
 
-class EvaluationCreate(BaseModel):
-    studentId: int
-    date: str
-    ratings: Dict[str, str] # "skill_id": "TI/I/S/TS"
-    comment: Optional[str] = None
-    globalComment: Optional[str] = None
-    type: str # 'continuous' or 'final'
-    domainId: Optional[str] = None # 'E6_DISTRIBUTION', etc.
-
 # --- Configuration CORS ---
-import os
 origins = [
     "http://localhost:3000",
     "http://localhost:3001",
@@ -79,12 +94,89 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latence, statut et requêtes SQL par route : exposés sur /metrics (format Prometheus)
+app.add_middleware(MetricsMiddleware)
+
+# QUERY_DEBUG=1 : avertit des requêtes SQL répétées par route (N+1), voir app/services/query_debug.py
+if query_debug.QUERY_DEBUG:
+    query_debug.get_detector().attach(engine)
+    app.add_middleware(query_debug.QueryDebugMiddleware)
+
 from fastapi.staticfiles import StaticFiles
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 # --- Startup Event ---
-@app.on_event("startup")
+LATE_COLUMNS = [
+    ("evaluations", "client_id", "VARCHAR"),
+    ("evaluations", "domain_id", "VARCHAR"),
+    ("evaluations", "content_hash", "VARCHAR(64)"),
+    ("evaluations", "version", "INTEGER"),
+    ("evaluations", "deleted_at", "TIMESTAMP"),
+    ("evaluations", "client_type", "VARCHAR(20)"),
+    ("evaluation_scores", "skill_key", "VARCHAR"),
+    ("evaluation_scores", "rating", "VARCHAR(4)"),
+]
+
+LATE_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_evaluations_client_id ON evaluations (client_id)",
+    "CREATE INDEX IF NOT EXISTS ix_evaluations_version ON evaluations (version)",
+    "CREATE INDEX IF NOT EXISTS ix_evaluations_student_date ON evaluations (student_id, date)",
+    "CREATE INDEX IF NOT EXISTS ix_evaluation_scores_evaluation_id ON evaluation_scores (evaluation_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_competency_rollups_key ON competency_rollups (student_id, competency_id, COALESCE(session_id, 0))",
+]
+
+# Doublons laissés par des refresh_rollups concurrents : supprimés une seule fois, tant que
+# l'index unique n'existe pas (rebuild_rollups.py recalcule ensuite les valeurs)
+ROLLUP_DEDUPE = "DELETE FROM competency_rollups WHERE id NOT IN (SELECT MIN(id) FROM competency_rollups GROUP BY student_id, competency_id, COALESCE(session_id, 0))"
+
+INDEX_LOOKUP = {
+    "sqlite": "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name",
+    "postgresql": "SELECT 1 FROM pg_indexes WHERE indexname = :name",
+}
+
+def index_exists(name: str) -> bool:
+    from sqlalchemy import text
+    lookup = INDEX_LOOKUP.get(engine.dialect.name)
+    if lookup is None:
+        return False  # Base inconnue : le dédoublonnage est sans effet s'il n'y a pas de doublons
+    with engine.connect() as conn:
+        return conn.execute(text(lookup), {"name": name}).first() is not None
+
 def on_startup():
+    # Init DB models
+    with startup_step("create_all"):
+        Base.metadata.create_all(bind=engine)
+
+    with startup_step("migrations"):
+        run_migrations()
+
+    # Standard init
+    with startup_step("init_db"):
+        try:
+            db = next(get_db())
+            init_db.init_db(db)
+        except Exception as e:
+            print(f"❌ Error during init_db: {e}")
+
+    # Build the referentiel index once (exports, sync and /api/referentiel read it)
+    with startup_step("referentiel"):
+        try:
+            get_referentiel_index()
+        except Exception as e:
+            print(f"❌ Error loading referentiel: {e}")
+
+    # Resumable uploads abandoned while the server was down
+    with startup_step("uploads_partial"):
+        tracking_submissions.sweep_partial_uploads(force=True)
+
+    # Cheap constructors only: google.genai is imported on the first generation
+    with startup_step("services"):
+        get_gemini_service()
+        get_knowledge_base()
+        # Documents ajoutés à knowledge/ en cours d'année : ré-indexation incrémentale en tâche de fond
+        start_knowledge_watcher()
+
+def run_migrations():
     # Safety Migration: Add class_name column BEFORE anything else
     from sqlalchemy import text
     try:
@@ -116,17 +208,48 @@ def on_startup():
     except Exception as e:
         print(f"❌ Migration failed: {e}")
 
-    # Standard init
-    try:
-        db = next(get_db())
-        init_db.init_db(db)
-    except Exception as e:
-        print(f"❌ Error during init_db: {e}")
+    # Migrations for columns added after the tables were first created
+    # (one transaction per statement so a failure doesn't abort the others on Postgres)
+    for table, column, col_type in LATE_COLUMNS:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {col_type}"))
+        except Exception:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}"))
+                print(f"✅ Migration: Column {table}.{column} added (Standard)")
+            except Exception:
+                pass
+    if not index_exists("ux_competency_rollups_key"):
+        try:
+            with engine.begin() as conn:
+                removed = conn.execute(text(ROLLUP_DEDUPE)).rowcount
+            if removed:
+                print(f"✅ Migration: {removed} duplicate competency rollups removed")
+        except Exception as e:
+            print(f"❌ Rollup dedupe failed: {e}")
+    for statement in LATE_INDEXES:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(statement))
+        except Exception as e:
+            print(f"❌ Index migration failed: {e}")
+
+def on_shutdown():
+    from app.services import extraction_service, render_service, knowledge_service
+    extraction_service.shutdown()
+    render_service.shutdown()
+    knowledge_service.shutdown()
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "version": "v2.0-core", "service": "ProfVirtuel V2"}
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # --- Routes Étudiants ---
 
 @app.get("/students", response_model=List[StudentRead])
@@ -185,43 +308,16 @@ def delete_student(student_id: int, db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    # Supprimer d'abord les évaluations liées ? Ou cascade ?
-    # Pour l'instant on supprime juste le user, SQLAlchemy gérera ou on aura une erreur de clé étrangère
-    # Idéalement on supprime les évals d'abord
-    db.query(Evaluation).filter(Evaluation.student_id == student_id).delete()
+    # Scores et pièces jointes d'abord, puis les évaluations (même ordre que la purge de auth.py)
+    eval_ids = [evaluation_id for (evaluation_id,) in db.query(Evaluation.id).filter(Evaluation.student_id == student_id)]
+    if eval_ids:
+        db.query(EvaluationScore).filter(EvaluationScore.evaluation_id.in_(eval_ids)).delete(synchronize_session=False)
+        db.query(EvaluationAttachment).filter(EvaluationAttachment.evaluation_id.in_(eval_ids)).delete(synchronize_session=False)
+        db.query(Evaluation).filter(Evaluation.id.in_(eval_ids)).delete(synchronize_session=False)
+    analytics_service.refresh_rollups(db, [student_id])
     db.delete(user)
     db.commit()
     return {"status": "deleted"}
 
-# --- Routes Évaluations ---
-
-@app.get("/evaluations")
-def get_all_evaluations(db: Session = Depends(get_db)):
-    # Pour le MVP on renvoie tout et le front filtrera, ou on peut filtrer par etudiant
-    # On va mapper le format DB vers le format attendu par le front React
-    evals = db.query(Evaluation).all()
-    
-    result = []
-    # Mapper vers le format JSON du front : { id, studentId, domainId, date, ratings, comment }
-    # Note: Notre modèle DB est relationnel (Evaluation -> Scores -> Criteria), le front envoie un JSON plat.
-    # Pour l'instant, on va stocker le JSON brut dans 'global_comment' ou 'comment' pour aller vite, 
-    # OU faire le mapping propre. Faisons le mapping propre plus tard.
-    # Pour l'instant, SIMULATION avec une fausse DB en mémoire si besoin ou stockage JSON
-    return [] 
-
-# NOTE: Pour aller très vite et coller au code React existant qui attend un gros JSON,
-# Je vais créer un endpoint tampon qui sauvegarde le JSON tel quel dans une structure simple
-# En attendant de faire le mapping complet relationnel.
-
-@app.post("/sync/evaluations")
-def sync_evaluations(data: List[Dict[str, Any]] = Body(...)):
-    """
-    Endpoint temporaire pour sauvegarder le dump JSON du front
-    afin de persister les données sans refaire tout le backend relationnel immédiatement.
-    """
-    # Dans une vraie V2, on mapperait chaque éval.
-    # Ici on peut juste logger pour dire qu'on a reçu.
-    return {"status": "synced", "count": len(data)}
-
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,71 @@
+"""
+Profil du démarrage à froid de l'API.
+
+1. Temps d'import de main.py, ventilé par paquet de premier niveau
+   (via `python -X importtime`, dans un processus neuf).
+2. Durée de chaque étape du lifespan (PROFILE_STARTUP=1).
+
+Usage : python profile_startup.py [nombre_de_lignes]
+"""
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_breakdown(top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        sys.exit(1)
+
+    # Format : "import time: self [us] | cumulative | imported package"
+    self_by_package = defaultdict(int)
+    app_modules = []
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        package = name.split(".")[0]
+        self_by_package[package] += int(self_us)
+        total_us += int(self_us)
+        if package in ("app", "main"):
+            app_modules.append((int(cumulative_us), name))
+
+    print(f"Import de main.py : {total_us / 1000:.0f} ms au total\n")
+    print(f"{'Paquet':<30} {'ms':>8} {'%':>6}")
+    for package, us in sorted(self_by_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"{package:<30} {us / 1000:8.1f} {us * 100 / total_us:6.1f}")
+
+    print(f"\nModules de l'application (temps cumulé, dépendances comprises)")
+    for cumulative_us, name in sorted(app_modules, reverse=True)[:top]:
+        print(f"{name:<45} {cumulative_us / 1000:8.1f} ms")
+
+
+def lifespan_steps():
+    print("\nÉtapes du lifespan")
+    code = (
+        "from fastapi.testclient import TestClient\n"
+        "import main\n"
+        "with TestClient(main.app):\n"
+        "    pass\n"
+    )
+    env = {**os.environ, "PROFILE_STARTUP": "1"}
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, env=env)
+    for line in result.stdout.splitlines():
+        if line.startswith("⏱️"):
+            print(line)
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+
+
+if __name__ == "__main__":
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    import_breakdown(top)
+    lifespan_steps()
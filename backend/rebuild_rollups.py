@@ -0,0 +1,47 @@
+"""
+Maintenance de la table competency_rollups (maîtrise élève x compétence x session).
+
+Usage :
+  python rebuild_rollups.py           # reconstruction complète (backfill), critères des scores synchronisés recalculés
+  python rebuild_rollups.py --check   # vérifie la cohérence sans rien modifier (code 1 si écarts)
+  python rebuild_rollups.py --check --fix   # vérifie puis reconstruit si des écarts sont trouvés
+"""
+import sys
+from app.database import SessionLocal, engine, Base
+from app import models
+from app.services import analytics_service
+
+
+def main():
+    args = sys.argv[1:]
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if "--check" in args:
+            issues = analytics_service.check_rollups(db)
+            if not issues:
+                print("✅ Rollups cohérents avec les scores")
+                return 0
+            print(f"❌ {len(issues)} écart(s) (élève, compétence, session) :")
+            for issue in issues[:50]:
+                print(f"   {issue}")
+            if "--fix" not in args:
+                return 1
+
+        remapped = analytics_service.remap_sync_scores(db)
+        if remapped:
+            print(f"✅ {remapped} score(s) synchronisé(s) rattaché(s) à la bonne compétence")
+        count = analytics_service.rebuild_rollups(db)
+        db.commit()
+        print(f"✅ {count} rollups reconstruits")
+        return 0
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Échec : {e}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
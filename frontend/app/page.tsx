@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useState, useEffect, useMemo } from "react";
+import React, { useState, useEffect, useMemo, useRef } from "react";
 import {
     FileCheck, LayoutDashboard, Settings, Award, Plus, Sparkles,
     TrendingUp, Users, UserX, BarChart2, FileText, GraduationCap, BookOpen
@@ -181,15 +181,61 @@ export default function Home() {
     }, [user]);
 
     // --- Sync Logic (Background) ---
+    // Delta sync: only evaluations whose JSON changed since the last successful sync
+    // are sent, plus the ids removed locally. The server returns what other devices
+    // changed since our last known version.
+    const syncedEvals = useRef<Record<string, string> | null>(null);
     useEffect(() => {
         localStorage.setItem('ndrc_evaluations', JSON.stringify(evaluations));
-        if (evaluations.length > 0) {
-            fetch(`${API_URL}/sync/evaluations`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(evaluations)
-            }).catch(e => console.warn("Sync failed", e));
+
+        if (syncedEvals.current === null) {
+            syncedEvals.current = JSON.parse(localStorage.getItem('ndrc_synced_evaluations') || '{}');
         }
+        const synced = syncedEvals.current!;
+        const current: Record<string, string> = {};
+        evaluations.forEach(e => { current[String(e.id)] = JSON.stringify(e); });
+
+        const changed = evaluations.filter(e => synced[String(e.id)] !== current[String(e.id)]);
+        const deleted = Object.keys(synced).filter(id => !(id in current));
+        if (changed.length === 0 && deleted.length === 0) return;
+
+        const sinceVersion = parseInt(localStorage.getItem('ndrc_sync_version') || '0', 10);
+        const token = localStorage.getItem('token');
+        const headers: any = { 'Content-Type': 'application/json' };
+        if (token) headers['Authorization'] = `Bearer ${token}`;
+        fetch(`${API_URL}/sync/evaluations`, {
+            method: 'POST',
+            headers,
+            body: JSON.stringify({ evaluations: changed, deleted, since_version: sinceVersion })
+        })
+            .then(res => res.ok ? res.json() : Promise.reject(res.status))
+            .then(data => {
+                changed.forEach(e => { synced[String(e.id)] = current[String(e.id)]; });
+                deleted.forEach(id => { delete synced[id]; });
+
+                // Deleted on another device: drop locally, nothing left to sync for them
+                const removedIds = new Set<string>((data.changes || []).filter((c: any) => c.deleted).map((c: any) => String(c.id)));
+                removedIds.forEach(id => { delete synced[id]; });
+
+                const remote: Evaluation[] = (data.changes || []).filter((c: any) => !c.deleted).map((c: any) => ({
+                    id: c.id, studentId: c.studentId, domainId: c.domainId,
+                    date: c.date, ratings: c.ratings, comment: c.comment || '',
+                    // 'continuous' is the default: keep the field absent, as for locally created evaluations
+                    ...(c.type && c.type !== 'continuous' ? { type: c.type } : {})
+                }));
+                remote.forEach(e => { synced[String(e.id)] = JSON.stringify(e); });
+
+                localStorage.setItem('ndrc_synced_evaluations', JSON.stringify(synced));
+                localStorage.setItem('ndrc_sync_version', String(data.version));
+                if (remote.length > 0 || removedIds.size > 0) {
+                    const remoteIds = new Set(remote.map(e => String(e.id)));
+                    setEvaluations(prev => [
+                        ...prev.filter(e => !remoteIds.has(String(e.id)) && !removedIds.has(String(e.id))),
+                        ...remote
+                    ]);
+                }
+            })
+            .catch(e => console.warn("Sync failed", e));
     }, [evaluations]);
 
     useEffect(() => {
@@ -836,7 +882,7 @@ export default function Home() {
 
                         {view === 'compare' && activeStudentId && <ComparisonView
                             student={students.find(s => s.id === activeStudentId)}
-                            evaluations={evaluations}
+                            evaluations={evaluations.filter(e => e.studentId === activeStudentId)}
                             finalEvaluation={finalEvaluations.find(e => e.studentId === activeStudentId)}
                             reflexiveData={reflexiveData[activeStudentId]}
                             onSaveReflexive={saveReflexive}
@@ -43,6 +43,7 @@ export interface Evaluation {
     date: string;
     ratings: Record<string, Rating>;
     comment: string;
+    type?: string; // 'continuous' (default), 'final', 'E4', 'E6' — returned as sent by /sync/evaluations
 }
 
 export interface FinalEvaluation {
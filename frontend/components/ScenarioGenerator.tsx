@@ -8,14 +8,25 @@ interface ScenarioGeneratorProps {
     students?: any[];
 }
 
+// Le jeton identifie le professeur dans la file de génération (quota par enseignant)
+const generationHeaders = (): Record<string, string> => {
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    const token = typeof window !== 'undefined' ? localStorage.getItem('token') : null;
+    if (token) headers['Authorization'] = `Bearer ${token}`;
+    return headers;
+};
+
 export default function ScenarioGenerator({ onBack, blockType, students = [] }: ScenarioGeneratorProps) {
     const [topic, setTopic] = useState('');
     const [scenarioType, setScenarioType] = useState('jeu_de_role_evenement'); // Default to Event
     const [generatedContent, setGeneratedContent] = useState('');
+    const [templateVersion, setTemplateVersion] = useState<string | null>(null);
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState('');
     const [refineInstruction, setRefineInstruction] = useState('');
     const [refining, setRefining] = useState(false);
+    // Session de retouche côté serveur : après le premier tour, seule l'instruction est envoyée
+    const [refineSessionId, setRefineSessionId] = useState<string | null>(null);
 
     // New state for student loader
     const [selectedStudentId, setSelectedStudentId] = useState<number | null>(null);
@@ -43,12 +54,13 @@ export default function ScenarioGenerator({ onBack, blockType, students = [] }:
         setLoading(true);
         setError('');
         setGeneratedContent('');
+        setRefineSessionId(null);
 
         try {
             const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
             const response = await fetch(`${API_URL}/api/course`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: generationHeaders(),
                 body: JSON.stringify({
                     topic: topic,
                     document_type: scenarioType,
@@ -64,6 +76,7 @@ export default function ScenarioGenerator({ onBack, blockType, students = [] }:
 
             const data = await response.json();
             setGeneratedContent(data.content);
+            setTemplateVersion(data.template_version || null);
         } catch (err: any) {
             console.error(err);
             setError(err.message);
@@ -79,16 +92,34 @@ export default function ScenarioGenerator({ onBack, blockType, students = [] }:
 
         try {
             const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
-            const response = await fetch(`${API_URL}/api/refine`, {
+
+            const openSession = async () => {
+                const res = await fetch(`${API_URL}/api/refine/sessions`, {
+                    method: 'POST',
+                    headers: generationHeaders(),
+                    body: JSON.stringify({ content: generatedContent, track: 'NDRC' })
+                });
+                if (!res.ok) {
+                    const err = await res.json();
+                    throw new Error(err.detail || 'Erreur lors de la modification');
+                }
+                const session = await res.json();
+                setRefineSessionId(session.session_id);
+                return session.session_id as string;
+            };
+
+            const sendInstruction = (sessionId: string) => fetch(`${API_URL}/api/refine/sessions/${sessionId}/messages`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    current_content: generatedContent,
-                    instruction: refineInstruction,
-                    track: 'NDRC'
-                })
+                headers: generationHeaders(),
+                body: JSON.stringify({ instruction: refineInstruction })
             });
 
+            let response = await sendInstruction(refineSessionId || await openSession());
+            if (response.status === 404) {
+                // Session expirée côté serveur : on repart du document affiché
+                response = await sendInstruction(await openSession());
+            }
+
             if (!response.ok) {
                 const err = await response.json();
                 throw new Error(err.detail || 'Erreur lors de la modification');
@@ -126,7 +157,8 @@ export default function ScenarioGenerator({ onBack, blockType, students = [] }:
                     scenario_type: scenarioType,
                     content: generatedContent,
                     exam_type: blockType,
-                    student_name: studentName
+                    student_name: studentName,
+                    template_version: templateVersion
                 })
             });
 
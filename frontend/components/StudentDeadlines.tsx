@@ -3,6 +3,72 @@ import { Calendar, Upload, FileText, CheckCircle, Clock, AlertCircle, Download,
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
+// Au-delà de cette taille, envoi par morceaux reprenables (Wi-Fi instable)
+const RESUMABLE_THRESHOLD = 10 * 1024 * 1024;
+const CHUNK_SIZE = 5 * 1024 * 1024;
+const MAX_CHUNK_RETRIES = 5;
+
+// Empreinte d'un morceau (Upload-Checksum) : le serveur vérifie chaque morceau,
+// sans jamais charger le fichier entier en mémoire côté navigateur
+const sha256Base64 = async (chunk: Blob) => {
+    const digest = await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+    return btoa(String.fromCharCode(...Array.from(new Uint8Array(digest))));
+};
+
+const uploadResumable = async (file: File, onProgress?: (percent: number) => void) => {
+    const authHeader = { 'Authorization': `Bearer ${localStorage.getItem('token')}` };
+    const baseUrl = `${API_URL}/api/tracking/submissions/upload/resumable`;
+
+    const initResponse = await fetch(baseUrl, {
+        method: 'POST',
+        headers: { ...authHeader, 'Content-Type': 'application/json' },
+        body: JSON.stringify({ file_name: file.name, file_size: file.size })
+    });
+    if (!initResponse.ok) throw new Error('Upload init failed');
+    const { upload_id } = await initResponse.json();
+
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+        try {
+            const chunk = file.slice(offset, offset + CHUNK_SIZE);
+            const chunkResponse = await fetch(`${baseUrl}/${upload_id}`, {
+                method: 'PATCH',
+                headers: {
+                    ...authHeader,
+                    'Upload-Offset': String(offset),
+                    'Upload-Checksum': `sha256 ${await sha256Base64(chunk)}`,
+                    'Content-Type': 'application/offset+octet-stream'
+                },
+                body: chunk
+            });
+            if (!chunkResponse.ok && chunkResponse.status !== 409) throw new Error('Chunk failed');
+            if (chunkResponse.status === 409) {
+                // Offset désynchronisé : on redemande au serveur où reprendre
+                const statusResponse = await fetch(`${baseUrl}/${upload_id}`, { headers: authHeader });
+                offset = (await statusResponse.json()).offset;
+            } else {
+                offset = (await chunkResponse.json()).offset;
+            }
+            retries = 0;
+            onProgress?.(Math.round((offset / file.size) * 100));
+        } catch (error) {
+            if (++retries > MAX_CHUNK_RETRIES) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            const statusResponse = await fetch(`${baseUrl}/${upload_id}`, { headers: authHeader }).catch(() => null);
+            if (statusResponse?.ok) offset = (await statusResponse.json()).offset;
+        }
+    }
+
+    const finalizeResponse = await fetch(`${baseUrl}/${upload_id}/finalize`, {
+        method: 'POST',
+        headers: { ...authHeader, 'Content-Type': 'application/json' },
+        body: JSON.stringify({})
+    });
+    if (!finalizeResponse.ok) throw new Error('Upload finalize failed');
+    return finalizeResponse.json();
+};
+
 interface Deadline {
     id: number;
     title: string;
@@ -31,6 +97,7 @@ export default function StudentDeadlines() {
     const [selectedFile, setSelectedFile] = useState<File | null>(null);
     const [uploadingFor, setUploadingFor] = useState<number | null>(null);
     const [loading, setLoading] = useState(false);
+    const [uploadProgress, setUploadProgress] = useState<number | null>(null);
     const [activeTab, setActiveTab] = useState<'upcoming' | 'submitted'>('upcoming');
 
     useEffect(() => {
@@ -83,23 +150,28 @@ export default function StudentDeadlines() {
 
         setLoading(true);
         try {
-            // 1. Upload le fichier
-            const formData = new FormData();
-            formData.append('file', selectedFile);
+            // 1. Upload le fichier (par morceaux reprenables pour les gros fichiers)
+            let uploadData;
+            if (selectedFile.size > RESUMABLE_THRESHOLD) {
+                uploadData = await uploadResumable(selectedFile, setUploadProgress);
+            } else {
+                const formData = new FormData();
+                formData.append('file', selectedFile);
 
-            const uploadResponse = await fetch(`${API_URL}/api/tracking/submissions/upload`, {
-                method: 'POST',
-                headers: {
-                    'Authorization': `Bearer ${localStorage.getItem('token')}`
-                },
-                body: formData
-            });
+                const uploadResponse = await fetch(`${API_URL}/api/tracking/submissions/upload`, {
+                    method: 'POST',
+                    headers: {
+                        'Authorization': `Bearer ${localStorage.getItem('token')}`
+                    },
+                    body: formData
+                });
 
-            if (!uploadResponse.ok) {
-                throw new Error('Upload failed');
-            }
+                if (!uploadResponse.ok) {
+                    throw new Error('Upload failed');
+                }
 
-            const uploadData = await uploadResponse.json();
+                uploadData = await uploadResponse.json();
+            }
 
             // 2. Créer la soumission
             const submitResponse = await fetch(`${API_URL}/api/tracking/submissions`, {
@@ -127,6 +199,7 @@ export default function StudentDeadlines() {
             alert('Erreur lors de la soumission. Veuillez réessayer.');
         } finally {
             setLoading(false);
+            setUploadProgress(null);
         }
     };
 
@@ -297,7 +370,7 @@ export default function StudentDeadlines() {
                                                     disabled={loading}
                                                     className="flex items-center gap-2 px-6 py-2 bg-blue-600 text-white rounded-lg hover:bg-blue-700 transition-colors disabled:opacity-50 disabled:cursor-not-allowed"
                                                 >
-                                                    {loading ? 'Envoi...' : 'Soumettre'}
+                                                    {loading ? (uploadProgress !== null ? `Envoi... ${uploadProgress}%` : 'Envoi...') : 'Soumettre'}
                                                 </button>
                                             )}
                                         </div>
@@ -47,14 +47,10 @@ export default function StudentView({ student, evaluations, finalEvaluation, cla
 
     const handleExport = async (format: 'pdf' | 'docx') => {
         try {
-            const response = await fetch(`${API_URL}/api/export/${format}`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    student_id: student.id,
-                    exam_type: selectedBlock,
-                    evaluations: evaluations
-                })
+            // Rendered server-side from the synced evaluations
+            const token = localStorage.getItem('token');
+            const response = await fetch(`${API_URL}/api/export/students/${student.id}/bilan?exam_type=${selectedBlock}&format=${format}`, {
+                headers: token ? { 'Authorization': `Bearer ${token}` } : {}
             });
 
             if (response.ok) {
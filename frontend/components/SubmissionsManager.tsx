@@ -19,6 +19,8 @@ interface Submission {
     feedback: string | null;
     student_name: string | null;
     deadline_title: string | null;
+    preview: string | null;
+    extraction_status: string | null;
 }
 
 export default function SubmissionsManager() {
@@ -211,6 +213,13 @@ export default function SubmissionsManager() {
                                                 <h3 className="text-xl font-black text-gray-900 truncate group-hover:text-indigo-600 transition-colors">
                                                     {submission.file_name || 'Document sans nom'}
                                                 </h3>
+                                                {submission.preview ? (
+                                                    <p className="mt-3 text-sm text-gray-500 font-medium line-clamp-2 whitespace-pre-line">
+                                                        {submission.preview}
+                                                    </p>
+                                                ) : submission.extraction_status === 'pending' && (
+                                                    <p className="mt-3 text-xs text-gray-300 font-bold uppercase tracking-widest">Aperçu en cours de génération...</p>
+                                                )}
                                                 <div className="flex items-center gap-4 mt-3">
                                                     <div className="flex items-center gap-2 text-sm">
                                                         <div className="w-6 h-6 rounded-full bg-indigo-50 flex items-center justify-center text-indigo-600">
@@ -280,6 +289,15 @@ export default function SubmissionsManager() {
                         </div>
 
                         <div className="space-y-6">
+                            {selectedSubmission.preview && (
+                                <div className="space-y-2">
+                                    <label className="text-[10px] font-black text-gray-400 uppercase tracking-[0.2em] pl-1">Aperçu (première page)</label>
+                                    <div className="px-5 py-4 bg-gray-50 rounded-2xl text-sm text-gray-600 font-medium max-h-48 overflow-y-auto whitespace-pre-line">
+                                        {selectedSubmission.preview}
+                                    </div>
+                                </div>
+                            )}
+
                             <div className="space-y-2">
                                 <label className="text-[10px] font-black text-gray-400 uppercase tracking-[0.2em] pl-1">Statut de la correction</label>
                                 <div className="grid grid-cols-3 gap-3">